@@ -0,0 +1,109 @@
+"""Cold start time of both front ends, from launching the interpreter to the first window being on screen.
+
+Run from the repository root with: python -m benchmarks.cold_start
+
+Every run is a fresh interpreter, so nothing is shared between runs apart from the operating system's file cache,
+which the first discarded run warms up. The first window time needs a display, the import time does not.
+"""
+import sys
+import time
+import statistics
+import subprocess
+
+
+RUNS = 10
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000, flush=True)
+"""
+
+# Reports as soon as the viewport has rendered its first frame, then closes the app
+DEARPYGUI_SCRIPT = """
+import dearpygui.dearpygui as dpg
+start_dearpygui = dpg.start_dearpygui
+
+def start_and_report():
+    def report():
+        print("window", flush=True)
+        dpg.stop_dearpygui()
+    dpg.set_frame_callback(1, report)
+    start_dearpygui()
+
+dpg.start_dearpygui = start_and_report
+import dearpygui_app
+dearpygui_app.MatrixApp().setup_app()
+"""
+
+# Reports once the root window is mapped, then closes the app
+TKINTER_SCRIPT = """
+import tkinter_app
+app = tkinter_app.App("BLE Matrix Streamer")
+
+def report(event):
+    if event.widget is app.root:
+        print("window", flush=True)
+        app.root.after(0, app.root.destroy)
+
+app.root.bind("<Map>", report)
+app.run()
+"""
+
+FRONT_ENDS = [("dearpygui_app", DEARPYGUI_SCRIPT), ("tkinter_app", TKINTER_SCRIPT)]
+
+
+def time_import(module):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], capture_output=True,
+                            text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def time_first_window(script):
+    # Milliseconds from starting the interpreter until the app reports its window, or None if it never does
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               text=True)
+    for line in process.stdout:
+        if line.strip() == "window":
+            elapsed = (time.perf_counter() - start) * 1000
+            process.wait()
+            return elapsed
+    process.wait()
+    return None
+
+
+def summarise(name, times):
+    if not times:
+        print("{:<26} {:>10}".format(name, "failed"))
+    else:
+        print("{:<26} {:>10.1f} {:>10.1f} {:>10.1f}".format(name, statistics.median(times), min(times), max(times)))
+
+
+def main():
+    interpreter_times = []
+    for run in range(RUNS + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        if run > 0:
+            interpreter_times.append((time.perf_counter() - start) * 1000)
+
+    print("{:<26} {:>10} {:>10} {:>10}".format("Cold start (ms)", "Median", "Min", "Max"))
+    summarise("interpreter", interpreter_times)
+    for module, script in FRONT_ENDS:
+        import_times = [time_import(module) for _ in range(RUNS + 1)][1:]
+        summarise(module + " import", import_times)
+        window_times = []
+        for run in range(RUNS + 1):
+            elapsed = time_first_window(script)
+            if elapsed is None:
+                window_times = []
+                break
+            if run > 0:
+                window_times.append(elapsed)
+        summarise(module + " first window", window_times)
+
+
+if __name__ == "__main__":
+    main()
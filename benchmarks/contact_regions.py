@@ -0,0 +1,63 @@
+"""Per-frame cost of contact region segmentation.
+
+Run from the repository root with: python -m benchmarks.contact_regions
+"""
+import time
+import numpy as np
+
+from contact_regions import ContactSegmenter
+
+
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64), (128, 128)]
+FRAMES = 300
+
+
+def create_stance_frames(rows, columns, count, rng):
+    # Two feet and two hands moving slowly, with speckle noise that creates small regions to discard
+    ys, xs = np.indices((rows, columns))
+    contacts = [(0.3, 0.7, 0.08, 0.2), (0.7, 0.7, 0.08, 0.2), (0.2, 0.2, 0.05, 0.05), (0.8, 0.2, 0.05, 0.05)]
+    frames = np.empty((count, rows, columns), dtype=np.uint8)
+    for i in range(count):
+        frame = np.zeros((rows, columns))
+        for centre_x, centre_y, width, height in contacts:
+            cx = (centre_x + 0.03 * np.sin(i / 20)) * columns
+            frame += 220 * np.exp(-(((xs - cx) / (width * columns)) ** 2
+                                    + ((ys - centre_y * rows) / (height * rows)) ** 2))
+        frame += 30 * (rng.random((rows, columns)) < 0.01)
+        frames[i] = np.clip(frame, 0, 255)
+    return frames
+
+
+def create_serpentine_frame(rows, columns):
+    # One region winding across the whole mat, the slowest case for label propagation
+    frame = np.zeros((rows, columns), dtype=np.uint8)
+    frame[::2, :] = 100
+    for row in range(1, rows, 2):
+        frame[row, columns - 1 if row % 4 == 1 else 0] = 100
+    return frame
+
+
+def time_segmenter(segmenter, frames):
+    segmenter.segment(frames[0])
+    start = time.perf_counter()
+    for frame in frames:
+        segmenter.segment(frame)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>12} {:>10} {:>10} {:>8}".format("Matrix", "Frames", "us/frame", "Max SPS", "Regions"))
+    for rows, columns in MATRIX_SIZES:
+        stance = create_stance_frames(rows, columns, FRAMES, rng)
+        serpentine = np.repeat(create_serpentine_frame(rows, columns)[None], 50, axis=0)
+        for name, frames in (("stance", stance), ("serpentine", serpentine)):
+            segmenter = ContactSegmenter(rows, columns)
+            frame_time = time_segmenter(segmenter, frames)
+            regions = len(segmenter.segment(frames[-1]))
+            print("{:>10} {:>12} {:>10.1f} {:>10.0f} {:>8}".format(
+                "{}x{}".format(rows, columns), name, 1e6 * frame_time, 1 / frame_time, regions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Frame assembler under loss, duplication and id wraparound at 1,000+ frames per second.
+
+Run from the repository root with: python -m benchmarks.frame_assembler
+
+Packets are fed in real time at the given frame rate. Every part carries the sequence number of the frame it was
+sent in, so a frame assembled from parts of two different frames that shared an 8 bit id shows up as corrupted.
+Corrupted must be 0 in every scenario. Long bursts of loss make the sender wrap its ids while older frames are
+still buffered, which is where reusing an id used to combine stale parts with new ones. Reordered packets arrive up
+to a few packets after their turn and late ones several frames after, so the latter expire their frame.
+
+Every scenario is checked as it runs and the script exits with 1 if any check fails, so it doubles as a regression
+test for the assembler.
+"""
+import sys
+import time
+import heapq
+import struct
+import numpy as np
+
+from ble_matrix import BLEFrameAssembler
+
+
+FRAME_RATES = [1000, 2000, 5000]  # frames per second
+DURATION = 1.0  # seconds per scenario and rate
+PARTS_PER_FRAME = 4
+PART_PAYLOAD_SIZE = 64
+SEQUENCE = struct.Struct("<I")
+
+REORDER_DELAY = (1, PARTS_PER_FRAME - 1)  # Range of packets a reordered packet arrives after its turn
+LATE_DELAY = (2 * PARTS_PER_FRAME, 8 * PARTS_PER_FRAME)  # Range of packets a late packet arrives after its turn
+
+# name: (part loss probability, duplicate probability, burst probability per frame, burst length in packets,
+#        reorder probability, late probability)
+SCENARIOS = {
+    "clean": (0.0, 0.0, 0.0, 0, 0.0, 0.0),
+    "5% loss": (0.05, 0.0, 0.0, 0, 0.0, 0.0),
+    "20% loss": (0.2, 0.0, 0.0, 0, 0.0, 0.0),
+    "5% duplicates": (0.0, 0.05, 0.0, 0, 0.0, 0.0),
+    "10% reordered": (0.0, 0.0, 0.0, 0, 0.1, 0.0),
+    "1% late": (0.0, 0.0, 0.0, 0, 0.0, 0.01),
+    "bursts over 256 ids": (0.02, 0.02, 0.002, 4 * 300, 0.0, 0.0),
+}
+
+
+def frame_packets(sequence, part_count, part_size):
+    frame_id = sequence % 256
+    return [bytes((frame_id, part_count, part_number)) + SEQUENCE.pack(sequence) + bytes(part_size - SEQUENCE.size)
+            for part_number in range(part_count)]
+
+
+def run(frame_rate, loss, duplicates, burst_probability, burst_length, reorder, late, rng):
+    assembler = BLEFrameAssembler()
+    interval = 1 / frame_rate
+    frames = int(DURATION * frame_rate)
+    corrupted = 0
+    packets = 0
+    sent_packets = 0
+    delayed = []  # (packet count it arrives after, order, packet)
+    burst_remaining = 0
+    processing_time = 0.0
+
+    def deliver(packet):
+        nonlocal packets, corrupted, processing_time
+        packets += 1
+        packet_start = time.perf_counter()
+        payload = assembler.construct_data(packet)
+        processing_time += time.perf_counter() - packet_start
+        if payload is not None:
+            parts = [payload[i:i + PART_PAYLOAD_SIZE] for i in range(0, len(payload), PART_PAYLOAD_SIZE)]
+            if len({SEQUENCE.unpack_from(part)[0] for part in parts}) != 1:
+                corrupted += 1
+
+    start = time.perf_counter()
+    for sequence in range(frames):
+        # Real time pacing, so the assembler's clock sees the actual frame rate
+        while time.perf_counter() < start + sequence * interval:
+            pass
+        if burst_remaining == 0 and rng.random() < burst_probability:
+            burst_remaining = burst_length
+        for packet in frame_packets(sequence, PARTS_PER_FRAME, PART_PAYLOAD_SIZE):
+            sent_packets += 1
+            while delayed and delayed[0][0] < sent_packets:
+                deliver(heapq.heappop(delayed)[2])
+            if burst_remaining > 0:
+                burst_remaining -= 1
+                continue
+            if rng.random() < loss:
+                continue
+            for _ in range(2 if rng.random() < duplicates else 1):
+                if rng.random() < reorder:
+                    heapq.heappush(delayed, (sent_packets + rng.integers(*REORDER_DELAY, endpoint=True),
+                                             sent_packets, packet))
+                elif rng.random() < late:
+                    heapq.heappush(delayed, (sent_packets + rng.integers(*LATE_DELAY, endpoint=True),
+                                             sent_packets, packet))
+                else:
+                    deliver(packet)
+    while delayed:
+        deliver(heapq.heappop(delayed)[2])
+    return assembler, frames, corrupted, 1e6 * processing_time / max(packets, 1)
+
+
+def check(name, assembler, frames, corrupted):
+    # Returns what is wrong with the outcome of a scenario, an empty list if nothing
+    failures = []
+    if corrupted:
+        failures.append("{} frames combined parts of different frames".format(corrupted))
+    if name in ("clean", "10% reordered") and assembler.completed_frames != frames:
+        failures.append("{} of {} frames completed".format(assembler.completed_frames, frames))
+    if name == "5% duplicates" and assembler.duplicate_parts == 0:
+        failures.append("no duplicates were detected")
+    if name == "1% late" and assembler.late_parts == 0:
+        failures.append("no late parts were detected")
+    return failures
+
+
+def main():
+    rng = np.random.default_rng(0)
+    failures = []
+    print("{:>6} {:<20} {:>7} {:>9} {:>9} {:>8} {:>8} {:>8} {:>7} {:>10} {:>6}".format(
+        "FPS", "Scenario", "Sent", "Complete", "Corrupt", "Expired", "Late", "Dupes", "Lost", "us/packet", "Check"))
+    for frame_rate in FRAME_RATES:
+        for name, scenario in SCENARIOS.items():
+            assembler, frames, corrupted, packet_time = run(frame_rate, *scenario, rng)
+            scenario_failures = check(name, assembler, frames, corrupted)
+            failures.extend("{} FPS {}: {}".format(frame_rate, name, failure) for failure in scenario_failures)
+            print("{:>6} {:<20} {:>7} {:>9} {:>9} {:>8} {:>8} {:>8} {:>7} {:>10.2f} {:>6}".format(
+                frame_rate, name, frames, assembler.completed_frames, corrupted, assembler.expired_frames,
+                assembler.late_parts, assembler.duplicate_parts, assembler.lost_frames, packet_time,
+                "FAIL" if scenario_failures else "ok"))
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
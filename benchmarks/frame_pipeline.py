@@ -0,0 +1,63 @@
+"""Per-stage timing of the frame pipeline against the simulated matrix, with an analysis stage added on top.
+
+Run from the repository root with: python -m benchmarks.frame_pipeline
+
+Contact region segmentation is added as an extra stage to stand in for a heavier analysis. It runs on the pipeline
+thread, so the notification callback time stays at assembly, decoding and handing over whatever the stages cost,
+and the delivered frame rate only falls once the stages together take longer than a frame interval.
+"""
+import time
+
+from ble_matrix import BLEConnection
+from contact_regions import ContactSegmenter
+from simulated_matrix import SimulatedMatrixClient, SIMULATED_ADDRESS, SIMULATED_FRAME_RATE
+
+
+DURATION = 3  # seconds per matrix size
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64)]
+
+
+def measure(rows, columns):
+    def client_class(address, disconnected_callback=None):
+        return SimulatedMatrixClient(address, disconnected_callback, rows=rows, columns=columns)
+    client_class.embeds_send_timestamps = True
+
+    connector = BLEConnection(SIMULATED_ADDRESS, temporal_filter="ema", client_class=client_class)
+    segmenter = ContactSegmenter(rows, columns)
+    connector.pipeline.add_stage("contact_regions", lambda matrix_values, _: segmenter.segment(matrix_values))
+    callback_times = []
+    handler = connector._notification_handler_callback
+
+    def timed_handler(sender, data):
+        start = time.perf_counter_ns()
+        handler(sender, data)
+        callback_times.append(time.perf_counter_ns() - start)
+    connector._notification_handler_callback = timed_handler
+
+    connector.start()
+    connector.matrix_dimensions_queue.get()
+    start = time.perf_counter()
+    frames = 0
+    while time.perf_counter() - start < DURATION:
+        connector.matrix_data_queue.get()
+        frames += 1
+    elapsed = time.perf_counter() - start
+    connector.stop()
+    # All notifications of a frame, most of which only store a part
+    callback_time = sum(callback_times) / max(connector.pipeline.processed_frames, 1) / 1e3
+    return frames / elapsed, connector.pipeline.get_stage_timing(), connector.get_frame_counts()["dropped"], callback_time
+
+
+def main():
+    print("Sending at {} frames per second".format(SIMULATED_FRAME_RATE))
+    for rows, columns in MATRIX_SIZES:
+        rate, stage_timing, dropped, callback_time = measure(rows, columns)
+        print("{}x{}: {:.1f} frames/s, {} dropped, notification callbacks {:.1f} us per frame".format(
+            rows, columns, rate, dropped, callback_time))
+        print("  {:<16} {:>8} {:>8} {:>8}".format("Stage (ms)", "p50", "p99", "max"))
+        for stage, (p50, p99, maximum) in stage_timing.items():
+            print("  {:<16} {:>8.3f} {:>8.3f} {:>8.3f}".format(stage, p50, p99, maximum))
+
+
+if __name__ == "__main__":
+    main()
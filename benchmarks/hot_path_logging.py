@@ -0,0 +1,78 @@
+"""Per-packet cost of reporting invalid packets from the frame assembler.
+
+Run from the repository root with: python -m benchmarks.hot_path_logging
+
+Feeds the assembler a stream of valid packets with a growing share of invalid ones, which it reports through the
+rate-limited log, and compares that with printing every report as the assembler used to. Printing goes to a file
+opened on os.devnull, so it shows the cost of the blocking write itself and is a lower bound for a terminal. With
+the rate-limited log an invalid packet should cost no more than a valid one.
+"""
+import io
+import os
+import time
+import contextlib
+
+import ble_matrix
+from ble_matrix import BLEFrameAssembler
+from rate_limited_log import RateLimitedLog
+
+
+PACKETS = 200000
+INVALID_SHARES = [0.0, 0.01, 0.1, 0.5]  # Fraction of the packets that are invalid
+PARTS_PER_FRAME = 4
+PART_PAYLOAD_SIZE = 64
+
+
+class PrintingLog:
+    # Reports every message straight away, as the assembler did before the rate-limited log
+    @staticmethod
+    def log(key, message, *arguments):
+        print(message.format(*arguments))
+
+
+def packets(invalid_share):
+    invalid_every = round(1 / invalid_share) if invalid_share else 0
+    sequence = 0
+    for index in range(PACKETS):
+        if invalid_every and index % invalid_every == 0:
+            # Part number out of range
+            yield bytes((sequence % 256, PARTS_PER_FRAME, PARTS_PER_FRAME)) + bytes(PART_PAYLOAD_SIZE)
+            continue
+        part_number = index % PARTS_PER_FRAME
+        yield bytes((sequence % 256, PARTS_PER_FRAME, part_number)) + bytes(PART_PAYLOAD_SIZE)
+        if part_number == PARTS_PER_FRAME - 1:
+            sequence += 1
+
+
+def run(log, invalid_share):
+    # Microseconds per packet
+    ble_matrix.hot_path_log = log
+    assembler = BLEFrameAssembler()
+    stream = list(packets(invalid_share))
+    start = time.perf_counter()
+    for packet in stream:
+        assembler.construct_data(packet)
+    return 1e6 * (time.perf_counter() - start) / PACKETS
+
+
+def main():
+    original_log = ble_matrix.hot_path_log
+    print("{:>9} {:>16} {:>16} {:>9} {:>9}".format("Invalid", "print us/packet", "log us/packet", "Reports",
+                                                  "Printed"))
+    with open(os.devnull, "w") as devnull:
+        for invalid_share in INVALID_SHARES:
+            with contextlib.redirect_stdout(devnull):
+                printing_time = run(PrintingLog(), invalid_share)
+            log = RateLimitedLog()
+            printed = io.StringIO()
+            with contextlib.redirect_stdout(printed):
+                logging_time = run(log, invalid_share)
+                log.flush()
+            print("{:>8.0f}% {:>16.3f} {:>16.3f} {:>9} {:>9}".format(
+                100 * invalid_share, printing_time, logging_time, sum(log.get_counts().values()),
+                printed.getvalue().count("\n")))
+    ble_matrix.hot_path_log = original_log
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Per frame CPU cost of a 255x255 matrix through the whole pipeline of both front ends, on one core.
+
+Run from the repository root with: python -m benchmarks.large_matrix
+
+Every stage runs on this one thread one after the other, so the frame rate printed is what a single core
+sustains with nothing overlapping. Assembly feeds the 255 notifications a 255x255 frame takes through the frame
+assembler. The dearpygui texture is set on a context without a viewport, and the Tk image is built without handing
+it to a PhotoImage, which needs a display, so neither includes the time the GPU or Tk take to draw. The larger
+sizes are walkways of 255x255 mats, where cells are pooled to fit the plot.
+"""
+import time
+import dearpygui.dearpygui as dpg
+
+from ble_matrix import BLEFrameAssembler, BLEConnection
+from dearpygui_app import MatrixApp, COLOUR_MAP_VALUES, GRID_SIZE
+from matrix import FrameImage
+from session_statistics import SessionStatistics
+from simulated_matrix import SimulatedMatrixClient, MAXIMUM_PARTS
+from temporal_filters import create_temporal_filter
+from texture_heatmap import TextureHeatmap
+from upsampling import get_block_pooler
+
+
+FRAMES = 60
+TARGET_FPS = 30
+MATRIX_SIZES = [(64, 64), (128, 128), (255, 255), (255, 510), (255, 1020)]
+
+
+def frame_packets(frame_id, payload):
+    part_size = max(241, -(-len(payload) // MAXIMUM_PARTS))
+    parts = [payload[start:start + part_size] for start in range(0, len(payload), part_size)]
+    return [bytes((frame_id, len(parts), part_number)) + part for part_number, part in enumerate(parts)]
+
+
+def time_stage(function, inputs):
+    function(inputs[0])
+    start = time.perf_counter()
+    for value in inputs:
+        function(value)
+    return (time.perf_counter() - start) / len(inputs)
+
+
+def measure(rows, columns):
+    client = SimulatedMatrixClient(None, rows=rows, columns=columns)
+    frames = [client._pressure_frame(index / 10) for index in range(FRAMES)]
+    packets = [frame_packets(index % 256, frame.tobytes()) for index, frame in enumerate(frames)]
+
+    assembler = BLEFrameAssembler()
+    connector = BLEConnection(None)
+    connector._rows, connector._columns = rows, columns
+    statistics = SessionStatistics(rows, columns)
+    temporal_filter = create_temporal_filter("ema", rows, columns)
+    app = MatrixApp()
+    app._precompute_cop_matrix(rows, columns)
+
+    downsampler = get_block_pooler(rows, columns, GRID_SIZE)
+    texture_heatmap = TextureHeatmap(rows, columns, COLOUR_MAP_VALUES, downsampler=downsampler)
+    with dpg.texture_registry():
+        texture = dpg.add_raw_texture(texture_heatmap.width, texture_heatmap.height,
+                                      default_value=texture_heatmap.buffer, format=dpg.mvFormat_Float_rgba)
+    width = GRID_SIZE if columns > rows else round(GRID_SIZE * columns / rows)
+    height = round(GRID_SIZE * rows / columns) if columns > rows else GRID_SIZE
+    frame_image = FrameImage(rows, columns, height, width)
+
+    def assemble(frame_packets_):
+        for packet in frame_packets_:
+            assembler.construct_data(packet)
+    payloads = [frame.tobytes() for frame in frames]
+    return {
+        "assembly": time_stage(assemble, packets),
+        "decode": time_stage(connector._decode_matrix_data, payloads),
+        "statistics": time_stage(lambda frame: statistics.update(frame, 0), frames),
+        "temporal filter": time_stage(temporal_filter.apply, frames),
+        "CoP": time_stage(app._compute_cop, frames),
+        "dearpygui texture": time_stage(lambda frame: dpg.set_value(texture, texture_heatmap.render(frame)), frames),
+        "Tk image": time_stage(frame_image.colour, frames),
+    }
+
+
+def main():
+    dpg.create_context()
+    shared = ("assembly", "decode", "statistics", "temporal filter", "CoP")
+    for rows, columns in MATRIX_SIZES:
+        stages = measure(rows, columns)
+        print("{}x{}".format(rows, columns))
+        for stage, seconds in stages.items():
+            print("  {:<20} {:>9.0f} us".format(stage, 1e6 * seconds))
+        for front_end in ("dearpygui texture", "Tk image"):
+            total = sum(stages[stage] for stage in shared) + stages[front_end]
+            print("  {:<20} {:>9.0f} us  {:>6.0f} FPS  {}".format(
+                front_end.split()[0] + " total", 1e6 * total, 1 / total,
+                "ok" if 1 / total >= TARGET_FPS else "below {} FPS".format(TARGET_FPS)))
+    dpg.destroy_context()
+
+
+if __name__ == "__main__":
+    main()
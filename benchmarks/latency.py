@@ -0,0 +1,54 @@
+"""End to end latency against the simulated matrix, up to the point the GUI would pick the frame up.
+
+Run from the repository root with: python -m benchmarks.latency
+
+The consumer polls the frame queue at a fixed rate like the GUI does, then stamps the rendering and presentation
+timestamps straight away, so those two stages read zero here and what is left is the radio-free pipeline from
+sending to dequeueing. The GUI itself adds the rendering and presentation stages on top.
+"""
+import time
+
+from ble_matrix import BLEConnection
+from latency import LatencyTracker, LATENCY_STAGES
+from simulated_matrix import SimulatedMatrixClient, SIMULATED_ADDRESS
+
+
+DURATION = 5  # seconds per matrix size
+POLL_RATE = 60  # Frame queue polls per second, as a 60 Hz GUI does
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64)]
+
+
+def measure(rows, columns):
+    def client_class(address, disconnected_callback=None):
+        return SimulatedMatrixClient(address, disconnected_callback, rows=rows, columns=columns)
+    client_class.embeds_send_timestamps = True
+
+    connector = BLEConnection(SIMULATED_ADDRESS, client_class=client_class)
+    tracker = LatencyTracker()
+    connector.start()
+    connector.matrix_dimensions_queue.get()
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        time.sleep(1 / POLL_RATE)
+        frames = []
+        while not connector.matrix_data_queue.empty():
+            frames.append(connector.matrix_data_queue.get_nowait())
+        now = time.perf_counter_ns()
+        for frame in frames:
+            tracker.add_frame(frame.sent_ns, frame.first_part_ns, frame.completed_ns, frame.queued_ns, now, now, now)
+    connector.stop()
+    return tracker.get_statistics()
+
+
+def main():
+    for rows, columns in MATRIX_SIZES:
+        statistics = measure(rows, columns)
+        print("{}x{}".format(rows, columns))
+        print("  {:<14} {:>8} {:>8} {:>8} {:>8}".format("Stage (ms)", "p50", "p90", "p99", "max"))
+        for stage in list(LATENCY_STAGES) + ["total"]:
+            if stage in statistics:
+                print("  {:<14} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f}".format(stage, *statistics[stage]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Effective frame rate under packet loss, dropping incomplete frames against returning them partially filled.
+
+Run from the repository root with: python -m benchmarks.partial_frames
+
+The simulated matrix drops every notification with the given probability. Without partial frames a frame needs
+all of its parts, so the more parts a frame is split into the faster the delivered rate falls with loss. With
+them every frame that got at least one part through is delivered, its missing cells holding their last values.
+Completeness is the mean fraction of cells received in the frames delivered.
+"""
+import time
+
+from ble_matrix import BLEConnection
+from simulated_matrix import SimulatedMatrixClient, SIMULATED_ADDRESS, SIMULATED_FRAME_RATE
+
+
+DURATION = 3  # seconds per measurement
+PACKET_LOSSES = [0.0, 0.05, 0.1, 0.2]
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64)]  # 2, 5 and 17 notifications per frame
+
+
+def measure(rows, columns, packet_loss, partial_frames):
+    def client_class(address, disconnected_callback=None):
+        return SimulatedMatrixClient(address, disconnected_callback, rows=rows, columns=columns,
+                                     packet_loss=packet_loss)
+    client_class.embeds_send_timestamps = True
+
+    connector = BLEConnection(SIMULATED_ADDRESS, client_class=client_class, partial_frames=partial_frames)
+    connector.start()
+    connector.matrix_dimensions_queue.get()
+    # Skip the first frames so connecting is not counted
+    time.sleep(0.2)
+    while not connector.matrix_data_queue.empty():
+        connector.matrix_data_queue.get_nowait()
+    start = time.perf_counter()
+    frames = 0
+    received_cells = 0.0
+    while time.perf_counter() - start < DURATION:
+        frame = connector.matrix_data_queue.get()
+        frames += 1
+        received_cells += 1.0 if frame.mask is None else frame.mask.mean()
+    elapsed = time.perf_counter() - start
+    connector.stop()
+    return frames / elapsed, received_cells / max(frames, 1)
+
+
+def main():
+    print("Sending at {} frames per second".format(SIMULATED_FRAME_RATE))
+    print("{:>8} {:>6} {:>13} {:>13} {:>13}".format("Size", "Loss", "Drop SPS", "Partial SPS", "Completeness"))
+    for rows, columns in MATRIX_SIZES:
+        for packet_loss in PACKET_LOSSES:
+            drop_rate, _ = measure(rows, columns, packet_loss, False)
+            partial_rate, completeness = measure(rows, columns, packet_loss, True)
+            print("{:>8} {:>5.0f}% {:>13.1f} {:>13.1f} {:>12.1f}%".format(
+                "{}x{}".format(rows, columns), 100 * packet_loss, drop_rate, partial_rate, 100 * completeness))
+
+
+if __name__ == "__main__":
+    main()
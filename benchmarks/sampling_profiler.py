@@ -0,0 +1,73 @@
+"""Overhead of the sampling profiler on a streaming connection and what it attributes to each thread.
+
+Run from the repository root with: python -m benchmarks.sampling_profiler
+
+Streams the simulated matrix for a while without the profiler and then with it, timing the frame assembly and
+decoding loop on the main thread both times, so the difference is what sampling every thread costs the app. The
+profile itself is saved under ./profiles and its summary printed at the end.
+"""
+import os
+import time
+
+from ble_matrix import BLEConnection, BLEFrameAssembler
+from sampling_profiler import SamplingProfiler, profile_directory, PROFILE_SAMPLE_INTERVAL
+from simulated_matrix import SimulatedMatrixClient, SIMULATED_ADDRESS
+
+
+DURATION = 5  # seconds per run
+ROWS = 64
+COLUMNS = 64
+FRAME_RATE = 200  # frames per second
+PARTS_PER_FRAME = 4
+PART_PAYLOAD_SIZE = 64
+
+
+def busy_work(duration):
+    # Packets assembled per second on this thread, as a stand-in for the GUI thread's work
+    assembler = BLEFrameAssembler()
+    packets = [bytes((frame_id, PARTS_PER_FRAME, part_number)) + bytes(PART_PAYLOAD_SIZE)
+               for frame_id in range(256) for part_number in range(PARTS_PER_FRAME)]
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for packet in packets:
+            assembler.construct_data(packet)
+        count += len(packets)
+    return count / duration
+
+
+def run(profile):
+    def client_class(address, disconnected_callback=None):
+        return SimulatedMatrixClient(address, disconnected_callback, rows=ROWS, columns=COLUMNS,
+                                     frame_rate=FRAME_RATE)
+    client_class.embeds_send_timestamps = True
+
+    connector = BLEConnection(SIMULATED_ADDRESS, client_class=client_class)
+    connector.start()
+    connector.matrix_dimensions_queue.get()
+    profiler = None
+    if profile:
+        profiler = SamplingProfiler(profile_directory(), DURATION)
+        profiler.start()
+    packet_rate = busy_work(DURATION)
+    if profiler is not None:
+        profiler.stop()
+    connector.stop()
+    return packet_rate, profiler
+
+
+def main():
+    baseline, _ = run(False)
+    profiled, profiler = run(True)
+    print("{:<22} {:>14}".format("Run", "packets/s"))
+    print("{:<22} {:>14.0f}".format("Without profiler", baseline))
+    print("{:<22} {:>14.0f}".format("With profiler", profiled))
+    print("Slowdown {:.1f}% sampling every {:.0f} ms".format(100 * (1 - profiled / baseline),
+                                                             1000 * PROFILE_SAMPLE_INTERVAL))
+    print()
+    with open(os.path.join(profiler.directory, "summary.txt")) as summary_file:
+        print(summary_file.read())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Synthetic advertisement flood through BLEScanner.
+
+Run from the repository root with: python -m benchmarks.scanner_flood
+"""
+import time
+import random
+from types import SimpleNamespace
+
+from ble_matrix import BLEScanner, MATRIX_SERVICE_UUID, TABLE_REFRESH_RATE
+
+
+NUMBER_OF_DEVICES = 1000
+ADVERTISEMENTS_PER_DEVICE = 50
+ADVERTISING_PERIOD = 0.1  # seconds between advertisements from one device
+
+
+def create_advertisements():
+    advertisements = []
+    for i in range(NUMBER_OF_DEVICES):
+        device = SimpleNamespace(address="AA:BB:CC:{:02X}:{:02X}:{:02X}".format(i >> 16, (i >> 8) & 0xFF, i & 0xFF))
+        has_service = i % 50 == 0
+        for j in range(ADVERTISEMENTS_PER_DEVICE):
+            # Every other packet is a scan response carrying the name and, for matrices, the service UUID
+            scan_response = j % 2 == 1
+            adv_data = SimpleNamespace(
+                local_name="Device {}".format(i) if scan_response else None,
+                rssi=random.randint(-100, -40),
+                service_uuids=[MATRIX_SERVICE_UUID] if has_service and scan_response else [])
+            advertisements.append((j * ADVERTISING_PERIOD + random.random() * ADVERTISING_PERIOD, device, adv_data))
+    advertisements.sort(key=lambda advertisement: advertisement[0])
+    return advertisements
+
+
+def main():
+    counts = {"add": 0, "update": 0, "delete": 0}
+
+    def add(*args):
+        counts["add"] += 1
+
+    def update(*args):
+        counts["update"] += 1
+
+    def delete(*args):
+        counts["delete"] += 1
+
+    scanner = BLEScanner(add, update, delete)
+    advertisements = create_advertisements()
+
+    ingest_time = 0
+    flush_time = 0
+    flushes = 0
+    base_time = time.time()
+    next_flush = 1 / TABLE_REFRESH_RATE
+    for arrival, device, adv_data in advertisements:
+        start = time.perf_counter()
+        scanner._device_found_cb(device, adv_data)
+        ingest_time += time.perf_counter() - start
+        if arrival >= next_flush:
+            start = time.perf_counter()
+            scanner.flush_updates(base_time + arrival)
+            flush_time += time.perf_counter() - start
+            flushes += 1
+            next_flush += 1 / TABLE_REFRESH_RATE
+
+    # Jump past the timeout so every device expires through the heap
+    start = time.perf_counter()
+    scanner.flush_updates(base_time + 3600)
+    expiry_time = time.perf_counter() - start
+
+    gui_calls = counts["add"] + counts["update"]
+    print("Devices:                {}".format(NUMBER_OF_DEVICES))
+    print("Advertisements:         {}".format(len(advertisements)))
+    print("Ingest cost:            {:.2f} us/advertisement".format(1e6 * ingest_time / len(advertisements)))
+    print("Flushes:                {} ({:.3f} ms each)".format(flushes, 1e3 * flush_time / max(flushes, 1)))
+    print("Table calls:            {} add, {} update ({:.4f} per advertisement)"
+          .format(counts["add"], counts["update"], gui_calls / len(advertisements)))
+    print("Expiry of all devices:  {} deletes in {:.3f} ms".format(counts["delete"], 1e3 * expiry_time))
+    scanner.stop()
+
+
+if __name__ == "__main__":
+    main()
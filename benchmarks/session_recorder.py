@@ -0,0 +1,75 @@
+"""Write throughput and file size of SessionRecorder on synthetic pressure frames.
+
+Run from the repository root with: python -m benchmarks.session_recorder
+"""
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from session_recorder import SessionRecorder, CHUNK_FRAMES
+
+
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64)]
+FRAMES = 20 * CHUNK_FRAMES
+SAMPLES_PER_SECOND = 100  # Used to extrapolate the file size per hour
+
+
+def create_frames(rows, columns, count, rng):
+    # Two feet-sized blobs swaying over the mat plus sensor noise, which compresses like a real session
+    # (uniform random frames would not compress at all)
+    ys, xs = np.indices((rows, columns))
+    frames = np.empty((count, rows, columns), dtype=np.uint8)
+    for i in range(count):
+        sway = np.sin(i / 50)
+        frame = np.zeros((rows, columns))
+        for centre_x in (0.3, 0.7):
+            cx = (centre_x + 0.05 * sway) * columns
+            cy = (0.5 + 0.1 * sway) * rows
+            frame += 200 * np.exp(-(((xs - cx) / (columns / 10)) ** 2 + ((ys - cy) / (rows / 5)) ** 2))
+        frame += rng.normal(0, 2, size=frame.shape)
+        # Unloaded cells read zero after taring
+        frame[frame < 4] = 0
+        frames[i] = np.clip(frame, 0, 255)
+    return frames
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print("{:>8} {:>14} {:>16} {:>12} {:>10} {:>16}".format(
+        "Matrix", "add_frame us", "Written frames/s", "Bytes/frame", "Ratio", "MB/hour @ {} SPS".format(
+            SAMPLES_PER_SECOND)))
+    for rows, columns in MATRIX_SIZES:
+        frames = create_frames(rows, columns, 2 * CHUNK_FRAMES, rng)
+        directory = os.path.join(tempfile.mkdtemp(), "session")
+        recorder = SessionRecorder(directory, rows, columns)
+        # The recorder drops frames rather than blocking, so frames are fed at the writer's pace to measure its
+        # sustained throughput
+        add_time = 0
+        start = time.perf_counter()
+        for i in range(FRAMES):
+            add_start = time.perf_counter()
+            recorder.add_frame(frames[i % len(frames)], time.perf_counter_ns())
+            add_time += time.perf_counter() - add_start
+            while recorder._free_buffers.empty() and recorder._frames is None:
+                time.sleep(0.001)
+        recorder.close()
+        total_time = time.perf_counter() - start
+        size = directory_size(directory)
+        bytes_per_frame = size / recorder.recorded_frames
+        print("{:>8} {:>14.2f} {:>16.0f} {:>12.1f} {:>9.1f}x {:>16.1f}".format(
+            "{}x{}".format(rows, columns), 1e6 * add_time / FRAMES, recorder.recorded_frames / total_time,
+            bytes_per_frame, (rows * columns + 8) / bytes_per_frame,
+            bytes_per_frame * SAMPLES_PER_SECOND * 3600 / 1e6))
+        if recorder.dropped_frames:
+            print("         {} frames dropped".format(recorder.dropped_frames))
+        shutil.rmtree(os.path.dirname(directory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Per-frame cost of the running session statistics update.
+
+Run from the repository root with: python -m benchmarks.session_statistics
+"""
+import time
+import numpy as np
+
+from session_statistics import SessionStatistics
+
+
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64), (128, 128), (255, 255)]
+FRAMES = 1000
+FRAME_INTERVAL_NS = 10_000_000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>10} {:>10} {:>14}".format("Matrix", "us/frame", "Max SPS", "get_map us"))
+    for rows, columns in MATRIX_SIZES:
+        frames = rng.integers(0, 256, size=(100, rows, columns), dtype=np.uint8)
+        statistics = SessionStatistics(rows, columns)
+        start = time.perf_counter()
+        for i in range(FRAMES):
+            statistics.update(frames[i % len(frames)], i * FRAME_INTERVAL_NS)
+        frame_time = (time.perf_counter() - start) / FRAMES
+
+        start = time.perf_counter()
+        for _ in range(100):
+            statistics.get_map("peak")
+        map_time = (time.perf_counter() - start) / 100
+        print("{:>10} {:>10.1f} {:>10.0f} {:>14.1f}".format(
+            "{}x{}".format(rows, columns), 1e6 * frame_time, 1 / frame_time, 1e6 * map_time))
+
+
+if __name__ == "__main__":
+    main()
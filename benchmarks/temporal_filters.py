@@ -0,0 +1,34 @@
+"""Per-frame cost of the temporal filter stage across matrix sizes.
+
+Run from the repository root with: python -m benchmarks.temporal_filters
+"""
+import time
+import numpy as np
+
+from temporal_filters import create_temporal_filter, TEMPORAL_FILTERS
+
+
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64), (128, 128), (255, 255)]
+FRAMES = 500
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>16} {:>10} {:>10}".format("Matrix", "Filter", "us/frame", "Max SPS"))
+    for rows, columns in MATRIX_SIZES:
+        frames = rng.integers(0, 256, size=(FRAMES, rows, columns), dtype=np.uint8)
+        for kind in TEMPORAL_FILTERS:
+            temporal_filter = create_temporal_filter(kind, rows, columns)
+            # Fill the windows first so the steady state cost is measured
+            for frame in frames[:10]:
+                temporal_filter.apply(frame)
+            start = time.perf_counter()
+            for frame in frames:
+                temporal_filter.apply(frame)
+            frame_time = (time.perf_counter() - start) / FRAMES
+            print("{:>10} {:>16} {:>10.1f} {:>10.0f}".format(
+                "{}x{}".format(rows, columns), kind, 1e6 * frame_time, 1 / frame_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""CPU cost per frame of the texture heatmap path against the heat series path.
+
+Run from the repository root with: python -m benchmarks.texture_heatmap
+
+Both paths hand their data to a dearpygui context without a viewport, so this measures the work done on the
+GUI thread per frame, not the GPU. On top of this the heat series is re-triangulated cell by cell when drawn,
+whereas the texture is drawn as a single quad. The texture path has a roughly fixed cost from copying the
+texture, so it only wins on the CPU side for large matrices, while the draw saving applies at every size.
+"""
+import time
+import numpy as np
+import dearpygui.dearpygui as dpg
+
+from dearpygui_app import COLOUR_MAP_VALUES
+from texture_heatmap import TextureHeatmap
+
+
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64), (128, 128), (255, 255)]
+FRAMES = 60
+
+
+def time_frames(render, frames):
+    render(frames[0])
+    start = time.perf_counter()
+    for frame in frames:
+        render(frame)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    dpg.create_context()
+    print("{:>10} {:>18} {:>18} {:>10}".format("Matrix", "Heat series us", "Texture us", "Speed-up"))
+    for rows, columns in MATRIX_SIZES:
+        frames = rng.integers(0, 256, size=(FRAMES, rows, columns), dtype=np.uint8)
+        texture_heatmap = TextureHeatmap(rows, columns, COLOUR_MAP_VALUES)
+        with dpg.texture_registry():
+            texture = dpg.add_raw_texture(texture_heatmap.width, texture_heatmap.height,
+                                          default_value=texture_heatmap.buffer, format=dpg.mvFormat_Float_rgba)
+        with dpg.window():
+            with dpg.plot():
+                dpg.add_plot_axis(dpg.mvXAxis)
+                with dpg.plot_axis(dpg.mvYAxis):
+                    heat_series = dpg.add_heat_series([0] * rows * columns, rows, columns, scale_min=0,
+                                                      scale_max=255)
+                    dpg.add_image_series(texture, [0, 0], [1, 1])
+
+        heat_series_time = time_frames(
+            lambda frame: dpg.set_value(heat_series, [frame.flatten().tolist()]), frames)
+        texture_time = time_frames(
+            lambda frame: dpg.set_value(texture, texture_heatmap.render(frame)), frames)
+        print("{:>10} {:>18.1f} {:>18.1f} {:>9.1f}x".format(
+            "{}x{}".format(rows, columns), 1e6 * heat_series_time, 1e6 * texture_time,
+            heat_series_time / texture_time))
+    dpg.destroy_context()
+
+
+if __name__ == "__main__":
+    main()
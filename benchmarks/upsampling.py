@@ -0,0 +1,44 @@
+"""Per-frame cost of the upsampling display stage.
+
+Run from the repository root with: python -m benchmarks.upsampling
+"""
+import time
+import numpy as np
+
+from upsampling import get_upsampler, fit_output_size, UPSAMPLING_METHODS
+
+
+MATRIX_SIZES = [(16, 16), (32, 32), (64, 64), (16, 48)]
+OUTPUT_SIZES = [100, 250, 500]
+FRAME_RATES = [30, 60, 120, 200]
+FRAMES = 300
+
+
+def time_upsampler(upsampler, frames):
+    upsampler.upsample(frames[0])  # warm up
+    start = time.perf_counter()
+    for frame in frames:
+        upsampler.upsample(frame)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print("{:>8} {:>10} {:>9} {:>12} {:>9}  {}".format(
+        "Matrix", "Output", "Method", "us/frame", "Max FPS", " ".join("{:>6}".format(f) for f in FRAME_RATES)))
+    for rows, columns in MATRIX_SIZES:
+        frames = rng.integers(0, 256, size=(FRAMES, rows, columns), dtype=np.uint8)
+        for resolution in OUTPUT_SIZES:
+            output_rows, output_columns = fit_output_size(rows, columns, resolution)
+            for method in UPSAMPLING_METHODS:
+                upsampler = get_upsampler(rows, columns, output_rows, output_columns, method)
+                frame_time = time_upsampler(upsampler, frames)
+                # Share of each frame budget spent upsampling at the listed display rates
+                budgets = " ".join("{:>5.1f}%".format(100 * frame_time * rate) for rate in FRAME_RATES)
+                print("{:>8} {:>10} {:>9} {:>12.1f} {:>9.0f}  {}".format(
+                    "{}x{}".format(rows, columns), "{}x{}".format(output_rows, output_columns), method,
+                    1e6 * frame_time, 1 / frame_time, budgets))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Cost of composing walkway frames from several mats, and what composing allocates.
+
+Run from the repository root with: python -m benchmarks.virtual_matrix
+
+Time per composed frame should grow with the total number of cells and not otherwise with the number of mats,
+and tracemalloc should see no memory held or peaking above a few bytes per frame, the views and buffers all being
+created up front. VirtualMatrixConnection copies every composed frame out for its consumers on top of this.
+"""
+import time
+import tracemalloc
+import numpy as np
+
+from virtual_matrix import VirtualMatrix, MatPlacement, ROTATIONS
+
+
+ITERATIONS = 2000
+MAT_SHAPE = (32, 64)
+MAT_COUNTS = [1, 2, 4, 8]
+
+
+def walkway(mat_count, rows, columns):
+    # Mats end to end along a line, alternately turned round, as they would be laid on a walkway
+    placements = [MatPlacement(str(index), 0, index * columns, ROTATIONS[2 * (index % 2)])
+                  for index in range(mat_count)]
+    return VirtualMatrix(placements, [(rows, columns)] * mat_count)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    rows, columns = MAT_SHAPE
+    print("{:>5} {:>10} {:>12} {:>12} {:>14}".format("Mats", "Cells", "us/frame", "ns/cell", "Peak bytes"))
+    for mat_count in MAT_COUNTS:
+        virtual_matrix = walkway(mat_count, rows, columns)
+        frames = rng.integers(0, 256, (mat_count, rows, columns))
+        for index in range(mat_count):
+            for slot in range(8):
+                virtual_matrix.add_frame(index, frames[index], slot * 10_000_000 + index)
+        timestamps = [int(rng.integers(0, 80_000_000)) for _ in range(ITERATIONS)]
+
+        virtual_matrix.compose(timestamps[0])
+        tracemalloc.start()
+        start = time.perf_counter()
+        for timestamp_ns in timestamps:
+            virtual_matrix.compose(timestamp_ns)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        cells = virtual_matrix.rows * virtual_matrix.columns
+        print("{:>5} {:>10} {:>12.1f} {:>12.2f} {:>14}".format(
+            mat_count, cells, 1e6 * elapsed / ITERATIONS, 1e9 * elapsed / ITERATIONS / cells, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,14 @@ from bleak import BleakScanner
 from bleak import BleakClient
 import threading
 import struct
+import time
+import json
+import sys
+
+
+WATCH_REFRESH_INTERVAL = 1.0  # seconds between redraws of the table while watching several characteristics
+WATCH_VALUE_WIDTH = 48  # Characters of the last value shown in the watch table
+EXPORT_CONCURRENCY = 4  # Reads in flight at once while exporting the GATT table
 
 
 '''
@@ -35,6 +43,101 @@ async def notify(bleak_client, characteristic_uuid):
     print("Unsubscribed from characteristic")
 
 
+class CharacteristicWatch:
+    # Notifications of one characteristic in a watch session, decoded only when the table is drawn
+    def __init__(self, characteristic_uuid, decoding_mode, unpacking_options=None):
+        self.characteristic_uuid = characteristic_uuid
+        self.decoding_mode = decoding_mode
+        self.unpacking_options = unpacking_options
+        self.notifications = 0
+        self.bytes = 0
+        self.last_value = None
+        self._notifications_at_last_refresh = 0
+        self._bytes_at_last_refresh = 0
+
+    def notification_handler(self, sender, data):
+        self.notifications += 1
+        self.bytes += len(data)
+        self.last_value = data
+
+    def take_rates(self, period):
+        # Notifications and bytes per second since the last call
+        notification_rate = (self.notifications - self._notifications_at_last_refresh) / period
+        byte_rate = (self.bytes - self._bytes_at_last_refresh) / period
+        self._notifications_at_last_refresh = self.notifications
+        self._bytes_at_last_refresh = self.bytes
+        return notification_rate, byte_rate
+
+    def decoded_last_value(self):
+        if self.last_value is None:
+            return ""
+        # Decoded without decode_data() printing or prompting, which would break the table being drawn over
+        try:
+            if self.decoding_mode == "custom":
+                value = strip_tuple(struct.unpack(self.unpacking_options, self.last_value))
+            else:
+                value = str(decode_data(self.last_value, self.decoding_mode))
+        except (struct.error, UnicodeDecodeError) as e:
+            value = "{} ({})".format(bytes(self.last_value).hex(), e)
+        if len(value) > WATCH_VALUE_WIDTH:
+            value = value[:WATCH_VALUE_WIDTH - 3] + "..."
+        return value
+
+
+async def watch(bleak_client, characteristic_uuids):
+    # Subscribes to every characteristic at once and redraws a table of their rates and last values until enter
+    watches = []
+    for characteristic_uuid in characteristic_uuids:
+        print("Characteristic {}".format(characteristic_uuid))
+        decoding_mode = input("Decode Type ( none / utf-8 / uint8_t / uint16_t / custom ) : ")
+        unpacking_options = None
+        if decoding_mode == "custom":
+            unpacking_options = input("Set parameters to be used with struct.unpack(): ")
+        watches.append(CharacteristicWatch(characteristic_uuid, decoding_mode, unpacking_options))
+
+    for characteristic_watch in watches:
+        await bleak_client.start_notify(characteristic_watch.characteristic_uuid,
+                                        characteristic_watch.notification_handler)
+    print("Watching {} characteristics. Press enter to stop...".format(len(watches)))
+    refresh_task = asyncio.create_task(refresh_watch_table(watches))
+    await nonblocking_wait_for_input()
+    refresh_task.cancel()
+    try:
+        # Raises whatever stopped the table early
+        await refresh_task
+    except asyncio.CancelledError:
+        pass
+    for characteristic_watch in watches:
+        await bleak_client.stop_notify(characteristic_watch.characteristic_uuid)
+    print("Unsubscribed from {} characteristics".format(len(watches)))
+
+
+async def refresh_watch_table(watches):
+    # Lines of the table drawn last, so a terminal can draw the next one over it
+    drawn_lines = 0
+    last_refresh = time.perf_counter()
+    while True:
+        await asyncio.sleep(WATCH_REFRESH_INTERVAL)
+        now = time.perf_counter()
+        period = now - last_refresh
+        last_refresh = now
+        lines = ["-{:-^40}-{:-^12}-{:-^12}-{:-^{width}}-".format("", "", "", "", width=WATCH_VALUE_WIDTH + 2),
+                 "|{:^40}|{:^12}|{:^12}|{:^{width}}|".format("UUID", "Notify/s", "Bytes/s", "Last Value",
+                                                             width=WATCH_VALUE_WIDTH + 2),
+                 "-{:-^40}-{:-^12}-{:-^12}-{:-^{width}}-".format("", "", "", "", width=WATCH_VALUE_WIDTH + 2)]
+        for characteristic_watch in watches:
+            notification_rate, byte_rate = characteristic_watch.take_rates(period)
+            lines.append("|{:^40}|{:^12.1f}|{:^12.1f}|{:^{width}}|".format(
+                characteristic_watch.characteristic_uuid, notification_rate, byte_rate,
+                characteristic_watch.decoded_last_value(), width=WATCH_VALUE_WIDTH + 2))
+        lines.append(lines[0])
+        if drawn_lines and sys.stdout.isatty():
+            # Move back up to the first line of the previous table
+            print("\033[{}F".format(drawn_lines), end="")
+        print("\n".join(lines))
+        drawn_lines = len(lines)
+
+
 async def write(bleak_client, characteristic_uuid):
     byte_string = input("Input byte string of structure 0xXX, 0xXX, ... , 0xXX : ")
     byte_strings = [b.strip() for b in byte_string.split(",")]
@@ -56,7 +159,20 @@ async def write(bleak_client, characteristic_uuid):
 def get_characteristic_access_choice(characteristic_info):
     characteristic_uuid = None
     access_type = None
-    characteristic_choice = input("Access Characteristic Number: ")
+    characteristic_choice = input("Access Characteristic Number (several separated by commas to watch them): ")
+    if "," in characteristic_choice:
+        # A watch session over several notifying characteristics
+        characteristic_numbers = [number.strip() for number in characteristic_choice.split(",")]
+        if not all(number.isnumeric() and int(number) < len(characteristic_info) for number in characteristic_numbers):
+            return None, None
+        characteristic_uuids = []
+        for number in characteristic_numbers:
+            characteristic_uuid, access_types = characteristic_info[int(number)]
+            if "notify" not in access_types and "indicate" not in access_types:
+                print("Characteristic {} cannot notify".format(number))
+                return None, None
+            characteristic_uuids.append(characteristic_uuid)
+        return "watch", characteristic_uuids
     if characteristic_choice.isnumeric():
         characteristic_number = int(characteristic_choice)
         characteristic_uuid = characteristic_info[characteristic_number][0]
@@ -161,6 +277,9 @@ async def connect(device_address, characteristic_info):
             elif access_type == "notify" or access_type == "indicate":
                 await notify(bleak_client, characteristic_uuid)
 
+            elif access_type == "watch":
+                await watch(bleak_client, characteristic_uuid)
+
             elif access_type == "write":
                 await write(bleak_client, characteristic_uuid)
             else:
@@ -200,6 +319,102 @@ async def device_scanner():
         exit("Error: {}".format(e))
 
 
+def display_value(value):
+    # Text if the value reads as text, its bytes otherwise
+    stripped = str(value).replace("bytearray", "").replace("(", "").replace(")", "")
+    if "\\x" in str(value):
+        return stripped
+    elif stripped.isascii():
+        return value.decode('utf-8')
+    return value
+
+
+async def read_gatt_values(bleak_client, concurrency=None):
+    # {handle: value or exception} of every readable characteristic and every descriptor, read concurrency at a
+    # time with asyncio.gather, or one after the other if concurrency is None
+    reads = []
+    for service in bleak_client.services:
+        for char in service.characteristics:
+            if "read" in char.properties:
+                reads.append((char.handle, bleak_client.read_gatt_char, char))
+            for descriptor in char.descriptors:
+                reads.append((descriptor.handle, bleak_client.read_gatt_descriptor, descriptor.handle))
+
+    if concurrency is None:
+        values = {}
+        for handle, read_function, target in reads:
+            try:
+                values[handle] = await read_function(target)
+            except Exception as e:
+                values[handle] = e
+        return values
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited_read(read_function, target):
+        async with semaphore:
+            return await read_function(target)
+
+    results = await asyncio.gather(*(limited_read(read_function, target) for _, read_function, target in reads),
+                                   return_exceptions=True)
+    return {handle: result for (handle, _, _), result in zip(reads, results)}
+
+
+def value_entry(value):
+    # JSON fields of a read value, or of why it could not be read
+    if isinstance(value, Exception):
+        return {"error": str(value)}
+    return {"raw": bytes(value).hex(), "decoded": display_value(value)}
+
+
+def gatt_tree(bleak_client, values):
+    services = []
+    for service in bleak_client.services:
+        characteristics = []
+        for char in service.characteristics:
+            descriptors = []
+            for descriptor in char.descriptors:
+                descriptor_entry = {"uuid": descriptor.uuid, "handle": descriptor.handle,
+                                    "description": descriptor.description}
+                descriptor_entry.update(value_entry(values[descriptor.handle]))
+                descriptors.append(descriptor_entry)
+            characteristic_entry = {"uuid": char.uuid, "handle": char.handle, "description": char.description,
+                                    "properties": list(char.properties), "descriptors": descriptors}
+            if char.handle in values:
+                characteristic_entry.update(value_entry(values[char.handle]))
+            characteristics.append(characteristic_entry)
+        services.append({"uuid": service.uuid, "handle": service.handle, "description": service.description,
+                         "characteristics": characteristics})
+    return services
+
+
+async def export_gatt_table(device_address, path, concurrency=EXPORT_CONCURRENCY):
+    # Writes every service, characteristic and descriptor with their values to a JSON file, and times reading the
+    # values concurrently against reading them one at a time
+    bleak_client = BleakClient(device_address)
+    print("Connecting to device...")
+    try:
+        await bleak_client.connect()
+        print("Connected to device")
+        start = time.perf_counter()
+        values = await read_gatt_values(bleak_client, concurrency)
+        concurrent_time = time.perf_counter() - start
+        start = time.perf_counter()
+        await read_gatt_values(bleak_client)
+        sequential_time = time.perf_counter() - start
+        services = gatt_tree(bleak_client, values)
+        await disconnect(bleak_client)
+    except Exception as e:
+        print("Connection terminated on BLE Device")
+        exit("Error: {}".format(e))
+
+    with open(path, "w") as export_file:
+        json.dump({"address": device_address, "services": services}, export_file, indent=2)
+    print("Exported {} services and {} values to {}".format(len(services), len(values), path))
+    print("Reading values took {:.3f} s, {} at a time, against {:.3f} s one at a time".format(
+        concurrent_time, concurrency, sequential_time))
+
+
 async def find_characteristics(device_address):
     bleak_client = BleakClient(device_address)
     print("Connecting to device...")
@@ -221,13 +436,7 @@ async def find_characteristics(device_address):
                 value = ""
                 if "read" in char.properties:
                     try:
-                        value = await bleak_client.read_gatt_char(char.uuid)
-                        stripped = (str(value).replace("bytearray", "")
-                                              .replace("(", "").replace(")", ""))
-                        if "\\x" in str(value):
-                            value = stripped
-                        elif stripped.isascii():
-                            value = value.decode('utf-8')
+                        value = display_value(await bleak_client.read_gatt_char(char.uuid))
                     except Exception as e:
                         value = "Read failed: {}".format(e)
                 characteristic_info.append((char.uuid, char.properties))
@@ -252,6 +461,9 @@ if __name__ == "__main__":
         if len(devices) > selected_device >= 0:
             address = devices[selected_device][1]
             characteristics = asyncio.run(find_characteristics(address))
+            export_path = input("Export GATT table to JSON file ( file path / enter to skip ) : ")
+            if export_path:
+                asyncio.run(export_gatt_table(address, export_path))
             access = input("Interact with device? ( y / n ) : ")
             if access == "y":
                 asyncio.run(connect(address, characteristics))
@@ -0,0 +1,667 @@
+import time
+import heapq
+import struct
+import asyncio
+import threading
+import numpy as np
+from queue import Queue
+from collections import deque
+
+from frame_timing import FrameTimingAnalyzer
+from frame_pipeline import FramePipeline
+from session_statistics import SessionStatistics
+from session_recorder import SessionRecorder
+from temporal_filters import create_temporal_filter
+from simulated_matrix import read_send_timestamp
+from rate_limited_log import hot_path_log
+
+# bleak is imported where it is first used, so importing this module does not wait for it
+
+
+# noinspection SpellCheckingInspection
+BASE_UUID = "4A98XXXX-E7C1-EFDE-C757-F1267DD021E8"
+MATRIX_SERVICE_UUID = BASE_UUID.replace("XXXX", "1623").lower()
+MATRIX_DIMENSIONS_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1624").lower()
+MATRIX_DATA_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1625").lower()
+MATRIX_TARE_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1626").lower()
+TIMEOUT_SECONDS = 20  # How long to wait until removing a last seen device
+TABLE_REFRESH_RATE = 10  # Maximum number of device table updates per second
+RECONNECT_INITIAL_DELAY = 0.5  # seconds before the first reconnect attempt, doubled after every failed attempt
+RECONNECT_MAXIMUM_DELAY = 8.0  # seconds, upper bound of the backoff
+RECONNECT_ATTEMPTS = 10  # Failed attempts in a row before giving up on the device
+RSSI_HISTORY_LENGTH = 10  # Number of RSSI readings kept per scanned device
+ASSEMBLY_WINDOW = 16  # Most recent frame ids that can be assembled at once, must stay below half the 256 id range
+ASSEMBLY_RESYNC_FRAMES = 64  # Frame intervals without packets after which frame ids are no longer ordered
+
+
+class MatrixFrame:
+    def __init__(self, data, first_part_ns, completed_ns, sent_ns=None, mask=None):
+        self.data = data
+        # Boolean array of the cells received in this frame, the others hold their last known values. None when
+        # every cell was received.
+        self.mask = mask
+        self.first_part_ns = first_part_ns  # time.perf_counter_ns() when the first part of the frame arrived
+        self.completed_ns = completed_ns  # time.perf_counter_ns() when the last missing part arrived
+        self.sent_ns = sent_ns  # Sender's time.perf_counter_ns(), only known for a simulated matrix
+        self.queued_ns = None  # time.perf_counter_ns() when the frame was handed to the GUI
+
+
+class BLEFrameAssembler:
+    """Reassembles frames from notifications of frame id, part count, part number and payload.
+
+    Frame ids are 8 bit and wrap, so they are ordered relative to the newest id started: less than half the id
+    range ahead of it is newer, anything else is older. Only the ASSEMBLY_WINDOW ids up to the newest one can hold
+    parts, and after a silence long enough for the sender to get through half the id range nothing is trusted, so
+    a buffered frame is always evicted before its id can come round again and parts of two frames sharing an id
+    are never combined. Notifications arrive in order, so completing a frame evicts every older incomplete one,
+    and parts of frames already completed or evicted are rejected as late, repeated parts as duplicates.
+
+    With partial_frames, an incomplete frame is returned as soon as a newer frame starts instead of being dropped,
+    with its missing parts filled from the last frame that had them. last_frame_missing_ranges then holds the byte
+    ranges that were filled in. A frame missing a part that has never been received is still dropped.
+    """
+    def __init__(self, timeout=1, partial_frames=False):
+        self.frames = {}  # frame_id -> list of parts
+        self.expected_parts = {}  # frame_id -> total_parts
+        self.timestamps = {}  # frame_id -> perf_counter_ns of the first part
+        self.timeout = timeout  # seconds
+        self._timeout_ns = int(timeout * 1e9)
+        self._received_parts = {}  # frame_id -> number of distinct parts received
+        self._newest_id = None  # Newest frame id started, the reference the others are ordered against
+        self._newest_started_ns = None
+        self._frame_interval_ns = None  # Smoothed time between consecutive frame ids
+        self._last_packet_ns = None
+        # Arrival times of the first and last part of the most recently completed frame
+        self.last_frame_first_part_ns = None
+        self.last_frame_completed_ns = None
+        self._last_frame_id = None
+        self.partial_frames = partial_frames
+        self._last_parts = None  # Last known payload of every part, None for parts never received
+        # (start, end) byte ranges of the most recently returned frame that hold last known values
+        self.last_frame_missing_ranges = ()
+
+        # Running counts, kept across reset()
+        self.completed_frames = 0
+        self.partial_frames_returned = 0  # Incomplete frames returned with their missing parts filled in
+        self.lost_frames = 0  # Frame ids skipped between consecutive completed frames
+        self.expired_frames = 0  # Frames with some parts received that were never completed
+        self.invalid_packets = 0
+        self.late_parts = 0  # Parts of frames already completed or evicted
+        self.duplicate_parts = 0
+
+    def construct_data(self, data: bytes):
+        now = time.perf_counter_ns()
+
+        if len(data) < 3:
+            hot_path_log.log("invalid_packet", "Invalid packet: too short")
+            self.invalid_packets += 1
+            return None
+
+        frame_id = data[0]
+        total_parts = data[1]
+        part_number = data[2]
+        payload = data[3:]
+        # Ignore invalid part numbers
+        if part_number >= total_parts:
+            hot_path_log.log("invalid_part_number", "Invalid part number {} for frame {}", part_number, frame_id)
+            self.invalid_packets += 1
+            return None
+
+        if self._last_packet_ns is not None and now - self._last_packet_ns > self._resync_silence_ns():
+            self._expire_all()
+        self._last_packet_ns = now
+
+        partial_payload = None
+        parts = self.frames.get(frame_id)
+        if parts is None:
+            if not self._start_frame(frame_id, total_parts, now):
+                self.late_parts += 1
+                return None
+            parts = self.frames[frame_id]
+            if self.partial_frames:
+                partial_payload = self._fill_partial_frame(frame_id)
+        elif self.expected_parts[frame_id] != total_parts:
+            self.invalid_packets += 1
+            return None
+
+        if parts[part_number] is not None:
+            self.duplicate_parts += 1
+            return None
+        parts[part_number] = payload
+        self._received_parts[frame_id] += 1
+        if self._received_parts[frame_id] < total_parts:
+            return partial_payload  # Not yet complete
+
+        full_payload = b''.join(parts)
+        self.completed_frames += 1
+        self._return_frame(frame_id, parts, (), now)
+        # Whatever is still buffered and older than this frame has lost parts that are never coming
+        for fid in [fid for fid in self.frames if 0 < (frame_id - fid) % 256 < 128]:
+            self._remove_frame(fid)
+            self.expired_frames += 1
+        return full_payload
+
+    def _return_frame(self, frame_id, parts, missing_ranges, now):
+        self.last_frame_first_part_ns = self.timestamps[frame_id]
+        self.last_frame_completed_ns = now
+        self.last_frame_missing_ranges = missing_ranges
+        self._last_parts = parts
+        if self._last_frame_id is not None:
+            self.lost_frames += (frame_id - self._last_frame_id - 1) % 256
+        self._last_frame_id = frame_id
+        self._remove_frame(frame_id)
+
+    def _fill_partial_frame(self, frame_id):
+        # Called when frame_id has just started: the newest older frame will not receive any more parts, so it is
+        # returned with the gaps filled in, and anything older than it is evicted
+        older = [fid for fid in self.frames if 0 < (frame_id - fid) % 256 < 128]
+        if not older:
+            return None
+        partial_id = min(older, key=lambda fid: (frame_id - fid) % 256)
+        for fid in older:
+            if fid != partial_id:
+                self._remove_frame(fid)
+                self.expired_frames += 1
+        parts = self.frames[partial_id]
+        last_parts = self._last_parts
+        if last_parts is None or len(last_parts) != len(parts):
+            last_parts = [None] * len(parts)
+        filled_parts = [last_part if part is None else part for part, last_part in zip(parts, last_parts)]
+        if None in filled_parts:
+            # Some part has never been received, so its length is not even known. What did arrive is kept for
+            # filling in later frames.
+            self._last_parts = filled_parts
+            self._remove_frame(partial_id)
+            self.expired_frames += 1
+            return None
+        missing_ranges = []
+        start = 0
+        for part, filled_part in zip(parts, filled_parts):
+            if part is None:
+                missing_ranges.append((start, start + len(filled_part)))
+            start += len(filled_part)
+        self.partial_frames_returned += 1
+        self._return_frame(partial_id, filled_parts, tuple(missing_ranges), self.timestamps[frame_id])
+        return b''.join(filled_parts)
+
+    def _resync_silence_ns(self):
+        # Gap between packets after which the ids are no longer trusted to be in order with the buffered ones
+        if self._frame_interval_ns is None:
+            return self._timeout_ns
+        return min(self._timeout_ns, ASSEMBLY_RESYNC_FRAMES * self._frame_interval_ns)
+
+    def _start_frame(self, frame_id, total_parts, now):
+        # Returns False for a part of a frame that was already completed or evicted
+        if self._newest_id is not None:
+            ahead = (frame_id - self._newest_id) % 256
+            if ahead == 0 or ahead >= 128:
+                if (self._newest_id - frame_id) % 256 < ASSEMBLY_WINDOW:
+                    return False
+                # Too far behind to be a late part, so the sender has moved on by more than half the id range
+                self._expire_all()
+            else:
+                interval = (now - self._newest_started_ns) / ahead
+                self._frame_interval_ns = interval if self._frame_interval_ns is None else \
+                    0.9 * self._frame_interval_ns + 0.1 * interval
+        self._newest_id = frame_id
+        self._newest_started_ns = now
+
+        # Ids that fall out of the window, and frames that ran out of time
+        for fid in list(self.frames):
+            if (frame_id - fid) % 256 >= ASSEMBLY_WINDOW or now - self.timestamps[fid] > self._timeout_ns:
+                hot_path_log.log("frame_expired", "Frame {} expired. Cleaning up.", fid)
+                self._remove_frame(fid)
+                self.expired_frames += 1
+
+        self.frames[frame_id] = [None] * total_parts
+        self.expected_parts[frame_id] = total_parts
+        self.timestamps[frame_id] = now
+        self._received_parts[frame_id] = 0
+        return True
+
+    def _expire_all(self):
+        self.expired_frames += len(self.frames)
+        for fid in list(self.frames):
+            self._remove_frame(fid)
+        self._newest_id = None
+        self._last_frame_id = None
+
+    def _remove_frame(self, frame_id):
+        del self.frames[frame_id]
+        del self.expected_parts[frame_id]
+        del self.timestamps[frame_id]
+        del self._received_parts[frame_id]
+
+    def reset(self):
+        # Drops the partially received frames, e.g. after the link was lost, keeping the running counts
+        self._expire_all()
+        self._last_packet_ns = None
+        self._frame_interval_ns = None
+
+
+class ScannedDevice:
+    def __init__(self, address, name, has_service, last_seen):
+        self.address = address
+        self.name = name
+        self.has_service = has_service
+        self.last_seen = last_seen
+        self.rssi_history = deque(maxlen=RSSI_HISTORY_LENGTH)
+        # What the device table currently shows for this device, None until its row has been added
+        self.shown_name = None
+        self.shown_service = None
+
+
+class BLEScanner:
+    def __init__(self, add_new_device_callback, update_device_callback, delete_device_callback,
+                 refresh_rate=TABLE_REFRESH_RATE, service_uuids=None):
+        self._new_device_cb = add_new_device_callback
+        self._update_device_cb = update_device_callback
+        self._delete_device_cb = delete_device_callback
+        # Passed to the adapter so advertisements from other devices are dropped before reaching Python
+        self._service_uuids = service_uuids
+
+        self.devices = {}  # address -> ScannedDevice
+        self._dirty_addresses = set()  # addresses with changes not yet flushed to the table
+        self._expiry_heap = []  # (deadline, address), at most one entry per device
+        self._flush_interval = 1 / refresh_rate
+        self._last_flush = 0
+
+        self._lock = threading.Lock()
+        self._loop = None  # Created on the scanning thread
+        self._stop_event = threading.Event()
+
+        self._discover_devices_thread = threading.Thread(target=self._run_loop, daemon=True)
+
+    def __del__(self):
+        if not self._stop_event.is_set():
+            self.stop()
+        print("Successfully Exited BLEScanner Threads")
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._scanner())
+
+    async def _scanner(self):
+        from bleak import BleakScanner
+        async with BleakScanner(detection_callback=self._device_found_cb, service_uuids=self._service_uuids,
+                                return_adv=True):
+            while not self._stop_event.is_set():
+                await asyncio.sleep(0.1)
+                continue
+
+    def _device_found_cb(self, device, adv_data):
+        # Runs on the bleak thread: only merge the advertisement into the device record, the table is
+        # updated from the GUI thread by flush_updates()
+        time_stamp = time.time()
+        has_service = MATRIX_SERVICE_UUID in adv_data.service_uuids
+        with self._lock:
+            record = self.devices.get(device.address)
+            if record is None:
+                record = ScannedDevice(device.address, adv_data.local_name or "Unknown", has_service, time_stamp)
+                record.rssi_history.append(adv_data.rssi)
+                self.devices[device.address] = record
+                heapq.heappush(self._expiry_heap, (time_stamp + TIMEOUT_SECONDS, device.address))
+                self._dirty_addresses.add(device.address)
+                return
+            record.last_seen = time_stamp
+            record.rssi_history.append(adv_data.rssi)
+            # Scan responses can add the name or the service UUID to an already known device
+            if record.name == "Unknown" and adv_data.local_name:
+                record.name = adv_data.local_name
+                self._dirty_addresses.add(device.address)
+            if has_service and not record.has_service:
+                record.has_service = True
+                self._dirty_addresses.add(device.address)
+
+    def _expire_stale_devices(self, now):
+        # Must be called with self._lock held. Deadlines are only refreshed lazily when they reach the top
+        # of the heap, so a device that is still advertising costs one push per TIMEOUT_SECONDS.
+        removed = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, address = heapq.heappop(self._expiry_heap)
+            record = self.devices.get(address)
+            if record is None:
+                continue
+            deadline = record.last_seen + TIMEOUT_SECONDS
+            if deadline > now:
+                heapq.heappush(self._expiry_heap, (deadline, address))
+            else:
+                del self.devices[address]
+                self._dirty_addresses.discard(address)
+                if record.shown_name is not None:
+                    removed.append(address)
+        return removed
+
+    def flush_updates(self, now=None):
+        """Apply the changes gathered since the last flush to the device table. Call from the GUI thread;
+        calls made faster than the refresh rate return without doing anything."""
+        if now is None:
+            now = time.time()
+        if now - self._last_flush < self._flush_interval:
+            return
+        self._last_flush = now
+
+        added = []
+        updated = []
+        with self._lock:
+            removed = self._expire_stale_devices(now)
+            for address in self._dirty_addresses:
+                record = self.devices[address]
+                if record.shown_name is None:
+                    added.append((address, record.name, str(record.has_service)))
+                else:
+                    if record.name != record.shown_name:
+                        updated.append((address, "name", record.name))
+                    if record.has_service != record.shown_service:
+                        updated.append((address, "service", str(record.has_service)))
+                record.shown_name = record.name
+                record.shown_service = record.has_service
+            self._dirty_addresses.clear()
+
+        # Table callbacks run outside the lock so the bleak thread is never held up by the GUI
+        for address in removed:
+            self._delete_device_cb(address)
+        for address, name, has_service in added:
+            self._new_device_cb(address, name, has_service)
+        for address, update_parameter, update_data in updated:
+            self._update_device_cb(address, update_parameter, update_data)
+
+    def start(self):
+        self._discover_devices_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._discover_devices_thread.is_alive():
+            self._discover_devices_thread.join()
+
+    def get_devices(self):
+        with self._lock:
+            return {address: (record.name, record.has_service, record.last_seen, list(record.rssi_history))
+                    for address, record in self.devices.items()}
+
+
+# Connection states
+CONNECTING = "Connecting"
+STREAMING = "Streaming"
+RECONNECTING = "Reconnecting"
+DISCONNECTED = "Disconnected"
+
+
+class BLEConnection:
+    """Streams matrix frames from one device on its own event loop thread.
+
+    If the link drops after the first connection it is re-established with exponential backoff, reusing the
+    address and the matrix dimensions already read, so the queues, filter, statistics and recording carry on and
+    the display can stay up. The time from the link dropping to the next complete frame is kept as the recovery
+    time of every reconnect.
+
+    With partial_frames, frames missing parts are still queued once the next frame starts, the missing cells
+    holding their last known values and the frame's mask marking the cells that were received.
+
+    The notification callback only assembles, decodes and records frames. Statistics, the temporal filter and any
+    stage added to self.pipeline run on the pipeline's worker thread, and frames reach matrix_data_queue from there.
+    """
+    def __init__(self, address, temporal_filter=None, client_class=None, partial_frames=False):
+        # client_class stands in for BleakClient, e.g. a simulated matrix
+        self._client_class = client_class
+        self._embeds_send_timestamps = getattr(client_class, "embeds_send_timestamps", False)
+        self.matrix_dimensions_queue = Queue()
+        self.matrix_data_queue = Queue()
+
+        self._dimensions_characteristic = MATRIX_DIMENSIONS_CHARACTERISTIC_UUID
+        self._data_stream_characteristic = MATRIX_DATA_CHARACTERISTIC_UUID
+        self._tare_characteristic = MATRIX_TARE_CHARACTERISTIC_UUID
+        self._address = address
+
+        self._rows = None
+        self._columns = None
+        self._data_assembler = BLEFrameAssembler(partial_frames=partial_frames)
+        self._temporal_filter_kind = temporal_filter
+        self._temporal_filter = None
+        self._temporal_filter_reset = False  # Set on reconnecting, the filter is reset on the pipeline thread
+        self._recorder = None
+        self.session_statistics = None
+
+        self._data_rate_start_time = 0
+        self._assembled_data_count = 0
+        self._data_rate = 0
+        self.frame_timing = FrameTimingAnalyzer()
+        self.pipeline = FramePipeline()
+        self.pipeline.add_stage("statistics", self._update_statistics)
+        self.pipeline.add_stage("temporal_filter", self._apply_temporal_filter)
+        self.pipeline.subscribe("temporal_filter", self._queue_frame)
+
+        self._client = None
+        self._state = CONNECTING
+        self._reconnect_attempt = 0
+        self._disconnected_ns = None  # When the link dropped, until the first frame after reconnecting
+        self._recovery_times = []  # Seconds from each disconnect to the first frame after it
+
+        self._loop = asyncio.new_event_loop()
+        self._stop_event = threading.Event()
+        self.mutex = threading.Lock()
+
+        self._connection_thread = threading.Thread(target=self._run_loop, daemon=True)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._ble_connect_stream())
+
+    async def _ble_connect_stream(self):
+        while not self._stop_event.is_set():
+            try:
+                await self._stream()
+            except Exception as e:
+                print("Connection Failed. Error: {}".format(e))
+            if self._stop_event.is_set():
+                break
+            if self._rows is None:
+                # Never got as far as streaming, so there is nothing to keep alive
+                with self.mutex:
+                    self.matrix_dimensions_queue.put((None, None))
+                break
+            if self._disconnected_ns is None:
+                self._disconnected_ns = time.perf_counter_ns()
+            self._reconnect_attempt += 1
+            if self._reconnect_attempt > RECONNECT_ATTEMPTS:
+                print("Giving up on {} after {} reconnect attempts".format(self._address, RECONNECT_ATTEMPTS))
+                break
+            self._set_state(RECONNECTING)
+            delay = min(RECONNECT_INITIAL_DELAY * 2 ** (self._reconnect_attempt - 1), RECONNECT_MAXIMUM_DELAY)
+            deadline = time.perf_counter() + delay
+            while not self._stop_event.is_set() and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+        self._set_state(DISCONNECTED)
+        self._detach_recorder()
+
+    async def _stream(self):
+        client_class = self._client_class
+        if client_class is None:
+            from bleak import BleakClient
+            client_class = BleakClient
+        async with client_class(self._address, disconnected_callback=self._disconnected_callback) as self._client:
+            if self._rows is None:
+                self._rows, self._columns = await self._get_matrix_dimensions()
+                self._temporal_filter = create_temporal_filter(self._temporal_filter_kind, self._rows, self._columns)
+                self.session_statistics = SessionStatistics(self._rows, self._columns)
+                self.matrix_dimensions_queue.put((self._rows, self._columns))
+            else:
+                # Same device, so the dimensions already read still hold. Parts of the frame that was in flight
+                # when the link dropped will never be completed, and the filter should not blend across the gap.
+                self._data_assembler.reset()
+                self._temporal_filter_reset = True
+            self._data_rate_start_time = time.perf_counter()
+            await self._client.start_notify(self._data_stream_characteristic, self._notification_handler_callback)
+            self._set_state(STREAMING)
+
+            while not self._stop_event.is_set() and self._client.is_connected:
+                await asyncio.sleep(0.1)
+
+            if self._stop_event.is_set() and self._client.is_connected:
+                await self._client.stop_notify(MATRIX_DATA_CHARACTERISTIC_UUID)
+                await self._client.disconnect()
+
+    # noinspection PyUnusedLocal
+    def _disconnected_callback(self, client):
+        if not self._stop_event.is_set() and self._disconnected_ns is None:
+            self._disconnected_ns = time.perf_counter_ns()
+
+    def _set_state(self, state):
+        with self.mutex:
+            self._state = state
+
+    async def _get_matrix_dimensions(self):
+        byte_array = await self._client.read_gatt_char(self._dimensions_characteristic)
+        rows, columns = struct.unpack('<BB', byte_array)
+        return rows, columns
+
+    def send_tare_command(self):
+        asyncio.run(self._send_tare_command())
+
+    async def _send_tare_command(self):
+        if self._client is not None and self._client.is_connected:
+            # Command: 0x01 = tare
+            data = bytearray([0x01])
+            await self._client.write_gatt_char(self._tare_characteristic, data, response=False)
+            print("Tare command sent")
+        else:
+            print("Device is not connected")
+
+    def _decode_matrix_data(self, byte_array):
+        # A read-only uint8 view of the payload, no per-cell work even for a 255x255 matrix
+        return np.frombuffer(byte_array, dtype=np.uint8, count=self._rows * self._columns).reshape(self._rows,
+                                                                                                   self._columns)
+
+    def _completeness_mask(self, missing_ranges):
+        mask = np.ones(self._rows * self._columns, dtype=bool)
+        for start, end in missing_ranges:
+            mask[start:end] = False
+        return mask.reshape(self._rows, self._columns)
+
+    def set_partial_frames(self, enabled):
+        # Called from the GUI thread, the assembler reads the flag when the next frame starts
+        self._data_assembler.partial_frames = enabled
+
+    def set_temporal_filter(self, kind):
+        # Called from the GUI thread, the notification callback picks up the new filter on its next frame
+        self._temporal_filter_kind = kind
+        if self._rows is not None:
+            self._temporal_filter = create_temporal_filter(kind, self._rows, self._columns)
+
+    def start_recording(self, directory):
+        if self._rows is None or self._recorder is not None:
+            return False
+        self._recorder = SessionRecorder(directory, self._rows, self._columns)
+        return True
+
+    def stop_recording(self):
+        # The recorder is detached on the loop thread so it never closes in the middle of a notification
+        self._loop.call_soon_threadsafe(self._detach_recorder)
+
+    def _detach_recorder(self):
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            # Closing waits for the last chunk to be compressed, which must not hold up the notifications. Not a
+            # daemon like the loop thread it is started from, so exiting the program still waits for the last chunk.
+            threading.Thread(target=recorder.close, daemon=False).start()
+            print("Recording saved to {}".format(recorder.directory))
+
+    # noinspection PyUnusedLocal
+    def _notification_handler_callback(self, sender, data):
+        assembled_data = self._data_assembler.construct_data(data)
+        if assembled_data is not None:
+            matrix_values = self._decode_matrix_data(assembled_data)
+            recorder = self._recorder
+            if recorder is not None:
+                recorder.add_frame(matrix_values, self._data_assembler.last_frame_completed_ns)
+            missing_ranges = self._data_assembler.last_frame_missing_ranges
+            mask = self._completeness_mask(missing_ranges) if missing_ranges else None
+            sent_ns = None
+            # A first part filled in from an earlier frame carries that frame's send time
+            if self._embeds_send_timestamps and (not missing_ranges or missing_ranges[0][0] > 0):
+                sent_ns = read_send_timestamp(assembled_data)
+            frame = MatrixFrame(matrix_values, self._data_assembler.last_frame_first_part_ns,
+                                self._data_assembler.last_frame_completed_ns, sent_ns, mask)
+            if self._disconnected_ns is not None:
+                self._record_recovery(frame.completed_ns)
+            self.pipeline.submit(matrix_values, frame.completed_ns, frame)
+            self.frame_timing.add_frame(frame.first_part_ns, frame.completed_ns)
+
+            self._calculate_data_rate()
+
+    # The pipeline stages and subscriber below run on the pipeline thread
+    def _update_statistics(self, matrix_values, timestamp_ns):
+        self.session_statistics.update(matrix_values, timestamp_ns)
+
+    def _apply_temporal_filter(self, matrix_values, timestamp_ns):
+        temporal_filter = self._temporal_filter
+        if temporal_filter is None:
+            return matrix_values
+        if self._temporal_filter_reset:
+            # Not blending across the gap of a reconnect
+            self._temporal_filter_reset = False
+            temporal_filter.reset()
+        # The filter reuses its output buffer, so queue a copy
+        return temporal_filter.apply(matrix_values).copy()
+
+    def _queue_frame(self, stage_result):
+        frame = stage_result.frame
+        # If the filter failed the frame goes out unfiltered, it still holds the decoded values
+        if stage_result.error is None:
+            frame.data = stage_result.result
+        with self.mutex:
+            frame.queued_ns = time.perf_counter_ns()
+            self.matrix_data_queue.put(frame)
+
+    def _record_recovery(self, first_frame_ns):
+        recovery_time = (first_frame_ns - self._disconnected_ns) / 1e9
+        self._disconnected_ns = None
+        with self.mutex:
+            self._reconnect_attempt = 0
+            self._recovery_times.append(recovery_time)
+        print("Reconnected to {}, first frame after {:.2f} s".format(self._address, recovery_time))
+
+    def _calculate_data_rate(self):
+        self._assembled_data_count += 1
+        data_rate_time_difference = time.perf_counter() - self._data_rate_start_time
+        if data_rate_time_difference > 1:
+            with self.mutex:
+                self._data_rate = self._assembled_data_count / data_rate_time_difference
+            self._data_rate_start_time = time.perf_counter()
+            self._assembled_data_count = 0
+
+    def get_frame_counts(self):
+        # Read from another thread, each count is a single int so at worst one frame out of date
+        assembler = self._data_assembler
+        return {"completed": assembler.completed_frames, "lost": assembler.lost_frames,
+                "expired": assembler.expired_frames, "invalid": assembler.invalid_packets,
+                "partial": assembler.partial_frames_returned, "dropped": self.pipeline.dropped_frames}
+
+    def get_data_rate(self):
+        with self.mutex:
+            return self._data_rate
+
+    def get_connection_status(self):
+        # False once the connection has been given up on, it stays True while reconnecting
+        with self.mutex:
+            return self._state != DISCONNECTED
+
+    def get_state(self):
+        with self.mutex:
+            return self._state, self._reconnect_attempt
+
+    def get_recovery_times(self):
+        with self.mutex:
+            return list(self._recovery_times)
+
+    def start(self):
+        self.pipeline.start()
+        self._connection_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._connection_thread.join()
+        self.pipeline.stop()
+        print("Successfully exited BLEConnection thread")
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+CONTACT_THRESHOLD = 10  # Cells at or below this value are treated as unloaded
+MINIMUM_REGION_AREA = 2  # Smaller regions are treated as noise
+MAXIMUM_TRACKING_DISTANCE = 5.0  # Cells a region's CoP may move between frames and keep its id
+
+
+class ContactRegion:
+    def __init__(self, region_id, label, area, peak, load, cop_x, cop_y):
+        self.region_id = region_id  # Stable across frames when tracking is enabled
+        self.label = label  # Value of the region's cells in ContactSegmenter.labels for this frame
+        self.area = area  # cells
+        self.peak = peak
+        self.load = load  # Sum of the region's cell values
+        self.cop_x = cop_x  # Column coordinate, in cells
+        self.cop_y = cop_y  # Row coordinate, in cells
+
+
+class ContactSegmenter:
+    """Splits each frame into connected contact regions (feet, hands) with their area, peak, load and CoP.
+
+    Connected components are found with vectorised min-label propagation: every loaded cell starts labelled
+    with its own flat index, takes the smallest label among its neighbours, then jumps to its label's label.
+    The jump halves the remaining distance, so a region of diameter d settles in about log2(d) passes rather
+    than d, each pass being a handful of whole-frame numpy operations.
+    """
+    def __init__(self, rows, columns, threshold=CONTACT_THRESHOLD, minimum_area=MINIMUM_REGION_AREA,
+                 connectivity=8, track=True, maximum_tracking_distance=MAXIMUM_TRACKING_DISTANCE):
+        self._rows = rows
+        self._columns = columns
+        self._threshold = threshold
+        self._minimum_area = minimum_area
+        self._connectivity = connectivity
+        self._track = track
+        self._maximum_tracking_distance = maximum_tracking_distance
+
+        # Labels live in a frame padded by one cell so neighbours never need bounds checks. A label is the flat
+        # index of a cell in this padded array, and the extra trailing element is the background label, which
+        # points at itself so it can be followed like any other label.
+        padded_size = (rows + 2) * (columns + 2)
+        self._background = padded_size
+        self._padded = np.full(padded_size + 1, self._background, dtype=np.int64)
+        self._padded_labels = self._padded[:-1].reshape(rows + 2, columns + 2)
+        self._inner = self._padded_labels[1:-1, 1:-1]
+        self._padded_indices = (np.arange(rows)[:, None] + 1) * (columns + 2) + np.arange(columns) + 1
+        self._neighbour_minimum = np.empty((rows, columns), dtype=np.int64)
+        self._mask = np.empty((rows, columns), dtype=bool)
+
+        self._ys, self._xs = np.indices((rows, columns))
+        self.labels = np.zeros((rows, columns), dtype=np.int32)  # 0 for background, otherwise region label
+
+        self._previous_regions = []
+        self._next_region_id = 0
+
+    def _propagate_labels(self):
+        inner = self._inner
+        padded_labels = self._padded_labels
+        neighbour_minimum = self._neighbour_minimum
+        r, c = self._rows, self._columns
+        if self._connectivity == 8:
+            offsets = [(0, 1), (1, 0), (1, 2), (2, 1), (0, 0), (0, 2), (2, 0), (2, 2)]
+        else:
+            offsets = [(0, 1), (1, 0), (1, 2), (2, 1)]
+        while True:
+            np.copyto(neighbour_minimum, inner)
+            for dy, dx in offsets:
+                np.minimum(neighbour_minimum, padded_labels[dy:dy + r, dx:dx + c], out=neighbour_minimum)
+            # Background cells keep the background label whatever their neighbours are
+            neighbour_minimum[~self._mask] = self._background
+            # Pointer jump: a label is the index of a cell in the same region, whose own label is no larger
+            jumped = self._padded[neighbour_minimum]
+            if np.array_equal(jumped, inner):
+                return
+            np.copyto(inner, jumped)
+
+    def segment(self, frame):
+        frame = np.asarray(frame)
+        np.greater(frame, self._threshold, out=self._mask)
+        np.copyto(self._inner, np.where(self._mask, self._padded_indices, self._background))
+        self._propagate_labels()
+
+        self.labels.fill(0)
+        if not self._mask.any():
+            self._previous_regions = []
+            return []
+
+        roots, compact_labels = np.unique(self._inner[self._mask], return_inverse=True)
+        values = frame[self._mask].astype(np.float64)
+        area = np.bincount(compact_labels, minlength=len(roots))
+        load = np.bincount(compact_labels, weights=values, minlength=len(roots))
+        peak = np.zeros(len(roots))
+        np.maximum.at(peak, compact_labels, values)
+        cop_x = np.bincount(compact_labels, weights=values * self._xs[self._mask], minlength=len(roots)) / load
+        cop_y = np.bincount(compact_labels, weights=values * self._ys[self._mask], minlength=len(roots)) / load
+
+        # Drop regions below the minimum area and number the rest 1..n in the label map
+        kept = area >= self._minimum_area
+        region_labels = np.zeros(len(roots), dtype=np.int32)
+        region_labels[kept] = np.arange(1, np.count_nonzero(kept) + 1)
+        self.labels[self._mask] = region_labels[compact_labels]
+
+        regions = [ContactRegion(None, int(region_labels[i]), int(area[i]), peak[i], load[i], cop_x[i], cop_y[i])
+                   for i in np.flatnonzero(kept)]
+        self._assign_region_ids(regions)
+        return regions
+
+    def _assign_region_ids(self, regions):
+        # Greedy nearest-CoP matching against the previous frame's regions
+        if self._track and regions and self._previous_regions:
+            current = np.array([(region.cop_x, region.cop_y) for region in regions])
+            previous = np.array([(region.cop_x, region.cop_y) for region in self._previous_regions])
+            distances = np.hypot(*(current[:, None, :] - previous[None, :, :]).transpose(2, 0, 1))
+            matched_previous = set()
+            for flat_index in np.argsort(distances, axis=None):
+                i, j = divmod(int(flat_index), len(previous))
+                if distances[i, j] > self._maximum_tracking_distance:
+                    break
+                if regions[i].region_id is None and j not in matched_previous:
+                    regions[i].region_id = self._previous_regions[j].region_id
+                    matched_previous.add(j)
+        for region in regions:
+            if region.region_id is None:
+                region.region_id = self._next_region_id
+                self._next_region_id += 1
+        self._previous_regions = regions
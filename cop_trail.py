@@ -0,0 +1,49 @@
+import numpy as np
+
+
+COP_TRAIL_POINTS = 600  # Most points a trail keeps and renders, whatever its duration and the sample rate
+
+
+class CoPTrail:
+    """Ring buffer of the most recent CoP positions, covering the last duration seconds of frame timestamps.
+
+    Every point is written twice, at its slot and one capacity further on, so the points in chronological order
+    are always one contiguous slice of the buffer and can be handed to the plot as views without copying or
+    building lists. Points closer together than duration / max_points are decimated away, which keeps the
+    number of rendered points bounded when the sample rate is far above the display rate.
+    """
+    def __init__(self, duration, max_points=COP_TRAIL_POINTS):
+        self._duration_ns = int(duration * 1e9)
+        self._minimum_interval_ns = self._duration_ns // max_points
+        self._capacity = max_points + 1
+        self._xs = np.zeros(2 * self._capacity, dtype=np.float64)
+        self._ys = np.zeros(2 * self._capacity, dtype=np.float64)
+        self._timestamps = np.zeros(2 * self._capacity, dtype=np.int64)
+        self._next = 0
+        self._count = 0
+
+    def add(self, x, y, timestamp_ns):
+        if self._count > 0:
+            last_timestamp = self._timestamps[self._next - 1 + self._capacity]
+            if timestamp_ns < last_timestamp:
+                # Time went backwards, e.g. seeking in a recording, so the old trail no longer applies
+                self.clear()
+            elif timestamp_ns - last_timestamp < self._minimum_interval_ns:
+                return
+        for index in (self._next, self._next + self._capacity):
+            self._xs[index] = x
+            self._ys[index] = y
+            self._timestamps[index] = timestamp_ns
+        self._next = (self._next + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def get_points(self, now_ns):
+        # Views of the points from the last duration seconds before now_ns, oldest first
+        end = self._next + self._capacity
+        start = end - self._count
+        start += np.searchsorted(self._timestamps[start:end], now_ns - self._duration_ns)
+        return self._xs[start:end], self._ys[start:end]
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
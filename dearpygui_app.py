@@ -1,22 +1,32 @@
+import os
 import time
-import struct
-import asyncio
-import threading
+import argparse
 import numpy as np
-from queue import Queue
 import dearpygui.dearpygui as dpg
-from bleak import BleakScanner, BleakClient
 
+from ble_matrix import BLEScanner, BLEConnection, MATRIX_SERVICE_UUID, STREAMING, RECONNECTING, RECONNECT_ATTEMPTS
+from output_paths import unique_directory
+from simulated_matrix import SimulatedMatrixClient, SIMULATED_ADDRESS
+from deferred_imports import preload_modules
 
-# noinspection SpellCheckingInspection
-BASE_UUID = "4A98XXXX-E7C1-EFDE-C757-F1267DD021E8"
-MATRIX_SERVICE_UUID = BASE_UUID.replace("XXXX", "1623").lower()
-MATRIX_DIMENSIONS_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1624").lower()
-MATRIX_DATA_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1625").lower()
-MATRIX_TARE_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1626").lower()
-TIMEOUT_SECONDS = 20  # How long to wait until removing a last seen device
+# bleak and the optional feature modules are imported where they are first used, so the window does not wait for them
+
+
+# Imported in the background once the window is up
+DEFERRED_MODULES = ("bleak", "upsampling", "session_player", "contact_regions", "cop_trail", "texture_heatmap", "latency",
+                    "virtual_matrix", "sampling_profiler")
 GRID_SIZE = 500
+RECORDINGS_DIRECTORY = "./recordings"
 MATRIX_FRAME_RATE = 30
+UPSAMPLED_RESOLUTION = 100  # Heatmap cells along the longest side when smoothing is enabled
+LARGE_MATRIX_CELLS = 64 * 64  # Larger matrices are always drawn as a texture, the heat series cannot keep up
+PLAYBACK_SPEEDS = {"0.25x": 0.25, "0.5x": 0.5, "1x": 1.0, "2x": 2.0, "4x": 4.0}
+SMOOTHING_OPTIONS = {"None": None, "Bilinear": "bilinear", "Bicubic": "bicubic"}
+RENDERER_OPTIONS = {"Heat series": "heat_series", "Texture": "texture"}
+COP_TRAIL_OPTIONS = {"Off": None, "1 s": 1, "3 s": 3, "10 s": 10}
+VIEW_OPTIONS = {"Live": None, "Peak": "peak", "Mean": "mean"}
+TEMPORAL_FILTER_OPTIONS = {"None": None, "EMA": "ema", "Moving average": "moving_average", "Median": "median",
+                           "Dead band": "dead_band"}
 
 
 COLOUR_MAP_VALUES = [
@@ -27,255 +37,12 @@ COLOUR_MAP_VALUES = [
 ]
 
 
-class BLEFrameAssembler:
-    def __init__(self, timeout=1):
-        self.frames = {}  # frame_id -> list of parts
-        self.expected_parts = {}  # frame_id -> total_parts
-        self.timestamps = {}  # frame_id -> timestamp
-        self.timeout = timeout  # seconds
-
-    def construct_data(self, data: bytes):
-        now = time.time()
-
-        # Clean up old frames
-        self._cleanup_old_frames(now)
-
-        if len(data) < 3:
-            print("Invalid packet: too short")
-            return None
-
-        frame_id = data[0]
-        total_parts = data[1]
-        part_number = data[2]
-        payload = data[3:]
-        # print(data[0], data[1], data[2], [data[x] for x in range(3, len(data))])
-        # Ignore invalid part numbers
-        if part_number >= total_parts:
-            print(f"Invalid part number {part_number} for frame {frame_id}")
-            return None
-
-        # Initialize frame if new
-        if frame_id not in self.frames:
-            self.frames[frame_id] = [None] * total_parts
-            self.expected_parts[frame_id] = total_parts
-            self.timestamps[frame_id] = now
-
-        # Store the part
-        self.frames[frame_id][part_number] = payload
-
-        # Check if all parts are received
-        if all(part is not None for part in self.frames[frame_id]):
-            full_payload = b''.join(self.frames[frame_id])
-
-            # Cleanup
-            del self.frames[frame_id]
-            del self.expected_parts[frame_id]
-            del self.timestamps[frame_id]
-
-            # print(f"Frame {frame_id} reassembled successfully.")
-            return full_payload
-
-        return None  # Not yet complete
-
-    def _cleanup_old_frames(self, current_time):
-        expired = [fid for fid, t in self.timestamps.items()
-                   if current_time - t > self.timeout]
-        for fid in expired:
-            #print(f"Frame {fid} expired. Cleaning up.")
-            self.frames.pop(fid, None)
-            self.expected_parts.pop(fid, None)
-            self.timestamps.pop(fid, None)
-
-
-class BLEScanner:
-    def __init__(self, add_new_device_callback, update_device_callback, delete_device_callback):
-        self._new_device_cb = add_new_device_callback
-        self._update_device_cb = update_device_callback
-        self._delete_device_cb = delete_device_callback
-
-        self.devices = {}  # address -> (name, matrix_service, last_seen)
-
-        self._lock = threading.Lock()
-        self._loop = asyncio.new_event_loop()
-        self._stop_event = threading.Event()
-
-        self._discover_devices_thread = threading.Thread(target=self._run_loop, daemon=True)
-        self._remove_stale_device_thread = threading.Thread(target=self._remove_stale_devices, daemon=True)
-
-    def __del__(self):
-        if not self._stop_event.is_set():
-            self.stop()
-        print("Successfully Exited BLEScanner Threads")
-
-    def _run_loop(self):
-        asyncio.set_event_loop(self._loop)
-        self._loop.run_until_complete(self._scanner())
-
-    async def _scanner(self):
-        async with BleakScanner(detection_callback=self._device_found_cb, return_adv=True):
-            while not self._stop_event.is_set():
-                await asyncio.sleep(0.1)
-                continue
-
-    def _device_found_cb(self, device, adv_data):
-        name = None
-        has_service = None
-        time_stamp = time.time()
-        # Update with scan response data
-        if device.address in self.devices:
-            if self.devices[device.address][0] == "Unknown":
-                name = adv_data.local_name or "Unknown"
-                self._update_device_cb(device.address, "name", name)
-            if not self.devices[device.address][1]:
-                has_service = str(MATRIX_SERVICE_UUID in adv_data.service_uuids)
-                self._update_device_cb(device.address, "service", has_service)
-        # If it is a new device:
-        else:
-            name = adv_data.local_name or "Unknown"
-            has_service = str(MATRIX_SERVICE_UUID in adv_data.service_uuids)
-            self._new_device_cb(device.address, name, has_service)
-
-        with self._lock:
-            self.devices[device.address] = (name, has_service, time_stamp)
-
-    def _remove_stale_devices(self):
-        while not self._stop_event.is_set():
-            time.sleep(0.5)
-            now = time.time()
-            with self._lock:
-                    addresses_to_pop = []
-                    for addr, (name, service, ts) in self.devices.items():
-                        if now - ts >= TIMEOUT_SECONDS:
-                            self._delete_device_cb(addr)
-                            addresses_to_pop.append(addr)
-                    for addr in addresses_to_pop:
-                        self.devices.pop(addr)
-
-    def start(self):
-        self._discover_devices_thread.start()
-        self._remove_stale_device_thread.start()
-
-    def stop(self):
-        self._stop_event.set()
-        self._discover_devices_thread.join()
-        self._remove_stale_device_thread.join()
-
-    def get_devices(self):
-        with self._lock:
-            return dict(self.devices)
-
-
-class BLEConnection:
-    def __init__(self, address):
-        self.matrix_dimensions_queue = Queue()
-        self.matrix_data_queue = Queue()
-
-        self._dimensions_characteristic = MATRIX_DIMENSIONS_CHARACTERISTIC_UUID
-        self._data_stream_characteristic = MATRIX_DATA_CHARACTERISTIC_UUID
-        self._tare_characteristic = MATRIX_TARE_CHARACTERISTIC_UUID
-        self._address = address
-
-        self._rows = None
-        self._columns = None
-        self._data_assembler = BLEFrameAssembler()
-
-        self._data_rate_start_time = 0
-        self._assembled_data_count = 0
-        self._data_rate = 0
-
-        self._loop = asyncio.new_event_loop()
-        self._stop_event = threading.Event()
-        self.mutex = threading.Lock()
-
-        self._connection_thread = threading.Thread(target=self._run_loop, daemon=True)
-
-    def _run_loop(self):
-        asyncio.set_event_loop(self._loop)
-        self._loop.run_until_complete(self._ble_connect_stream())
-
-    async def _ble_connect_stream(self):
-        try:
-            async with (BleakClient(self._address) as self._client):
-                self._rows, self._columns = await self._get_matrix_dimensions()
-                self.matrix_dimensions_queue.put((self._rows, self._columns))
-                self._data_rate_start_time = time.time()
-                await self._client.start_notify(self._data_stream_characteristic, self._notification_handler_callback)
-
-                while not self._stop_event.is_set():
-                    await asyncio.sleep(0.1)
-
-                if self._stop_event.is_set():
-                    await self._client.stop_notify(MATRIX_DATA_CHARACTERISTIC_UUID)
-                    await self._client.disconnect()
-
-        except Exception as e:
-            print("Connection Failed. Error: {}".format(e))
-            with self.mutex:
-                self.matrix_dimensions_queue.put((None, None))
-
-    async def _get_matrix_dimensions(self):
-        byte_array = await self._client.read_gatt_char(self._dimensions_characteristic)
-        rows, columns = struct.unpack('<BB', byte_array)
-        return rows, columns
-
-    def send_tare_command(self):
-        asyncio.run(self._send_tare_command())
-
-    async def _send_tare_command(self):
-        if self._client.is_connected:
-            # Command: 0x01 = tare
-            data = bytearray([0x01])
-            await self._client.write_gatt_char(self._tare_characteristic, data, response=False)
-            print("Tare command sent")
-        else:
-            print("Device is not connected")
-
-    def _decode_matrix_data(self, byte_array):
-        # Unpack the byte array into a flat list of integers
-        unpacked_matrix_data = struct.unpack("<" + (self._rows * self._columns * "B"), byte_array)
-        matrix_data = np.array(unpacked_matrix_data).reshape(self._rows, self._columns)
-        return matrix_data
-
-    # noinspection PyUnusedLocal
-    def _notification_handler_callback(self, sender, data):
-        assembled_data = self._data_assembler.construct_data(data)
-        if assembled_data is not None:
-            matrix_values = self._decode_matrix_data(assembled_data)
-            with self.mutex:
-                self.matrix_data_queue.put(matrix_values)
-
-            self._calculate_data_rate()
-
-    def _calculate_data_rate(self):
-        self._assembled_data_count += 1
-        data_rate_time_difference = time.time() - self._data_rate_start_time
-        if data_rate_time_difference > 1:
-            with self.mutex:
-                self._data_rate = self._assembled_data_count / data_rate_time_difference
-            self._data_rate_start_time = time.time()
-            self._assembled_data_count = 0
-
-    def get_data_rate(self):
-        with self.mutex:
-            return self._data_rate
-
-    def get_connection_status(self):
-        with self.mutex:
-            return self._client.is_connected
-
-    def start(self):
-        self._connection_thread.start()
-
-    def stop(self):
-        self._stop_event.set()
-        self._connection_thread.join()
-        print("Successfully exited BLEConnection thread")
-
-
 class MatrixApp:
     def __init__(self):
         self._scanner = None
         self._device_table_items = {}
+        self._device_table_update_handler = None
+        self._matrix_devices_only = False
 
         self._global_theme = None
         self._connector = None
@@ -283,6 +50,18 @@ class MatrixApp:
         self._pressure_matrix_plot = None
         self._pressure_matrix_group = None
         self._pressure_matrix_update_handler = None
+        self._heat_series_axis = None
+        self._smoothing_option = "None"
+        self._filter_option = "None"
+        self._partial_frames = False
+        self._view_option = "Live"
+        self._cop_trail_option = "Off"
+        self._cop_trail = None
+        self._cop_trail_plot = None
+        self._renderer_option = "Heat series"
+        self._texture_heatmap = None
+        self._heatmap_texture = None
+        self._upsampler = None
 
         self._animation_group = None
 
@@ -291,11 +70,35 @@ class MatrixApp:
         self._frame_timestamp = None
         self._fps_text = None
         self._sps_text = None
+        self._timing_text = None
+        self._connection_text = None
+        self._connection_status = None
+        self._latency_text = None
+        self._partial_text = None
+        self._latency_tracker = None
+        self._pending_latency = None  # Timestamps of the displayed frame that is waiting to be drawn
+        self._record_button = None
+        self._recording = False
+        self._profile_button = None
+        self._profiler = None
+
+        # Session playback
+        self._player = None
+        self._recording_dialog = None
+        self._walkway_dialog = None
+        self._play_button = None
+        self._seek_slider = None
+        self._playback_frame_index = None
+
+        # Contact regions, segmented on displayed frames when enabled
+        self._show_regions = False
+        self._segmenter = None
+        self._region_plot = None
 
         # For CoP computations
         self._matrix_shape = None
-        self._xs = None
-        self._ys = None
+        self._column_positions = None
+        self._row_positions = None
 
     def setup_app(self):
         # GUI setup
@@ -308,6 +111,13 @@ class MatrixApp:
         with (dpg.colormap_registry()):
             self._colormap = dpg.add_colormap(colors=COLOUR_MAP_VALUES, qualitative=False)
 
+        self._recording_dialog = dpg.add_file_dialog(directory_selector=True, show=False, width=380, height=350,
+                                                     default_path=RECORDINGS_DIRECTORY,
+                                                     callback=self._open_recording_callback)
+        with dpg.file_dialog(show=False, width=380, height=350,
+                             callback=self._open_walkway_callback) as self._walkway_dialog:
+            dpg.add_file_extension(".json")
+
         with dpg.window(tag="Primary Window") as self.window:
             dpg.bind_font(regular_font)
             self._create_device_scanning_table()
@@ -326,6 +136,7 @@ class MatrixApp:
         # dpg.show_metrics()
         dpg.setup_dearpygui()
         dpg.show_viewport()
+        preload_modules(DEFERRED_MODULES)
         dpg.start_dearpygui()
         self._on_close()
         dpg.destroy_context()
@@ -333,13 +144,26 @@ class MatrixApp:
     def _create_device_scanning_table(self):
         dpg.configure_viewport(0, width=400, height=400)
         with (dpg.group(parent=self.window) as self.scan_results_group):
+            with dpg.item_handler_registry() as self._device_table_update_handler:
+                dpg.add_item_visible_handler(callback=self._update_device_table_callback)
             dpg.add_text("Scanning for Bluetooth Devices")
+            dpg.add_checkbox(label="Matrix devices only", default_value=self._matrix_devices_only,
+                             callback=self._matrix_devices_only_callback)
+            with dpg.group(horizontal=True):
+                dpg.add_button(label="Open Recording", callback=lambda: dpg.show_item(self._recording_dialog))
+                # Test mode, a matrix on this machine that carries its send times for end to end latency
+                dpg.add_button(label="Simulated Matrix", callback=self._connect_to_simulated_matrix)
+                # Several mats side by side, shown as one matrix
+                dpg.add_button(label="Walkway", callback=lambda: dpg.show_item(self._walkway_dialog))
             with dpg.table(header_row=True, scrollY=True, resizable=False, reorderable=False, hideable=False,
                            borders_innerV=True, borders_innerH=True, borders_outerH=True, borders_outerV=True) as self.device_table_rows:
                 dpg.add_table_column(label="Address", width_fixed=True, init_width_or_weight=153)
                 dpg.add_table_column(label="Device")
 
-        self._scanner = BLEScanner(self.add_row_to_table, self.update_row_in_table, self.delete_row_in_table)
+        dpg.bind_item_handler_registry(self.scan_results_group, self._device_table_update_handler)
+        service_uuids = [MATRIX_SERVICE_UUID] if self._matrix_devices_only else None
+        self._scanner = BLEScanner(self.add_row_to_table, self.update_row_in_table, self.delete_row_in_table,
+                                   service_uuids=service_uuids)
         self._scanner.start()
 
     def _remove_device_scanning_table(self):
@@ -348,6 +172,19 @@ class MatrixApp:
 
         self._device_table_items.clear()
         dpg.delete_item(self.scan_results_group)
+        dpg.delete_item(self._device_table_update_handler)
+
+    # noinspection PyUnusedLocal
+    def _matrix_devices_only_callback(self, sender, app_data, user_data):
+        # The filter is applied by the adapter, so the scan is restarted with the new setting
+        self._matrix_devices_only = app_data
+        self._remove_device_scanning_table()
+        self._create_device_scanning_table()
+
+    # noinspection PyUnusedLocal
+    def _update_device_table_callback(self, sender, app_data, user_data):
+        if self._scanner is not None:
+            self._scanner.flush_updates()
 
     def add_row_to_table(self, address, name, has_service):
         device_details = [address, name]
@@ -379,8 +216,11 @@ class MatrixApp:
             self._device_table_items.pop(address)
 
     def _precompute_cop_matrix(self, rows, columns):
+        from contact_regions import ContactSegmenter
         self._matrix_shape = (rows, columns)
-        self._ys, self._xs = np.indices(self._matrix_shape)
+        self._row_positions = np.arange(rows, dtype=np.float64)
+        self._column_positions = np.arange(columns, dtype=np.float64)
+        self._segmenter = ContactSegmenter(rows, columns)
 
     def _create_matrix_display(self):
         self._connecting_animation()
@@ -388,58 +228,234 @@ class MatrixApp:
         dpg.delete_item(self._animation_group)
 
         if rows is not None or columns is not None:
-            self._precompute_cop_matrix(rows, columns)
-
-            width = GRID_SIZE if columns > rows else round(GRID_SIZE * columns / rows)
-            height = round(GRID_SIZE * rows / columns) if columns > rows else GRID_SIZE
-            dpg.configure_viewport(0, width=115 + width, height=85 + GRID_SIZE)
-            values = [0] * rows * columns
-
-            with dpg.group(parent=self.window) as self._pressure_matrix_group:
-                with dpg.item_handler_registry() as self._pressure_matrix_update_handler:
-                    dpg.add_item_visible_handler(callback=self._update_matrix_display_callback)
-                with dpg.group(horizontal=True):
-                    dpg.add_button(label="Disconnect", width=120, callback=self._disconnect_from_device)
-                    dpg.add_button(label="Tare", width=120, callback=self._tare_pressure_matrix)
-                    self._fps_text = dpg.add_text("{:2d}".format(0))
-                    dpg.add_text("FPS |")
-                    self._data_rate_text = dpg.add_text("{:2d}".format(0))
-                    dpg.add_text("SPS")
-                with dpg.group(horizontal=True):
-                    color_map_scale = dpg.add_colormap_scale(
-                        min_scale=0, max_scale=255, height=GRID_SIZE, colormap=self._colormap)
-                    with dpg.plot(before=color_map_scale, no_title=True, no_mouse_pos=True,
-                                  no_inputs=True, height=height, width=width) as plot:
-                        dpg.bind_colormap(plot, self._colormap)
-                        dpg.add_plot_axis(
-                            dpg.mvXAxis,
-                            lock_min=True,
-                            lock_max=True,
-                            no_gridlines=True,
-                            no_tick_marks=True,
-                            no_label=True,
-                            no_tick_labels=True)
-                        with dpg.plot_axis(dpg.mvYAxis, no_gridlines=True, no_tick_marks=True,
-                                           lock_min=True, lock_max=True, no_label=True, no_tick_labels=True):
-                            self._pressure_matrix_plot = dpg.add_heat_series(values, rows, columns,
-                                                                             scale_min=0, scale_max=255, format="%.f")
-
-                        with dpg.plot_axis(dpg.mvYAxis, no_gridlines=True, no_tick_marks=True, lock_min=True,
-                                           lock_max=True, no_label=True, no_tick_labels=True):
-                            self._cop_plot = dpg.add_scatter_series(
-                                [0.5], [0.5], tag="cop_dot")
-
-            dpg.bind_item_handler_registry(self._pressure_matrix_group, self._pressure_matrix_update_handler)
-            self._frame_timestamp = 0
-            self._frame_counter = 0
+            self._build_matrix_display(rows, columns)
         else:
             self._connector = None
             self._create_device_scanning_table()
 
+    def _build_matrix_display(self, rows, columns):
+        # Shared by the live stream and session playback, which only differ in their controls
+        self._precompute_cop_matrix(rows, columns)
+
+        width = GRID_SIZE if columns > rows else round(GRID_SIZE * columns / rows)
+        height = round(GRID_SIZE * rows / columns) if columns > rows else GRID_SIZE
+        dpg.configure_viewport(0, width=115 + width, height=288 + GRID_SIZE)
+
+        with dpg.group(parent=self.window) as self._pressure_matrix_group:
+            with dpg.item_handler_registry() as self._pressure_matrix_update_handler:
+                dpg.add_item_visible_handler(callback=self._update_matrix_display_callback)
+            if self._player is None:
+                self._create_stream_controls()
+            else:
+                self._create_playback_controls()
+            with dpg.group(horizontal=True):
+                dpg.add_text("Smoothing")
+                dpg.add_combo(list(SMOOTHING_OPTIONS), default_value=self._smoothing_option, width=120,
+                              callback=self._change_smoothing_callback)
+                if self._player is None:
+                    dpg.add_text("Filter")
+                    dpg.add_combo(list(TEMPORAL_FILTER_OPTIONS), default_value=self._filter_option, width=150,
+                                  callback=self._change_filter_callback)
+            with dpg.group(horizontal=True):
+                if self._player is None:
+                    dpg.add_text("View")
+                    dpg.add_combo(list(VIEW_OPTIONS), default_value=self._view_option, width=100,
+                                  callback=self._change_view_callback)
+                    dpg.add_button(label="Reset", width=80, callback=self._reset_statistics_callback)
+                dpg.add_checkbox(label="Regions", default_value=self._show_regions,
+                                 callback=self._show_regions_callback)
+                dpg.add_text("Trail")
+                dpg.add_combo(list(COP_TRAIL_OPTIONS), default_value=self._cop_trail_option, width=80,
+                              callback=self._change_cop_trail_callback)
+            with dpg.group(horizontal=True):
+                dpg.add_text("Renderer")
+                dpg.add_combo(list(RENDERER_OPTIONS), default_value=self._renderer_option, width=150,
+                              callback=self._change_renderer_callback)
+            with dpg.group(horizontal=True):
+                color_map_scale = dpg.add_colormap_scale(
+                    min_scale=0, max_scale=255, height=GRID_SIZE, colormap=self._colormap)
+                with dpg.plot(before=color_map_scale, no_title=True, no_mouse_pos=True,
+                              no_inputs=True, height=height, width=width) as plot:
+                    dpg.bind_colormap(plot, self._colormap)
+                    dpg.add_plot_axis(
+                        dpg.mvXAxis,
+                        lock_min=True,
+                        lock_max=True,
+                        no_gridlines=True,
+                        no_tick_marks=True,
+                        no_label=True,
+                        no_tick_labels=True)
+                    self._heat_series_axis = dpg.add_plot_axis(dpg.mvYAxis, no_gridlines=True,
+                                                               no_tick_marks=True, lock_min=True, lock_max=True,
+                                                               no_label=True, no_tick_labels=True)
+                    self._add_heatmap()
+
+                    with dpg.plot_axis(dpg.mvYAxis, no_gridlines=True, no_tick_marks=True, lock_min=True,
+                                       lock_max=True, no_label=True, no_tick_labels=True):
+                        self._cop_trail_plot = dpg.add_line_series([], [], tag="cop_trail")
+                        self._cop_plot = dpg.add_scatter_series(
+                            [0.5], [0.5], tag="cop_dot")
+                        self._region_plot = dpg.add_scatter_series([], [], tag="region_cop_dots")
+
+        dpg.bind_item_handler_registry(self._pressure_matrix_group, self._pressure_matrix_update_handler)
+        self._frame_timestamp = 0
+        self._frame_counter = 0
+        self._create_cop_trail()
+
+    def _create_stream_controls(self):
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Disconnect", width=100, callback=self._disconnect_from_device)
+            dpg.add_button(label="Tare", width=100, callback=self._tare_pressure_matrix)
+            self._record_button = dpg.add_button(label="Record", width=100,
+                                                 callback=self._toggle_recording_callback)
+            # Samples every thread for PROFILE_DURATION, for finding where a rig spends its time
+            self._profile_button = dpg.add_button(label="Stop Profile" if self._is_profiling() else "Profile",
+                                                  width=100, callback=self._toggle_profiling_callback)
+            self._fps_text = dpg.add_text("{:2d}".format(0))
+            dpg.add_text("FPS |")
+            self._data_rate_text = dpg.add_text("{:2d}".format(0))
+            dpg.add_text("SPS")
+        self._timing_text = dpg.add_text("Interval p50 -- p99 -- ms | Jitter -- ms | Batched --%")
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Export", width=100, callback=self._export_latency_callback)
+            self._latency_text = dpg.add_text("Latency p50 -- p99 -- ms")
+        with dpg.group(horizontal=True):
+            # Frames missing parts are shown with the missing cells held at their last values instead of dropped
+            dpg.add_checkbox(label="Partial frames", default_value=self._partial_frames,
+                             callback=self._partial_frames_callback)
+            self._partial_text = dpg.add_text("Partial --%")
+        self._connection_text = dpg.add_text(STREAMING)
+        self._connection_status = STREAMING
+
+    def _create_playback_controls(self):
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Close", width=100, callback=self._close_recording)
+            self._play_button = dpg.add_button(label="Play", width=100, callback=self._toggle_playback_callback)
+            dpg.add_combo(list(PLAYBACK_SPEEDS), default_value="1x", width=100,
+                          callback=self._change_playback_speed_callback)
+        self._seek_slider = dpg.add_slider_float(min_value=0, max_value=self._player.duration_ns / 1e9, width=-1,
+                                                 format="%.2f s", callback=self._seek_playback_callback)
+
+    def _add_heatmap(self):
+        from upsampling import get_upsampler, get_block_pooler, fit_output_size
+        from texture_heatmap import TextureHeatmap
+        rows, columns = self._matrix_shape
+        upsampling = SMOOTHING_OPTIONS[self._smoothing_option]
+        if RENDERER_OPTIONS[self._renderer_option] == "texture" or rows * columns > LARGE_MATRIX_CELLS:
+            # The texture can hold the upsampled frame at the plot's own resolution
+            self._upsampler = None
+            downsampler = None
+            if upsampling is not None:
+                texture_rows, texture_columns = fit_output_size(rows, columns, GRID_SIZE)
+                self._upsampler = get_upsampler(rows, columns, texture_rows, texture_columns, upsampling)
+            else:
+                # Cells smaller than a pixel of the plot are pooled rather than left to the GPU to skip
+                downsampler = get_block_pooler(rows, columns, GRID_SIZE)
+            self._texture_heatmap = TextureHeatmap(rows, columns, COLOUR_MAP_VALUES, self._upsampler,
+                                                   downsampler=downsampler)
+            with dpg.texture_registry():
+                self._heatmap_texture = dpg.add_raw_texture(self._texture_heatmap.width, self._texture_heatmap.height,
+                                                            default_value=self._texture_heatmap.buffer,
+                                                            format=dpg.mvFormat_Float_rgba)
+            self._pressure_matrix_plot = dpg.add_image_series(self._heatmap_texture, [0, 0], [1, 1],
+                                                              parent=self._heat_series_axis)
+            return
+
+        self._texture_heatmap = None
+        if upsampling is None:
+            self._upsampler = None
+            heat_rows, heat_columns = rows, columns
+            value_format = "%.f"
+        else:
+            heat_rows, heat_columns = fit_output_size(rows, columns, UPSAMPLED_RESOLUTION)
+            self._upsampler = get_upsampler(rows, columns, heat_rows, heat_columns, upsampling)
+            # Labelling every interpolated cell would cover the plot in text
+            value_format = ""
+        self._pressure_matrix_plot = dpg.add_heat_series([0] * heat_rows * heat_columns, heat_rows, heat_columns,
+                                                         parent=self._heat_series_axis, scale_min=0,
+                                                         scale_max=255, format=value_format)
+
+    def _remove_heatmap(self):
+        dpg.delete_item(self._pressure_matrix_plot)
+        if self._heatmap_texture is not None:
+            dpg.delete_item(self._heatmap_texture)
+            self._heatmap_texture = None
+
     # noinspection PyUnusedLocal
-    def _update_matrix_display_callback(self, sender, app_data, user_data):
+    def _change_smoothing_callback(self, sender, app_data):
+        self._smoothing_option = app_data
+        self._remove_heatmap()
+        self._add_heatmap()
+
+    # noinspection PyUnusedLocal
+    def _change_renderer_callback(self, sender, app_data):
+        self._renderer_option = app_data
+        self._remove_heatmap()
+        self._add_heatmap()
+
+    # noinspection PyUnusedLocal
+    def _change_filter_callback(self, sender, app_data):
+        self._filter_option = app_data
+        if self._connector is not None:
+            self._connector.set_temporal_filter(TEMPORAL_FILTER_OPTIONS[app_data])
+
+    # noinspection PyUnusedLocal
+    def _partial_frames_callback(self, sender, app_data):
+        self._partial_frames = app_data
         if self._connector is not None:
+            self._connector.set_partial_frames(app_data)
+
+    def _create_cop_trail(self):
+        from cop_trail import CoPTrail
+        duration = COP_TRAIL_OPTIONS[self._cop_trail_option]
+        self._cop_trail = CoPTrail(duration) if duration is not None else None
+        dpg.set_value(self._cop_trail_plot, [[], []])
+
+    # noinspection PyUnusedLocal
+    def _change_cop_trail_callback(self, sender, app_data):
+        self._cop_trail_option = app_data
+        self._create_cop_trail()
+
+    def _add_to_cop_trail(self, matrix, timestamp_ns):
+        cop = self._compute_cop(matrix)
+        # An unloaded matrix puts the CoP off the plot, which is left out of the trail
+        if cop[0] <= 1.0:
+            self._cop_trail.add(cop[0], cop[1], timestamp_ns)
+
+    def _update_cop_trail(self, now_ns):
+        xs, ys = self._cop_trail.get_points(now_ns)
+        dpg.set_value(self._cop_trail_plot, [xs, ys])
+
+    # noinspection PyUnusedLocal
+    def _change_view_callback(self, sender, app_data):
+        self._view_option = app_data
+
+    # noinspection PyUnusedLocal
+    def _reset_statistics_callback(self, sender, app_data):
+        if self._connector is not None and self._connector.session_statistics is not None:
+            self._connector.session_statistics.reset()
+
+    # noinspection PyUnusedLocal
+    def _show_regions_callback(self, sender, app_data):
+        self._show_regions = app_data
+        if not app_data:
+            dpg.set_value(self._region_plot, [[], []])
+
+    def _update_contact_regions(self, matrix):
+        rows, columns = self._matrix_shape
+        regions = self._segmenter.segment(matrix)
+        # Same plot coordinates as the global CoP
+        xs = [(region.cop_x + 0.5) / columns for region in regions]
+        ys = [1.0 - (region.cop_y + 0.5) / rows for region in regions]
+        dpg.set_value(self._region_plot, [xs, ys])
+
+    # noinspection PyUnusedLocal
+    def _update_matrix_display_callback(self, sender, app_data, user_data):
+        if self._player is not None:
+            self._update_playback()
+        elif self._connector is not None:
             if self._connector.get_connection_status():
+                self._check_frame_presented()
                 self._update_pressure_matrix()
                 self._update_fps_data_rate()
             else:
@@ -453,8 +469,9 @@ class MatrixApp:
         rows = self._matrix_shape[0]
         columns = self._matrix_shape[1]
 
-        x_idx = (self._xs * matrix).sum() / total
-        y_idx = (self._ys * matrix).sum() / total
+        # From the row and column sums, so only O(rows + columns) is allocated even for the largest matrices
+        x_idx = matrix.sum(axis=0) @ self._column_positions / total
+        y_idx = matrix.sum(axis=1) @ self._row_positions / total
 
         x_norm = (x_idx + 0.5) / columns if columns > 1 else 0.5
         y_norm = (y_idx + 0.5) / rows if rows > 1 else 0.5
@@ -463,53 +480,244 @@ class MatrixApp:
         return [x_norm, 1.0 - y_norm]
 
     def _update_pressure_matrix(self):
-        latest_matrix = None
+        frames = []
         with self._connector.mutex:
             while not self._connector.matrix_data_queue.empty():
-                latest_matrix = self._connector.matrix_data_queue.get_nowait()
-        if latest_matrix is not None:
-            #transposed_matrix = np.flipud(latest_matrix)
-            #transposed_matrix = np.fliplr(latest_matrix)
-            #transposed_matrix = latest_matrix.T
-            transposed_matrix = latest_matrix
-            flat_matrix = transposed_matrix.flatten().tolist()
-            cop = self._compute_cop(transposed_matrix)
+                frames.append(self._connector.matrix_data_queue.get_nowait())
+        dequeued_ns = time.perf_counter_ns()
+        if frames:
+            latest_frame = frames[-1]
+            if self._cop_trail is not None:
+                # Every frame goes into the trail, not only the displayed ones
+                for frame in frames:
+                    self._add_to_cop_trail(frame.data, frame.completed_ns)
+                self._update_cop_trail(latest_frame.completed_ns)
+            statistic = VIEW_OPTIONS[self._view_option]
+            if statistic is None:
+                self._show_matrix(latest_frame.data)
+            else:
+                self._show_matrix(self._connector.session_statistics.get_map(statistic))
+            if self._pending_latency is None:
+                # One frame is followed to the screen at a time, the frames in between are only sampled less often
+                self._pending_latency = (latest_frame, dequeued_ns, time.perf_counter_ns(), dpg.get_frame_count())
+
+    def _check_frame_presented(self):
+        # Callbacks run alongside rendering, so data set during frame n is only certain to have been drawn once
+        # frame n + 1 has been rendered in full, which is when the counter reaches n + 2
+        if self._pending_latency is None:
+            return
+        frame, dequeued_ns, submitted_ns, submitted_frame = self._pending_latency
+        if dpg.get_frame_count() >= submitted_frame + 2:
+            self._latency_tracker.add_frame(frame.sent_ns, frame.first_part_ns, frame.completed_ns, frame.queued_ns,
+                                            dequeued_ns, submitted_ns, time.perf_counter_ns())
+            self._pending_latency = None
+
+    def _show_matrix(self, latest_matrix):
+        #transposed_matrix = np.flipud(latest_matrix)
+        #transposed_matrix = np.fliplr(latest_matrix)
+        #transposed_matrix = latest_matrix.T
+        transposed_matrix = latest_matrix
+        if self._texture_heatmap is not None:
+            dpg.set_value(self._heatmap_texture, self._texture_heatmap.render(transposed_matrix))
+        else:
+            if self._upsampler is not None:
+                flat_matrix = self._upsampler.upsample(transposed_matrix).ravel().tolist()
+            else:
+                flat_matrix = transposed_matrix.flatten().tolist()
             dpg.set_value(self._pressure_matrix_plot, [flat_matrix])
-            dpg.set_value(self._cop_plot, cop)
-            #else:
-                #dpg.set_value(self._cop_plot, [-1.0, -1.0])
+        cop = self._compute_cop(transposed_matrix)
+        dpg.set_value(self._cop_plot, cop)
+        if self._show_regions:
+            self._update_contact_regions(transposed_matrix)
+        #else:
+            #dpg.set_value(self._cop_plot, [-1.0, -1.0])
 
     def _update_fps_data_rate(self):
         # FPS Counter
         self._frame_counter += 1
-        time_difference = time.time() - self._frame_timestamp
+        time_difference = time.perf_counter() - self._frame_timestamp
         if time_difference >= 1:
             dpg.set_value(self._fps_text, "{:2.1f}".format(self._frame_counter / time_difference))
             self._frame_counter = 0
-            self._frame_timestamp = time.time()
+            self._frame_timestamp = time.perf_counter()
+            self._update_frame_timing()
+            if not self._is_profiling():
+                dpg.set_item_label(self._profile_button, "Profile")
 
         # Data Rate counter
         data_frequency = self._connector.get_data_rate()
         dpg.set_value(self._data_rate_text, "{:3.1f}".format(data_frequency))
+        self._update_connection_status()
+
+    def _update_connection_status(self):
+        state, attempt = self._connector.get_state()
+        if state == RECONNECTING:
+            status = "Reconnecting, attempt {} of {}".format(attempt, RECONNECT_ATTEMPTS)
+        else:
+            status = state
+        recovery_times = self._connector.get_recovery_times()
+        if recovery_times:
+            status += " | Reconnects {} | Last recovery {:.2f} s | Worst {:.2f} s".format(
+                len(recovery_times), recovery_times[-1], max(recovery_times))
+        if status != self._connection_status:
+            dpg.set_value(self._connection_text, status)
+            self._connection_status = status
+
+    def _update_frame_timing(self):
+        statistics = self._connector.frame_timing.get_statistics()
+        if statistics is not None:
+            dpg.set_value(self._timing_text, "Interval p50 {:.1f} p99 {:.1f} ms | Jitter {:.1f} ms | Batched {:.0f}%"
+                          .format(statistics["interval_p50"], statistics["interval_p99"], statistics["jitter"],
+                                  100 * statistics["batched_fraction"]))
+        counts = self._connector.get_frame_counts()
+        delivered = counts["completed"] + counts["partial"]
+        if delivered:
+            dpg.set_value(self._partial_text, "Partial {:.0f}%".format(100 * counts["partial"] / delivered))
+        latency = self._latency_tracker.get_statistics()
+        if latency is not None:
+            slowest_stage = max((stage for stage in latency if stage != "total"), key=lambda stage: latency[stage][0])
+            dpg.set_value(self._latency_text, "Latency p50 {:.1f} p90 {:.1f} p99 {:.1f} ms | {} {:.1f} ms".format(
+                *latency["total"][:3], slowest_stage.capitalize(), latency[slowest_stage][0]))
+
+    # noinspection PyUnusedLocal
+    def _export_latency_callback(self, sender, app_data):
+        os.makedirs(RECORDINGS_DIRECTORY, exist_ok=True)
+        path = os.path.join(RECORDINGS_DIRECTORY, time.strftime("latency_%Y%m%d_%H%M%S.csv"))
+        frames = self._latency_tracker.export_csv(path)
+        print("Latency of {} frames exported to {}".format(frames, path))
 
     def _remove_pressure_matrix(self):
         dpg.delete_item(self._pressure_matrix_group)
         self._pressure_matrix_group = None
+        # Textures live in the texture registry rather than the display group
+        if self._heatmap_texture is not None:
+            dpg.delete_item(self._heatmap_texture)
+            self._heatmap_texture = None
 
     def _tare_pressure_matrix(self):
         if self._connector is not None:
             self._connector.send_tare_command()
 
     # noinspection PyUnusedLocal
-    def connect_to_device(self, sender, app_data, address):
+    def _toggle_recording_callback(self, sender, app_data):
+        if self._connector is None:
+            return
+        if self._recording:
+            self._connector.stop_recording()
+            self._recording = False
+            dpg.set_item_label(self._record_button, "Record")
+        else:
+            directory = unique_directory(RECORDINGS_DIRECTORY, "session")
+            try:
+                started = self._connector.start_recording(directory)
+            except OSError as e:
+                print("Could not start recording. Error: {}".format(e))
+                return
+            if started:
+                self._recording = True
+                dpg.set_item_label(self._record_button, "Stop")
+
+    def _is_profiling(self):
+        return self._profiler is not None and self._profiler.is_running()
+
+    # noinspection PyUnusedLocal
+    def _toggle_profiling_callback(self, sender, app_data):
+        if self._is_profiling():
+            # Writing the profile takes a moment, so it is left to the profiler thread
+            self._profiler.stop_soon()
+            dpg.set_item_label(self._profile_button, "Profile")
+        else:
+            self.start_profiling()
+            dpg.set_item_label(self._profile_button, "Stop Profile")
+
+    def start_profiling(self, duration=None):
+        from sampling_profiler import SamplingProfiler, profile_directory, PROFILE_DURATION
+        self._profiler = SamplingProfiler(profile_directory(), PROFILE_DURATION if duration is None else duration)
+        self._profiler.start()
+
+    # noinspection PyUnusedLocal
+    def _open_recording_callback(self, sender, app_data):
+        from session_player import SessionPlayer
+        try:
+            self._player = SessionPlayer(app_data["file_path_name"])
+        except (OSError, ValueError, KeyError) as e:
+            print("Could not open recording. Error: {}".format(e))
+            return
+        self._remove_device_scanning_table()
+        self._playback_frame_index = None
+        self._build_matrix_display(self._player.rows, self._player.columns)
+
+    def _close_recording(self):
+        self._remove_pressure_matrix()
+        self._player = None
+        self._create_device_scanning_table()
+
+    def _update_playback(self):
+        frame_index = self._player.current_frame_index()
+        if frame_index != self._playback_frame_index:
+            self._playback_frame_index = frame_index
+            matrix = self._player.get_frame(frame_index)
+            if self._cop_trail is not None:
+                timestamp_ns = self._player.get_timestamp(frame_index)
+                self._add_to_cop_trail(matrix, timestamp_ns)
+                self._update_cop_trail(timestamp_ns)
+            self._show_matrix(matrix)
+        if self._player.is_playing():
+            dpg.set_value(self._seek_slider, self._player.get_position() / 1e9)
+        elif dpg.get_item_label(self._play_button) != "Play":
+            # Playback reached the end of the session
+            dpg.set_item_label(self._play_button, "Play")
+
+    # noinspection PyUnusedLocal
+    def _toggle_playback_callback(self, sender, app_data):
+        if self._player.is_playing():
+            self._player.pause()
+            dpg.set_item_label(self._play_button, "Play")
+        else:
+            self._player.play()
+            dpg.set_item_label(self._play_button, "Pause")
+
+    # noinspection PyUnusedLocal
+    def _change_playback_speed_callback(self, sender, app_data):
+        self._player.set_speed(PLAYBACK_SPEEDS[app_data])
+
+    # noinspection PyUnusedLocal
+    def _seek_playback_callback(self, sender, app_data):
+        self._player.seek(app_data * 1e9)
+
+    # noinspection PyUnusedLocal
+    def connect_to_device(self, sender, app_data, address, client_class=None):
         for _, [_, address_item, name_item] in self._device_table_items.items():
             dpg.disable_item(address_item)
             dpg.disable_item(name_item)
+        self._start_stream(BLEConnection(address, TEMPORAL_FILTER_OPTIONS[self._filter_option], client_class,
+                                         self._partial_frames))
+
+    def _start_stream(self, connector):
+        from latency import LatencyTracker
         self._remove_device_scanning_table()
-        self._connector = BLEConnection(address)
+        self._latency_tracker = LatencyTracker()
+        self._pending_latency = None
+        self._connector = connector
         self._connector.start()
         self._create_matrix_display()
 
+    # noinspection PyUnusedLocal
+    def _open_walkway_callback(self, sender, app_data):
+        from virtual_matrix import VirtualMatrixConnection, load_walkway_layout, walkway_client_class
+        try:
+            placements = load_walkway_layout(app_data["file_path_name"])
+            connector = VirtualMatrixConnection(placements, TEMPORAL_FILTER_OPTIONS[self._filter_option],
+                                                walkway_client_class(placements), self._partial_frames)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("Could not open walkway layout. Error: {}".format(e))
+            return
+        self._start_stream(connector)
+
+    # noinspection PyUnusedLocal
+    def _connect_to_simulated_matrix(self, sender, app_data):
+        self.connect_to_device(sender, app_data, SIMULATED_ADDRESS, SimulatedMatrixClient)
+
     def _connecting_animation(self):
         with dpg.group(parent=self.window) as self._animation_group:
             dpg.add_text("Connecting...")
@@ -521,6 +729,8 @@ class MatrixApp:
         self._disconnecting_animation()
         self._connector.stop()
         self._connector = None
+        self._recording = False
+        self._pending_latency = None
         dpg.delete_item(self._animation_group)
         self._create_device_scanning_table()
 
@@ -534,10 +744,18 @@ class MatrixApp:
             self._scanner.stop()
         if self._connector is not None:
             self._connector.stop()
+        if self._profiler is not None:
+            self._profiler.stop()
         print("GUI Closed Safely")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a BLE pressure matrix to a dearpygui window")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="sample every thread from start up for this long and save the profile to ./profiles")
+    arguments = parser.parse_args()
     app = MatrixApp()
+    if arguments.profile:
+        app.start_profiling(arguments.profile)
     app.setup_app()
 
@@ -0,0 +1,10 @@
+import importlib
+import threading
+
+
+def preload_modules(module_names):
+    # Imports modules off the GUI thread, so the first use of a deferred import does not stall the window
+    def import_modules():
+        for name in module_names:
+            importlib.import_module(name)
+    threading.Thread(target=import_modules, daemon=True).start()
@@ -0,0 +1,147 @@
+import time
+import threading
+import numpy as np
+from collections import deque
+
+from rate_limited_log import hot_path_log
+
+
+PIPELINE_QUEUE_SIZE = 8  # Frames waiting for the stages before the oldest waiting frame is dropped
+STAGE_TIMING_WINDOW = 1024  # Number of most recent runs of each stage the timing is computed over
+
+
+class StageResult:
+    def __init__(self, stage, result, timestamp_ns, duration_ns, frame, error=None):
+        self.stage = stage
+        self.result = result  # None if the stage failed
+        self.error = error  # Exception the stage raised on this frame, None if it succeeded
+        self.timestamp_ns = timestamp_ns  # Timestamp the frame was submitted with
+        self.duration_ns = duration_ns  # Time the stage took on this frame
+        self.frame = frame  # Whatever was submitted alongside the data, e.g. its MatrixFrame
+
+
+class FramePipeline:
+    """Runs processing stages on every submitted frame on a worker thread of its own.
+
+    A stage is a function(data, timestamp_ns) -> result, stages run in the order they were added, and each
+    result is handed to the subscribers of its stage on the worker thread, or can be read later with
+    get_result(). A stage that raises still hands its subscribers a StageResult, carrying the error instead of a
+    result, so a consumer can fall back rather than lose the frame. submit() never blocks: when the stages fall PIPELINE_QUEUE_SIZE frames behind, the oldest waiting
+    frame is dropped and counted, so the caller, e.g. the notification callback, only pays for handing the frame
+    over. Stages see frames in order, so a stage may keep state between frames.
+    """
+    def __init__(self, queue_size=PIPELINE_QUEUE_SIZE, timing_window=STAGE_TIMING_WINDOW):
+        self._stages = []  # (name, function)
+        self._subscribers = {}  # stage name -> list of callbacks
+        self._latest_results = {}  # stage name -> StageResult
+        self._durations = {}  # stage name -> deque of durations in ns
+        self._timing_window = timing_window
+
+        self._pending = deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._lock = threading.Lock()  # Guards stages, subscribers, results and timings
+        self._stopped = False
+        self.processed_frames = 0
+        self.dropped_frames = 0
+        self.stage_errors = 0
+        self.subscriber_errors = 0
+
+        self._worker_thread = threading.Thread(target=self._process_frames, daemon=True)
+
+    def add_stage(self, name, function):
+        with self._lock:
+            if name in self._durations:
+                raise ValueError("A stage named {} already exists".format(name))
+            self._stages = self._stages + [(name, function)]
+            self._subscribers[name] = []
+            self._durations[name] = deque(maxlen=self._timing_window)
+
+    def remove_stage(self, name):
+        with self._lock:
+            self._stages = [stage for stage in self._stages if stage[0] != name]
+            self._subscribers.pop(name, None)
+            self._latest_results.pop(name, None)
+            self._durations.pop(name, None)
+
+    def subscribe(self, name, callback):
+        # callback(StageResult) is called on the worker thread, it must not block for long
+        with self._lock:
+            if name not in self._subscribers:
+                raise ValueError("Unknown stage: {}".format(name))
+            self._subscribers[name] = self._subscribers[name] + [callback]
+
+    def unsubscribe(self, name, callback):
+        with self._lock:
+            if name in self._subscribers:
+                self._subscribers[name] = [subscriber for subscriber in self._subscribers[name]
+                                           if subscriber is not callback]
+
+    def submit(self, data, timestamp_ns, frame=None):
+        with self._condition:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped_frames += 1
+            self._pending.append((data, timestamp_ns, frame))
+            self._condition.notify()
+
+    def _process_frames(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                data, timestamp_ns, frame = self._pending.popleft()
+            # The lists are replaced rather than changed, so a stage added meanwhile waits for the next frame
+            with self._lock:
+                stages = self._stages
+                subscribers = self._subscribers
+            for name, function in stages:
+                start_ns = time.perf_counter_ns()
+                result = error = None
+                try:
+                    result = function(data, timestamp_ns)
+                except Exception as e:
+                    hot_path_log.log("stage_failed", "Stage {} failed: {}", name, e)
+                    self.stage_errors += 1
+                    error = e
+                stage_result = StageResult(name, result, timestamp_ns, time.perf_counter_ns() - start_ns, frame, error)
+                with self._lock:
+                    self._latest_results[name] = stage_result
+                    durations = self._durations.get(name)
+                    if durations is not None:
+                        durations.append(stage_result.duration_ns)
+                for callback in subscribers.get(name, ()):
+                    # One failing consumer must not stop the frames reaching the others
+                    try:
+                        callback(stage_result)
+                    except Exception as e:
+                        hot_path_log.log("subscriber_failed", "Subscriber of stage {} failed: {}", name, e)
+                        self.subscriber_errors += 1
+            self.processed_frames += 1
+
+    def get_result(self, name):
+        # Most recent StageResult of the stage, None until it has run
+        with self._lock:
+            return self._latest_results.get(name)
+
+    def get_stage_timing(self):
+        # {stage: (p50, p99, max) in ms}, for stages that have run
+        with self._lock:
+            durations = {name: np.array(values) for name, values in self._durations.items() if values}
+        return {name: tuple(np.append(np.percentile(values, (50, 99)), values.max()) / 1e6)
+                for name, values in durations.items()}
+
+    def get_queue_depth(self):
+        with self._condition:
+            return len(self._pending)
+
+    def start(self):
+        self._worker_thread.start()
+
+    def stop(self):
+        # Frames already submitted are processed before the worker exits
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._worker_thread.is_alive():
+            self._worker_thread.join()
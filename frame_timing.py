@@ -0,0 +1,65 @@
+import threading
+import numpy as np
+
+
+FRAME_TIMING_WINDOW = 1024  # Number of most recent frames the statistics are computed over
+
+
+class FrameTimingAnalyzer:
+    """Rolling inter-frame interval statistics from perf_counter_ns frame timestamps.
+
+    Radio-level batching shows up as a high batched fraction (frames completing back to back) with an unchanged
+    rate, whereas the sensor slowing down shows up as a lower rate and a high gap fraction.
+    """
+    def __init__(self, window=FRAME_TIMING_WINDOW):
+        self._first_part_ns = np.zeros(window, dtype=np.int64)
+        self._completed_ns = np.zeros(window, dtype=np.int64)
+        self._window = window
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add_frame(self, first_part_ns, completed_ns):
+        with self._lock:
+            self._first_part_ns[self._index] = first_part_ns
+            self._completed_ns[self._index] = completed_ns
+            self._index = (self._index + 1) % self._window
+            self._count = min(self._count + 1, self._window)
+
+    def _ordered_timestamps(self):
+        with self._lock:
+            if self._count < self._window:
+                return self._first_part_ns[:self._count].copy(), self._completed_ns[:self._count].copy()
+            return np.roll(self._first_part_ns, -self._index), np.roll(self._completed_ns, -self._index)
+
+    def get_statistics(self):
+        first_part_ns, completed_ns = self._ordered_timestamps()
+        if len(completed_ns) < 3:
+            return None
+
+        intervals = np.diff(completed_ns) / 1e6  # ms
+        assembly_times = (completed_ns - first_part_ns) / 1e6  # ms
+        interval_p50, interval_p90, interval_p99 = np.percentile(intervals, (50, 90, 99))
+        mean_interval = intervals.mean()
+        jitter = intervals.std()
+        return {
+            "frames": len(completed_ns),
+            "rate": 1000 / mean_interval if mean_interval > 0 else 0.0,
+            "interval_p50": interval_p50,
+            "interval_p90": interval_p90,
+            "interval_p99": interval_p99,
+            "interval_max": intervals.max(),
+            "jitter": jitter,
+            # -1 for a perfectly periodic stream, 0 for random arrivals, towards 1 for bursts
+            "burstiness": (jitter - mean_interval) / (jitter + mean_interval) if jitter + mean_interval > 0 else 0.0,
+            # Relative to the mean interval, as batching can pull the median down to the radio connection interval
+            "batched_fraction": np.mean(intervals < 0.25 * mean_interval),
+            "gap_fraction": np.mean(intervals > 2 * mean_interval),
+            "assembly_p50": np.percentile(assembly_times, 50),
+            "assembly_p99": np.percentile(assembly_times, 99),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._index = 0
+            self._count = 0
@@ -0,0 +1,257 @@
+import sys
+import time
+import queue
+import signal
+import socket
+import struct
+import argparse
+import threading
+import numpy as np
+
+from ble_matrix import BLEScanner, BLEConnection, MATRIX_SERVICE_UUID
+from rate_limited_log import hot_path_log
+from sampling_profiler import SamplingProfiler, profile_directory
+from virtual_matrix import VirtualMatrixConnection, load_walkway_layout, walkway_client_class
+
+
+SCAN_TIME = 10  # seconds to look for a matrix when no address is given
+STATS_INTERVAL = 5  # seconds between throughput reports
+# Binary format: completion time in ns, rows, columns, then rows * columns bytes. Rows and columns are 16 bit, as a
+# walkway of several mats can be more than 255 cells across
+FRAME_HEADER = struct.Struct("<qHH")
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Stream matrix frames without a GUI.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--address", help="connect to this device instead of scanning for one")
+    source.add_argument("--walkway", help="JSON layout of several mats to stream as one matrix, see virtual_matrix")
+    parser.add_argument("--name", help="when scanning, only accept a matrix advertising this name")
+    parser.add_argument("--scan-time", type=float, default=SCAN_TIME,
+                        help="seconds to scan for a matrix (default: %(default)s)")
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument("--output", help="file to write frames to, - for stdout")
+    destination.add_argument("--socket", help="HOST:PORT of a local TCP listener to send frames to")
+    parser.add_argument("--format", choices=("binary", "csv"), default="binary",
+                        help="binary writes a header of timestamp (int64 ns), rows and columns (uint16) before each "
+                             "frame's bytes, csv writes the timestamp and the cell values on one line per frame "
+                             "(default: %(default)s)")
+    parser.add_argument("--record", help="also record a compressed session to this directory, "
+                                         "which MatrixApp can play back")
+    parser.add_argument("--partial-frames", action="store_true",
+                        help="write frames missing parts instead of dropping them, with the missing cells holding "
+                             "their last values")
+    parser.add_argument("--duration", type=float, help="seconds to stream for (default: until interrupted)")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="sample every thread for this long from start up and save the profile to ./profiles")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help="seconds between throughput reports on stderr (default: %(default)s)")
+    arguments = parser.parse_args(arguments)
+    if arguments.output is None and arguments.socket is None and arguments.record is None:
+        parser.error("nothing to stream to, give --output, --socket or --record")
+    return arguments
+
+
+def log(message):
+    # Reports go to stderr so they never mix with frames written to stdout
+    print(message, file=sys.stderr, flush=True)
+
+
+def find_matrix_device(scan_time, name=None):
+    # Returns the address of the first matrix seen, or None if there was none within scan_time
+    def ignore(*_):
+        pass
+    scanner = BLEScanner(ignore, ignore, ignore, service_uuids=[MATRIX_SERVICE_UUID])
+    scanner.start()
+    deadline = time.perf_counter() + scan_time
+    try:
+        while time.perf_counter() < deadline:
+            for address, (device_name, has_service, _, _) in scanner.get_devices().items():
+                if has_service and (name is None or device_name == name):
+                    log("Found {} ({})".format(device_name, address))
+                    return address
+            time.sleep(0.1)
+    finally:
+        scanner.stop()
+    return None
+
+
+def open_destination(arguments):
+    # Returns a binary file-like object, or None when only recording
+    if arguments.output == "-":
+        return sys.__stdout__.buffer
+    if arguments.output is not None:
+        return open(arguments.output, "wb")
+    if arguments.socket is not None:
+        host, _, port = arguments.socket.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError("--socket must be HOST:PORT, not {}".format(arguments.socket))
+        connection = socket.create_connection((host, int(port)))
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection.makefile("wb")
+    return None
+
+
+def encode_frame(frame, output_format):
+    values = np.asarray(frame.data, dtype=np.uint8)
+    if output_format == "csv":
+        return (str(frame.completed_ns) + "," + ",".join(map(str, values.ravel().tolist())) + "\n").encode()
+    return FRAME_HEADER.pack(frame.completed_ns, values.shape[0], values.shape[1]) + values.tobytes()
+
+
+class StreamStatistics:
+    def __init__(self, connector, interval):
+        self._connector = connector
+        self._interval = interval
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self.frames = 0
+        self.bytes = 0
+        self._frames_at_last_report = 0
+        self._bytes_at_last_report = 0
+
+    def add(self, frame_bytes):
+        self.frames += 1
+        self.bytes += frame_bytes
+
+    def report_if_due(self, now):
+        if now - self._last_report >= self._interval:
+            self.report(now)
+
+    def report(self, now, final=False):
+        period = max(now - self._last_report, 1e-9)
+        frames = self.frames - self._frames_at_last_report
+        data = self.bytes - self._bytes_at_last_report
+        if final:
+            # The whole run rather than the last period
+            period = max(now - self._start, 1e-9)
+            frames = self.frames
+            data = self.bytes
+        counts = self._connector.get_frame_counts()
+        log("{:8.1f} s | {} frames {:6.1f}/s | {:7.1f} kB/s | lost {} | expired {} | partial {} | invalid {} | "
+            "dropped {} | pending {}".format(now - self._start, self.frames, frames / period, data / period / 1000,
+                                             counts["lost"], counts["expired"], counts["partial"], counts["invalid"],
+                                             counts["dropped"], self._connector.matrix_data_queue.qsize()))
+        self._last_report = now
+        self._frames_at_last_report = self.frames
+        self._bytes_at_last_report = self.bytes
+
+
+def stream(arguments):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    if not arguments.profile:
+        return stream_frames(arguments, stop_event)
+
+    # Stopped however streaming ends, so failed runs are profiled too
+    profiler = SamplingProfiler(profile_directory(), arguments.profile)
+    profiler.start()
+    try:
+        return stream_frames(arguments, stop_event)
+    finally:
+        profiler.stop()
+
+
+def stream_frames(arguments, stop_event):
+    if arguments.walkway is not None:
+        try:
+            placements = load_walkway_layout(arguments.walkway)
+            connector = VirtualMatrixConnection(placements, client_class=walkway_client_class(placements),
+                                                partial_frames=arguments.partial_frames)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log("Could not open walkway layout {}: {}".format(arguments.walkway, e))
+            return 1
+        address = ", ".join(placement.address for placement in placements)
+    else:
+        address = arguments.address
+        if address is None:
+            address = find_matrix_device(arguments.scan_time, arguments.name)
+            if address is None:
+                log("No matrix found within {} s".format(arguments.scan_time))
+                return 1
+        connector = BLEConnection(address, partial_frames=arguments.partial_frames)
+    connector.start()
+    rows, columns = connector.matrix_dimensions_queue.get()
+    if rows is None:
+        connector.stop()
+        return 1
+    log("Streaming {}x{} frames from {}".format(rows, columns, address))
+
+    statistics = StreamStatistics(connector, arguments.stats_interval)
+    destination = None
+    exit_code = 0
+    try:
+        if arguments.record is not None:
+            try:
+                recording = connector.start_recording(arguments.record)
+            except OSError as e:
+                log("Could not record to {}: {}".format(arguments.record, e))
+                return 1
+            if not recording:
+                log("Could not start recording to {}".format(arguments.record))
+                return 1
+        try:
+            destination = open_destination(arguments)
+        except (OSError, ValueError) as e:
+            # A path that cannot be opened, a listener that is not there, or a --socket without HOST:PORT
+            log("Could not open the output: {}".format(e))
+            return 1
+        deadline = None if arguments.duration is None else time.perf_counter() + arguments.duration
+        while not stop_event.is_set():
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                break
+            if not connector.get_connection_status():
+                log("Connection lost")
+                exit_code = 1
+                break
+            try:
+                frame = connector.matrix_data_queue.get(timeout=0.1)
+            except queue.Empty:
+                statistics.report_if_due(now)
+                continue
+            frame_bytes = 0
+            if destination is not None:
+                encoded = encode_frame(frame, arguments.format)
+                destination.write(encoded)
+                frame_bytes = len(encoded)
+            statistics.add(frame_bytes)
+            statistics.report_if_due(now)
+    except (BrokenPipeError, ConnectionError) as e:
+        log("Output closed: {}".format(e))
+        exit_code = 1
+    finally:
+        connector.stop()
+        # Frames completed before the connection stopped are still written
+        try:
+            while destination is not None:
+                encoded = encode_frame(connector.matrix_data_queue.get_nowait(), arguments.format)
+                destination.write(encoded)
+                statistics.add(len(encoded))
+        except (queue.Empty, OSError):
+            pass
+        if destination is not None:
+            try:
+                if destination is sys.__stdout__.buffer:
+                    destination.flush()
+                else:
+                    destination.close()
+            except OSError:
+                pass
+        hot_path_log.flush()
+        statistics.report(time.perf_counter(), final=True)
+    return exit_code
+
+
+def main():
+    arguments = parse_arguments()
+    if arguments.output == "-":
+        # Everything the BLE code prints must stay out of the frame stream
+        sys.stdout.flush()
+        sys.stdout = sys.stderr
+    sys.exit(stream(arguments))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+
+
+LATENCY_WINDOW = 1024  # Number of most recent displayed frames the statistics are computed over
+TIMESTAMP_FIELDS = ("sent_ns", "first_part_ns", "completed_ns", "queued_ns", "dequeued_ns", "submitted_ns",
+                    "presented_ns")
+# Each stage runs from one timestamp to the next, radio is only known when the sender's clock is
+LATENCY_STAGES = {
+    "radio": ("sent_ns", "first_part_ns"),  # Sending the first part to its notification arriving
+    "assembly": ("first_part_ns", "completed_ns"),  # Waiting for the remaining parts
+    "processing": ("completed_ns", "queued_ns"),  # Decoding, recording, statistics and temporal filter
+    "queueing": ("queued_ns", "dequeued_ns"),  # Waiting for the GUI to pick the frame up
+    "rendering": ("dequeued_ns", "submitted_ns"),  # Colour mapping and handing the data to dearpygui
+    "presentation": ("submitted_ns", "presented_ns"),  # Until a whole frame has been drawn with the data
+}
+UNKNOWN = -1  # Stored in place of a timestamp that was not available
+
+
+class LatencyTracker:
+    """Timestamps of displayed frames from the first notification part, or the sender when it is known, to the
+    screen, as percentiles per stage and end to end.
+
+    All timestamps are time.perf_counter_ns(), so a send timestamp is only comparable when the sender runs on the
+    same machine, as the simulated matrix does.
+    """
+    def __init__(self, window=LATENCY_WINDOW):
+        self._timestamps = np.full((window, len(TIMESTAMP_FIELDS)), UNKNOWN, dtype=np.int64)
+        self._window = window
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add_frame(self, sent_ns, first_part_ns, completed_ns, queued_ns, dequeued_ns, submitted_ns, presented_ns):
+        with self._lock:
+            row = self._timestamps[self._index]
+            row[:] = (UNKNOWN if sent_ns is None else sent_ns, first_part_ns, completed_ns, queued_ns, dequeued_ns,
+                      submitted_ns, presented_ns)
+            self._index = (self._index + 1) % self._window
+            self._count = min(self._count + 1, self._window)
+
+    def _ordered_timestamps(self):
+        with self._lock:
+            if self._count < self._window:
+                return self._timestamps[:self._count].copy()
+            return np.roll(self._timestamps, -self._index, axis=0)
+
+    def get_statistics(self):
+        # {stage: (p50, p90, p99, max) in ms}, with "total" from the earliest known timestamp to presentation
+        timestamps = self._ordered_timestamps()
+        if len(timestamps) == 0:
+            return None
+        statistics = {}
+        stages = dict(LATENCY_STAGES)
+        stages["total"] = ("sent_ns", "presented_ns")
+        for stage, (start_field, end_field) in stages.items():
+            start = timestamps[:, TIMESTAMP_FIELDS.index(start_field)]
+            end = timestamps[:, TIMESTAMP_FIELDS.index(end_field)]
+            if stage == "total":
+                first_part = timestamps[:, TIMESTAMP_FIELDS.index("first_part_ns")]
+                start = np.where(start == UNKNOWN, first_part, start)
+            known = start != UNKNOWN
+            if not known.any():
+                continue
+            durations = (end[known] - start[known]) / 1e6
+            p50, p90, p99 = np.percentile(durations, (50, 90, 99))
+            statistics[stage] = (p50, p90, p99, durations.max())
+        return statistics
+
+    def export_csv(self, path):
+        # One line per frame with its raw timestamps, followed by the duration of every stage in ms
+        timestamps = self._ordered_timestamps()
+        stage_columns = []
+        for start_field, end_field in LATENCY_STAGES.values():
+            start = timestamps[:, TIMESTAMP_FIELDS.index(start_field)]
+            end = timestamps[:, TIMESTAMP_FIELDS.index(end_field)]
+            stage_columns.append(np.where(start == UNKNOWN, np.nan, (end - start) / 1e6))
+        with open(path, "w") as csv_file:
+            csv_file.write(",".join(TIMESTAMP_FIELDS + tuple(stage + "_ms" for stage in LATENCY_STAGES)) + "\n")
+            for row, durations in zip(timestamps, zip(*stage_columns)):
+                fields = ["" if value == UNKNOWN else str(value) for value in row]
+                fields += ["" if np.isnan(duration) else "{:.3f}".format(duration) for duration in durations]
+                csv_file.write(",".join(fields) + "\n")
+        return len(timestamps)
+
+    def reset(self):
+        with self._lock:
+            self._index = 0
+            self._count = 0
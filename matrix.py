@@ -1,5 +1,12 @@
 import tkinter as tk
 import numpy as np
+from functools import lru_cache
+
+from upsampling import get_upsampler, get_block_pooler
+from rate_limited_log import hot_path_log
+
+
+LARGE_MATRIX_CELLS = 64 * 64  # Larger matrices are drawn as one image, a rectangle per cell is too slow for Tk
 
 
 colour_interpolation_values = [
@@ -42,8 +49,69 @@ def create_colourmap():
     return colour_array
 
 
+def create_rgb_colourmap(colour_map):
+    # Same colours as the hex colour map, as an array that a whole frame can be indexed into at once
+    return np.array([(int(colour[1:3], 16), int(colour[3:5], 16), int(colour[5:7], 16)) for colour in colour_map],
+                    dtype=np.uint8)
+
+
+@lru_cache(maxsize=None)
+def get_colourmap():
+    # Built once per process and shared by every Matrix, as a tuple so no canvas can change it for the others
+    return tuple(create_colourmap())
+
+
+@lru_cache(maxsize=None)
+def get_rgb_colourmap():
+    rgb_colour_map = create_rgb_colourmap(get_colourmap())
+    rgb_colour_map.flags.writeable = False
+    return rgb_colour_map
+
+
+class FrameImage:
+    """Colours whole frames into binary PPM images, so the Tk thread only has to hand them over to a PhotoImage.
+
+    With upsampling the frame is interpolated to the size of the image. Without, each cell is coloured once and
+    repeated into a block of pixels, after cells that would be smaller than a pixel are pooled into blocks. Colours
+    are moved as single three byte items, so a 255x255 frame takes a couple of ms rather than the tens a cell grid
+    or an index per pixel would.
+    """
+    def __init__(self, rows, columns, image_rows, image_columns, upsampling=None):
+        self.output_shape = (image_rows, image_columns)
+        rgb_colour_map = get_rgb_colourmap()
+        self._colour_count = len(rgb_colour_map)
+        self._pixel_colour_map = np.ascontiguousarray(rgb_colour_map).view("V3").ravel()
+        self._ppm_header = "P6 {} {} 255 ".format(image_columns, image_rows).encode()
+        self._upsampler = None
+        self._pooler = None
+        if upsampling is not None:
+            self._upsampler = get_upsampler(rows, columns, image_rows, image_columns, upsampling)
+        else:
+            self._pooler = get_block_pooler(rows, columns, max(image_rows, image_columns))
+            if self._pooler is not None:
+                rows, columns = self._pooler.output_shape
+            # Pixels per cell along each axis, nearest neighbour
+            self._row_repeats = np.bincount(np.arange(image_rows) * rows // image_rows, minlength=rows)
+            self._column_repeats = np.bincount(np.arange(image_columns) * columns // image_columns,
+                                               minlength=columns)
+
+    def colour(self, matrix_data):
+        if self._upsampler is not None:
+            values = self._upsampler.upsample(matrix_data)
+        elif self._pooler is not None:
+            values = self._pooler.pool(matrix_data)
+        else:
+            values = np.asarray(matrix_data)
+        if values.dtype != np.uint8:
+            values = np.clip(values, 0, self._colour_count - 1).astype(np.intp)
+        pixels = self._pixel_colour_map[values]
+        if self._upsampler is None:
+            pixels = np.repeat(np.repeat(pixels, self._column_repeats, axis=1), self._row_repeats, axis=0)
+        return self._ppm_header + pixels.tobytes()
+
+
 class Matrix(tk.Canvas):
-    def __init__(self, parent, rows, columns, size, **kwargs):
+    def __init__(self, parent, rows, columns, size, upsampling=None, **kwargs):
         if rows > columns:
             box_size = (size - 1) / rows
         else:
@@ -58,20 +126,32 @@ class Matrix(tk.Canvas):
         self._cell_width = box_size
         self._cell_height = box_size
         self._rectangles = []
-        self._colour_map = create_colourmap()
+        self._colour_map = get_colourmap()
         self._base_of_support_lines = None
         self._target_circle = None
         self._pressure_circle = None
 
+        # With upsampling, or too many cells for a rectangle each, the matrix is drawn as one image at canvas
+        # resolution instead of a cell grid
+        self._frame_image = None
+        self._image = None
+        if upsampling is not None or rows * columns > LARGE_MATRIX_CELLS:
+            self._frame_image = FrameImage(rows, columns, self._canvas_height - 1, self._canvas_width - 1, upsampling)
+
     def draw(self):
-        for row in range(self._rows):
-            for col in range(self._columns):
-                x1 = col * self._cell_width
-                y1 = row * self._cell_height
-                x2 = x1 + self._cell_width
-                y2 = y1 + self._cell_height
-                rectangle = self.create_rectangle(x1, y1, x2, y2, outline="#777777")
-                self._rectangles.append(rectangle)
+        if self._frame_image is not None:
+            output_rows, output_columns = self._frame_image.output_shape
+            self._image = tk.PhotoImage(width=output_columns, height=output_rows)
+            self.create_image(0, 0, image=self._image, anchor="nw")
+        else:
+            for row in range(self._rows):
+                for col in range(self._columns):
+                    x1 = col * self._cell_width
+                    y1 = row * self._cell_height
+                    x2 = x1 + self._cell_width
+                    y2 = y1 + self._cell_height
+                    rectangle = self.create_rectangle(x1, y1, x2, y2, outline="#777777")
+                    self._rectangles.append(rectangle)
 
         self._pressure_circle = self.create_oval(self._canvas_width / 2 - 5, self._canvas_height / 2 - 5,
                                                  self._canvas_width / 2 + 5, self._canvas_height / 2 + 5,
@@ -85,6 +165,11 @@ class Matrix(tk.Canvas):
     def match_colours(self, matrix_data):
         # Map each value in the matrix to a color
         if self._check_matrix_size(matrix_data):
+            if self._frame_image is not None:
+                return self._frame_image.colour(matrix_data)
+            if isinstance(matrix_data, np.ndarray):
+                # Python ints index the colour map faster than numpy scalars
+                matrix_data = matrix_data.tolist()
             try:
                 colour_matrix = [[self._colour_map[value] for value in row] for row in matrix_data]
                 return colour_matrix
@@ -94,7 +179,10 @@ class Matrix(tk.Canvas):
             return None
 
     def update_matrix(self, colour_matrix):
-        if colour_matrix:
+        if self._image is not None:
+            if colour_matrix:
+                self._image.configure(data=colour_matrix, format="PPM")
+        elif colour_matrix:
             for row in range(0, self._rows):
                 for column in range(0, self._columns):
                     self.edit_rectangle(row, column, colour_matrix[row][column])
@@ -103,7 +191,8 @@ class Matrix(tk.Canvas):
         if len(matrix) == self._rows:
             if len(matrix[self._rows - 1]) == self._columns:
                 return True
-        print("Matrix data did not match with the expected size")
+        hot_path_log.log("matrix_size", "Matrix data did not match with the expected size of {}x{}",
+                         self._rows, self._columns)
         return False
 
     def plot_centre_of_pressure(self, matrix_data):
@@ -0,0 +1,14 @@
+import os
+import time
+
+
+def unique_directory(parent, prefix):
+    # A directory path under parent that does not exist yet, named after the current time down to the millisecond
+    now = time.time()
+    name = "{}_{}_{:03d}".format(prefix, time.strftime("%Y%m%d_%H%M%S", time.localtime(now)), int(now * 1000) % 1000)
+    path = os.path.join(parent, name)
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(parent, "{}_{}".format(name, suffix))
+        suffix += 1
+    return path
@@ -0,0 +1,85 @@
+import time
+import atexit
+import threading
+from collections import deque
+
+
+LOG_INTERVAL = 1.0  # Minimum seconds between two printed messages with the same key
+LOG_FLUSH_INTERVAL = 0.25  # seconds between the writer thread's passes over the waiting messages
+LOG_QUEUE_SIZE = 1024  # Messages waiting for the writer thread before the oldest are dropped
+
+
+class RateLimitedLog:
+    """Counts every call of log() and prints at most one message per key and LOG_INTERVAL, from a thread of its own.
+
+    log() only counts the message and, when its key is due, appends the unformatted message and its arguments to a
+    queue, so it is cheap enough to call for every packet on the notification callback. Formatting and printing are
+    left to the writer thread, which notes how many messages with the same key were held back since the last one
+    printed. get_counts() returns the running count of every key, printed or not.
+    """
+    def __init__(self, interval=LOG_INTERVAL, flush_interval=LOG_FLUSH_INTERVAL, queue_size=LOG_QUEUE_SIZE):
+        self._interval_ns = int(interval * 1e9)
+        self._flush_interval = flush_interval
+        # key -> messages logged. Not locked, so threads logging the same key at once may rarely lose a count
+        self._counts = {}
+        self._next_message_ns = {}  # key -> earliest time the next message with the key is printed
+        self._pending = deque(maxlen=queue_size)  # (key, message, arguments, count)
+        self._printed_counts = {}  # key -> count at the last printed message, guarded by the writer lock
+        self._writer_thread = None
+        self._writer_lock = threading.Lock()
+
+    def log(self, key, message, *arguments):
+        # message is a str.format() template, only formatted if it is printed
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+        now = time.perf_counter_ns()
+        if now < self._next_message_ns.get(key, 0):
+            return
+        self._next_message_ns[key] = now + self._interval_ns
+        self._pending.append((key, message, arguments, count))
+        if self._writer_thread is None:
+            self._start_writer()
+
+    def get_counts(self):
+        return dict(self._counts)
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer_thread is not None:
+                return
+            self._writer_thread = threading.Thread(target=self._write_messages, daemon=True)
+            self._writer_thread.start()
+            atexit.register(self.flush)
+
+    def _write_messages(self):
+        while True:
+            time.sleep(self._flush_interval)
+            self._print_pending()
+
+    def _print_pending(self):
+        with self._writer_lock:
+            while self._pending:
+                key, message, arguments, count = self._pending.popleft()
+                held_back = count - self._printed_counts.get(key, 0) - 1
+                self._printed_counts[key] = count
+                try:
+                    text = message.format(*arguments)
+                except (IndexError, KeyError, ValueError) as e:
+                    text = "{} (could not be formatted: {})".format(message, e)
+                if held_back > 0:
+                    text += " ({} more since the last message)".format(held_back)
+                print(text)
+
+    def flush(self):
+        # Prints what is waiting, and how many messages of each key were held back since the last one printed
+        self._print_pending()
+        with self._writer_lock:
+            for key, count in list(self._counts.items()):
+                held_back = count - self._printed_counts.get(key, 0)
+                if held_back > 0:
+                    self._printed_counts[key] = count
+                    print("{}: {} more messages held back".format(key, held_back))
+
+
+# Shared by everything that reports errors from a hot path
+hot_path_log = RateLimitedLog()
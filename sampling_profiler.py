@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import threading
+
+from output_paths import unique_directory
+
+
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between samples of every thread's stack
+PROFILE_DURATION = 10  # seconds a profile runs for unless stopped sooner
+PROFILES_DIRECTORY = "./profiles"
+PROFILE_TOP_FUNCTIONS = 15  # Functions listed per thread in the summary
+
+
+def profile_directory(directory=PROFILES_DIRECTORY):
+    # Created straight away, so profiles started one after the other never share it
+    path = unique_directory(directory, "profile")
+    os.makedirs(path)
+    return path
+
+
+class SamplingProfiler:
+    """Samples the stack of every thread of the process at a fixed interval, from a thread of its own.
+
+    Nothing is hooked into the profiled code, so the only cost to the app is the sampling thread taking the GIL for
+    a moment every interval, and time is attributed to the thread that spent it, which cProfile cannot do. The
+    samples are wall clock time: a thread blocked waiting shows up in the function it waits in, e.g. the bleak loop
+    thread in select(). Once the duration is up or stop() is called, the directory gets a collapsed stack file per
+    thread and one of all threads, each line a semicolon separated stack and its sample count as flamegraph.pl and
+    speedscope read them, and a summary.txt of every thread's hottest functions.
+    """
+    def __init__(self, directory, duration=PROFILE_DURATION, interval=PROFILE_SAMPLE_INTERVAL):
+        self.directory = directory
+        self._duration = duration
+        self._interval = interval
+        self._stacks = {}  # thread ident -> {tuple of code objects, outermost first: samples}
+        self._thread_names = {}  # thread ident -> name
+        self._samples = 0
+        self._sampling_time = 0.0  # seconds spent taking samples
+        self._stop_event = threading.Event()
+        self._profiler_thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+
+    def start(self):
+        self._profiler_thread.start()
+
+    def stop_soon(self):
+        # Ends the profile early without waiting for the files to be written
+        self._stop_event.set()
+
+    def stop(self):
+        # Ends the profile early, the files are written before this returns
+        self._stop_event.set()
+        if self._profiler_thread.is_alive():
+            self._profiler_thread.join()
+
+    def is_running(self):
+        return self._profiler_thread.is_alive()
+
+    def _run(self):
+        start = time.perf_counter()
+        next_sample = start
+        while not self._stop_event.is_set() and next_sample - start < self._duration:
+            sample_start = time.perf_counter()
+            self._sample()
+            self._sampling_time += time.perf_counter() - sample_start
+            next_sample += self._interval
+            self._stop_event.wait(max(0.0, next_sample - time.perf_counter()))
+        self._write(time.perf_counter() - start)
+
+    def _sample(self):
+        own_ident = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if ident not in self._thread_names:
+                self._thread_names.update((thread.ident, thread.name) for thread in threading.enumerate())
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            stack = tuple(stack)
+            thread_stacks = self._stacks.setdefault(ident, {})
+            thread_stacks[stack] = thread_stacks.get(stack, 0) + 1
+        self._samples += 1
+
+    def _thread_label(self, ident):
+        return "{} ({})".format(self._thread_names.get(ident, "Thread"), ident)
+
+    def _write(self, elapsed):
+        labels = {}
+
+        def label(code):
+            if code not in labels:
+                # Semicolons separate the frames of a collapsed stack
+                labels[code] = "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename),
+                                                   code.co_firstlineno).replace(";", ",")
+            return labels[code]
+
+        os.makedirs(self.directory, exist_ok=True)
+        summary = ["{} samples over {:.1f} s, sampling took {:.2f}% of one core".format(
+            self._samples, elapsed, 100 * self._sampling_time / max(elapsed, 1e-9))]
+        with open(os.path.join(self.directory, "all_threads.collapsed"), "w") as all_threads_file:
+            for ident, thread_stacks in self._stacks.items():
+                thread_label = self._thread_label(ident)
+                file_name = "".join(character if character.isalnum() else "_" for character in thread_label)
+                with open(os.path.join(self.directory, file_name.strip("_") + ".collapsed"), "w") as thread_file:
+                    for stack, count in thread_stacks.items():
+                        collapsed = ";".join(label(code) for code in stack)
+                        thread_file.write("{} {}\n".format(collapsed, count))
+                        all_threads_file.write("{};{} {}\n".format(thread_label.replace(";", ","), collapsed, count))
+                summary.extend(self._summarise_thread(thread_label, thread_stacks, label))
+
+        summary_path = os.path.join(self.directory, "summary.txt")
+        with open(summary_path, "w") as summary_file:
+            summary_file.write("\n".join(summary) + "\n")
+        print("Profile saved to {}".format(self.directory))
+
+    @staticmethod
+    def _summarise_thread(thread_label, thread_stacks, label):
+        # Self samples count the innermost frame only, total samples every function on the stack once
+        samples = sum(thread_stacks.values())
+        self_samples = {}
+        total_samples = {}
+        for stack, count in thread_stacks.items():
+            self_samples[stack[-1]] = self_samples.get(stack[-1], 0) + count
+            for code in set(stack):
+                total_samples[code] = total_samples.get(code, 0) + count
+        lines = ["", "{}, {} samples".format(thread_label, samples),
+                 "  {:>7} {:>7}  {}".format("Self", "Total", "Function")]
+        hottest = sorted(total_samples, key=lambda code: (self_samples.get(code, 0), total_samples[code]),
+                         reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        for code in hottest:
+            lines.append("  {:>6.1f}% {:>6.1f}%  {}".format(100 * self_samples.get(code, 0) / samples,
+                                                            100 * total_samples[code] / samples, label(code)))
+        return lines
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import numpy as np
+
+from session_recorder import SESSION_INDEX_FILE, TIMESTAMPS_FILE
+
+
+class SessionPlayer:
+    """Plays back a directory written by SessionRecorder.
+
+    Opening only reads the small session index and memory-maps the timestamp column, so it takes the same time
+    for any session length. Seeking is a binary search over the mapped timestamps, and only the compressed chunk
+    holding the current frame is decoded and kept in memory.
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, SESSION_INDEX_FILE)) as index_file:
+            index = json.load(index_file)
+        self.directory = directory
+        self.rows = index["rows"]
+        self.columns = index["columns"]
+        self.frame_count = index["frames"]
+        self._chunk_frames = index["chunk_frames"]
+        self._chunk_files = [chunk["file"] for chunk in index["chunks"]]
+        if self.frame_count == 0:
+            raise ValueError("Session {} contains no frames".format(directory))
+
+        # The timestamp file can run ahead of the index if the recording was cut off while writing a chunk
+        self._timestamps = np.memmap(os.path.join(directory, TIMESTAMPS_FILE), dtype=np.int64, mode="r",
+                                     shape=(self.frame_count,))
+        self.start_ns = int(self._timestamps[0])
+        self.duration_ns = int(self._timestamps[-1]) - self.start_ns
+
+        self._cached_chunk_number = None
+        self._cached_chunk = None
+
+        # Playback clock, positions are nanoseconds from the first frame
+        self._playing = False
+        self._speed = 1.0
+        self._position_ns = 0
+        self._clock_reference_ns = 0
+
+    def frame_index_at(self, position_ns):
+        # Last frame recorded at or before the position
+        index = np.searchsorted(self._timestamps, self.start_ns + position_ns, side="right") - 1
+        return min(max(int(index), 0), self.frame_count - 1)
+
+    def get_frame(self, frame_index):
+        # Every chunk but the last one is full, so the chunk number follows from the frame index
+        chunk_number, chunk_offset = divmod(frame_index, self._chunk_frames)
+        if chunk_number != self._cached_chunk_number:
+            with np.load(os.path.join(self.directory, self._chunk_files[chunk_number])) as chunk:
+                self._cached_chunk = chunk["frames"]
+            self._cached_chunk_number = chunk_number
+        return self._cached_chunk[chunk_offset]
+
+    def get_timestamp(self, frame_index):
+        return int(self._timestamps[frame_index])
+
+    def get_position(self):
+        if self._playing:
+            position = self._position_ns + (time.perf_counter_ns() - self._clock_reference_ns) * self._speed
+            if position >= self.duration_ns:
+                self._playing = False
+                self._position_ns = self.duration_ns
+                return self._position_ns
+            return int(position)
+        return self._position_ns
+
+    def current_frame_index(self):
+        return self.frame_index_at(self.get_position())
+
+    def is_playing(self):
+        return self._playing
+
+    def play(self):
+        if self._playing:
+            return
+        if self._position_ns >= self.duration_ns:
+            self._position_ns = 0
+        self._clock_reference_ns = time.perf_counter_ns()
+        self._playing = True
+
+    def pause(self):
+        self._position_ns = self.get_position()
+        self._playing = False
+
+    def seek(self, position_ns):
+        self._position_ns = min(max(int(position_ns), 0), self.duration_ns)
+        self._clock_reference_ns = time.perf_counter_ns()
+
+    def set_speed(self, speed):
+        # Restart the clock from the current position so the change does not make playback jump
+        self._position_ns = self.get_position()
+        self._clock_reference_ns = time.perf_counter_ns()
+        self._speed = speed
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from queue import Queue, Empty
+
+
+SESSION_INDEX_FILE = "session.json"
+TIMESTAMPS_FILE = "timestamps.bin"  # Raw int64 perf_counter_ns of every frame, in recording order
+CHUNK_FILE_FORMAT = "chunk_{:06d}.npz"
+CHUNK_FRAMES = 1024  # Frames per compressed chunk
+MAX_PENDING_CHUNKS = 4  # Full chunks waiting for compression before new frames are dropped
+
+
+class SessionRecorder:
+    """Streams decoded frames to a directory of compressed (N, rows, columns) chunks.
+
+    add_frame() only copies the frame into a preallocated chunk buffer, compression and file I/O run on a
+    background thread. Memory is bounded by MAX_PENDING_CHUNKS + 1 chunk buffers: if the writer falls that far
+    behind, frames are dropped and counted rather than blocking the caller.
+    """
+    def __init__(self, directory, rows, columns, dtype=np.uint8, chunk_frames=CHUNK_FRAMES,
+                 max_pending_chunks=MAX_PENDING_CHUNKS):
+        os.makedirs(directory, exist_ok=False)
+        self.directory = directory
+        self._rows = rows
+        self._columns = columns
+        self._dtype = np.dtype(dtype)
+        self._chunk_frames = chunk_frames
+
+        self._free_buffers = Queue()
+        for _ in range(max_pending_chunks + 1):
+            self._free_buffers.put((np.empty((chunk_frames, rows, columns), dtype=self._dtype),
+                                    np.empty(chunk_frames, dtype=np.int64)))
+        self._full_buffers = Queue()
+        self._frames = None
+        self._timestamps = None
+        self._count = 0
+
+        self.recorded_frames = 0
+        self.dropped_frames = 0
+        self._chunks = []
+        self._start_time = time.time()
+        self._start_ns = time.perf_counter_ns()
+        self._closed = False
+
+        self._writer_thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._writer_thread.start()
+
+    def add_frame(self, frame, timestamp_ns):
+        if self._frames is None:
+            try:
+                self._frames, self._timestamps = self._free_buffers.get_nowait()
+            except Empty:
+                self.dropped_frames += 1
+                return
+        np.copyto(self._frames[self._count], frame, casting="unsafe")
+        self._timestamps[self._count] = timestamp_ns
+        self._count += 1
+        self.recorded_frames += 1
+        if self._count == self._chunk_frames:
+            self._hand_over_chunk()
+
+    def _hand_over_chunk(self):
+        self._full_buffers.put((self._frames, self._timestamps, self._count))
+        self._frames = None
+        self._timestamps = None
+        self._count = 0
+
+    def _write_chunks(self):
+        with open(os.path.join(self.directory, TIMESTAMPS_FILE), "ab") as timestamps_file:
+            while True:
+                chunk = self._full_buffers.get()
+                if chunk is None:
+                    break
+                frames, timestamps, count = chunk
+                chunk_file = CHUNK_FILE_FORMAT.format(len(self._chunks))
+                np.savez_compressed(os.path.join(self.directory, chunk_file),
+                                    frames=frames[:count], timestamps=timestamps[:count])
+                timestamps_file.write(timestamps[:count].tobytes())
+                timestamps_file.flush()
+                self._chunks.append({"file": chunk_file, "frames": count,
+                                     "first_ns": int(timestamps[0]), "last_ns": int(timestamps[count - 1])})
+                self._free_buffers.put((frames, timestamps))
+                self._write_index()
+
+    def _write_index(self):
+        # Rewritten after every chunk so a session that ends abruptly is still readable up to its last chunk
+        index = {
+            "rows": self._rows,
+            "columns": self._columns,
+            "dtype": self._dtype.name,
+            "chunk_frames": self._chunk_frames,
+            "frames": sum(chunk["frames"] for chunk in self._chunks),
+            "dropped_frames": self.dropped_frames,
+            "start_time": self._start_time,
+            "start_ns": self._start_ns,
+            "chunks": self._chunks,
+        }
+        index_path = os.path.join(self.directory, SESSION_INDEX_FILE)
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump(index, index_file, indent=2)
+        os.replace(index_path + ".tmp", index_path)
+
+    def close(self):
+        # Call from the thread that adds frames, once no more frames will be added
+        if self._closed:
+            return
+        self._closed = True
+        if self._count > 0:
+            self._hand_over_chunk()
+        self._full_buffers.put(None)
+        self._writer_thread.join()
+        self._write_index()
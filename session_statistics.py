@@ -0,0 +1,88 @@
+import threading
+import numpy as np
+
+
+TIME_ABOVE_THRESHOLD = 10  # Cell value counted as loaded for the time above threshold map
+
+
+class SessionStatistics:
+    """Running per-cell statistics over a whole session, using O(rows * columns) memory however long it runs.
+
+    Mean and variance use Welford's update, applied to every cell at once, so there is no sum that grows with
+    the session to lose precision. update() is called for every decoded frame, get_map() from the GUI.
+    """
+    def __init__(self, rows, columns, threshold=TIME_ABOVE_THRESHOLD):
+        self._threshold = threshold
+        self.count = 0
+        self._mean = np.zeros((rows, columns), dtype=np.float64)
+        self._m2 = np.zeros((rows, columns), dtype=np.float64)  # Sum of squared differences from the mean
+        self._minimum = np.zeros((rows, columns), dtype=np.float64)
+        self._maximum = np.zeros((rows, columns), dtype=np.float64)
+        self._peak_hold = np.zeros((rows, columns), dtype=np.float64)  # Maximum since the last reset_peak_hold()
+        self._time_above_threshold = np.zeros((rows, columns), dtype=np.float64)  # seconds
+        self._last_timestamp_ns = None
+
+        self._frame = np.empty((rows, columns), dtype=np.float64)
+        self._delta = np.empty((rows, columns), dtype=np.float64)
+        self._step = np.empty((rows, columns), dtype=np.float64)
+        self._above = np.empty((rows, columns), dtype=bool)
+        self._lock = threading.Lock()
+
+    def update(self, frame, timestamp_ns):
+        with self._lock:
+            np.copyto(self._frame, frame, casting="unsafe")
+            self.count += 1
+            if self.count == 1:
+                np.copyto(self._minimum, self._frame)
+                np.copyto(self._maximum, self._frame)
+            else:
+                np.minimum(self._minimum, self._frame, out=self._minimum)
+                np.maximum(self._maximum, self._frame, out=self._maximum)
+            np.maximum(self._peak_hold, self._frame, out=self._peak_hold)
+
+            np.subtract(self._frame, self._mean, out=self._delta)
+            np.divide(self._delta, self.count, out=self._step)
+            self._mean += self._step
+            # m2 += (x - old mean) * (x - new mean)
+            np.subtract(self._frame, self._mean, out=self._frame)
+            self._delta *= self._frame
+            self._m2 += self._delta
+
+            # Each frame stands for the time since the previous one
+            if self._last_timestamp_ns is not None:
+                np.greater(frame, self._threshold, out=self._above)
+                np.add(self._time_above_threshold, (timestamp_ns - self._last_timestamp_ns) / 1e9,
+                       out=self._time_above_threshold, where=self._above)
+            self._last_timestamp_ns = timestamp_ns
+
+    def get_map(self, statistic):
+        # Returns a copy, safe to use while update() carries on from another thread
+        with self._lock:
+            if statistic == "mean":
+                return self._mean.copy()
+            if statistic == "variance":
+                return self._m2 / self.count if self.count > 1 else np.zeros_like(self._m2)
+            if statistic == "minimum":
+                return self._minimum.copy()
+            if statistic == "maximum":
+                return self._maximum.copy()
+            if statistic == "peak":
+                return self._peak_hold.copy()
+            if statistic == "time_above_threshold":
+                return self._time_above_threshold.copy()
+        raise ValueError("Unknown statistic: {}".format(statistic))
+
+    def reset_peak_hold(self):
+        with self._lock:
+            self._peak_hold.fill(0)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self._mean.fill(0)
+            self._m2.fill(0)
+            self._minimum.fill(0)
+            self._maximum.fill(0)
+            self._peak_hold.fill(0)
+            self._time_above_threshold.fill(0)
+            self._last_timestamp_ns = None
@@ -0,0 +1,98 @@
+import time
+import struct
+import asyncio
+import numpy as np
+
+
+SIMULATED_ADDRESS = "Simulated"  # Address the GUI connects to for the simulated matrix
+SIMULATED_ROWS = 16
+SIMULATED_COLUMNS = 16
+SIMULATED_FRAME_RATE = 100  # frames per second
+PART_PAYLOAD_SIZE = 241  # Payload bytes per notification, what fits a 247 byte ATT MTU after the 3 byte header
+MAXIMUM_PARTS = 255  # Notifications a frame can be split into with the one byte part count
+SEND_TIMESTAMP = struct.Struct("<q")  # Overwrites the first cells of every frame
+
+
+def read_send_timestamp(payload):
+    return SEND_TIMESTAMP.unpack_from(payload)[0]
+
+
+class SimulatedMatrixClient:
+    """Stands in for BleakClient with a matrix that streams a moving pressure blob on the same event loop.
+
+    Frames are split into notifications with the same frame id, part count and part number header as the real
+    device, and every frame carries time.perf_counter_ns() at the moment its first part was sent in its first
+    eight cells, so the receiving side can measure latency against the sender's clock. packet_loss is the
+    probability of each notification being dropped, as a busy radio would.
+    """
+    embeds_send_timestamps = True
+
+    # noinspection PyUnusedLocal
+    def __init__(self, address, disconnected_callback=None, rows=SIMULATED_ROWS, columns=SIMULATED_COLUMNS,
+                 frame_rate=SIMULATED_FRAME_RATE, part_payload_size=PART_PAYLOAD_SIZE, packet_loss=0.0):
+        if rows * columns < SEND_TIMESTAMP.size:
+            raise ValueError("A simulated matrix needs at least {} cells".format(SEND_TIMESTAMP.size))
+        self.address = address
+        self.is_connected = False
+        self._rows = rows
+        self._columns = columns
+        self._frame_interval_ns = int(1e9 / frame_rate)
+        # The part count is a single byte, so the largest matrices need bigger parts, as they would a bigger MTU
+        self._part_payload_size = max(part_payload_size, -(-rows * columns // MAXIMUM_PARTS))
+        self._packet_loss = packet_loss
+        self._random = np.random.default_rng()
+        self._ys, self._xs = np.indices((rows, columns))
+        self._task = None
+
+    async def __aenter__(self):
+        self.is_connected = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    # noinspection PyUnusedLocal
+    async def read_gatt_char(self, characteristic):
+        return struct.pack('<BB', self._rows, self._columns)
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        pass
+
+    # noinspection PyUnusedLocal
+    async def start_notify(self, characteristic, callback):
+        self._task = asyncio.get_running_loop().create_task(self._send_frames(callback))
+
+    # noinspection PyUnusedLocal
+    async def stop_notify(self, characteristic):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def disconnect(self):
+        await self.stop_notify(None)
+        self.is_connected = False
+
+    def _pressure_frame(self, t):
+        # A blob circling the middle of the matrix
+        centre_x = (self._columns - 1) * (0.5 + 0.3 * np.cos(t))
+        centre_y = (self._rows - 1) * (0.5 + 0.3 * np.sin(t))
+        radius = max(self._rows, self._columns) / 5
+        distance_squared = (self._xs - centre_x) ** 2 + (self._ys - centre_y) ** 2
+        return (255 * np.exp(-distance_squared / (2 * radius ** 2))).astype(np.uint8)
+
+    async def _send_frames(self, callback):
+        frame_id = 0
+        next_frame_ns = time.perf_counter_ns()
+        while self.is_connected:
+            payload = bytearray(self._pressure_frame(next_frame_ns / 1e9).tobytes())
+            parts = [payload[start:start + self._part_payload_size]
+                     for start in range(0, len(payload), self._part_payload_size)]
+            SEND_TIMESTAMP.pack_into(parts[0], 0, time.perf_counter_ns())
+            for part_number, part in enumerate(parts):
+                if self._packet_loss and self._random.random() < self._packet_loss:
+                    continue
+                callback(None, bytearray((frame_id, len(parts), part_number)) + part)
+            frame_id = (frame_id + 1) % 256
+
+            next_frame_ns += self._frame_interval_ns
+            await asyncio.sleep(max(0, next_frame_ns - time.perf_counter_ns()) / 1e9)
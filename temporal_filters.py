@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class TemporalFilter:
+    """Per-cell filter over consecutive frames. All state is allocated up front for a fixed matrix size.
+
+    apply() returns an internal buffer that is overwritten by the next call, copy it if it needs to be kept.
+    """
+    def __init__(self, rows, columns):
+        self._output = np.zeros((rows, columns), dtype=np.float32)
+        self._primed = False
+
+    def apply(self, frame):
+        if not self._primed:
+            np.copyto(self._output, frame, casting="unsafe")
+            self._primed = True
+            return self._output
+        self._update(frame)
+        return self._output
+
+    def _update(self, frame):
+        raise NotImplementedError
+
+    def reset(self):
+        self._primed = False
+
+
+class ExponentialMovingAverageFilter(TemporalFilter):
+    def __init__(self, rows, columns, alpha=0.3):
+        super().__init__(rows, columns)
+        self._alpha = alpha
+        self._difference = np.empty((rows, columns), dtype=np.float32)
+
+    def _update(self, frame):
+        np.subtract(frame, self._output, out=self._difference, casting="unsafe")
+        self._difference *= self._alpha
+        self._output += self._difference
+
+
+class WindowedFilter(TemporalFilter):
+    # Keeps the last window frames in a ring buffer
+    def __init__(self, rows, columns, window=5):
+        super().__init__(rows, columns)
+        self._window = window
+        self._frames = np.zeros((window, rows, columns), dtype=np.float32)
+        self._index = 0
+        self._count = 0
+
+    def apply(self, frame):
+        self._update(frame)
+        return self._output
+
+    def _push(self, frame):
+        np.copyto(self._frames[self._index], frame, casting="unsafe")
+        self._index = (self._index + 1) % self._window
+        self._count = min(self._count + 1, self._window)
+
+    def reset(self):
+        self._index = 0
+        self._count = 0
+
+
+class MovingAverageFilter(WindowedFilter):
+    def __init__(self, rows, columns, window=5):
+        super().__init__(rows, columns, window)
+        self._sum = np.zeros((rows, columns), dtype=np.float64)
+
+    def _update(self, frame):
+        # The running sum drops the frame about to be overwritten, so each update touches two frames only
+        if self._count == self._window:
+            self._sum -= self._frames[self._index]
+        self._push(frame)
+        self._sum += self._frames[self._index - 1]
+        np.divide(self._sum, self._count, out=self._output, casting="unsafe")
+
+    def reset(self):
+        super().reset()
+        self._sum.fill(0)
+
+
+class RunningMedianFilter(WindowedFilter):
+    def __init__(self, rows, columns, window=5):
+        super().__init__(rows, columns, window)
+        self._scratch = np.empty((window + 1, rows, columns), dtype=np.float32)
+
+    def _update(self, frame):
+        self._push(frame)
+        count = self._count
+        # Sort each cell across the window with an odd-even transposition network of element-wise min/max,
+        # which stays vectorised over the whole frame unlike np.median or np.partition along the window axis
+        np.copyto(self._scratch[:count], self._frames[:count])
+        slots = list(self._scratch[:count])
+        spare = self._scratch[count]
+        for sorting_pass in range(count):
+            for i in range(sorting_pass % 2, count - 1, 2):
+                np.minimum(slots[i], slots[i + 1], out=spare)
+                np.maximum(slots[i], slots[i + 1], out=slots[i + 1])
+                slots[i], spare = spare, slots[i]
+        middle = count // 2
+        if count % 2:
+            np.copyto(self._output, slots[middle])
+        else:
+            np.add(slots[middle - 1], slots[middle], out=self._output)
+            self._output *= 0.5
+
+
+class DeadBandFilter(TemporalFilter):
+    # Hysteresis: a cell only changes once the new reading moves more than band away from the displayed value
+    def __init__(self, rows, columns, band=4):
+        super().__init__(rows, columns)
+        self._band = band
+        self._difference = np.empty((rows, columns), dtype=np.float32)
+        self._changed = np.empty((rows, columns), dtype=bool)
+
+    def _update(self, frame):
+        np.subtract(frame, self._output, out=self._difference, casting="unsafe")
+        np.abs(self._difference, out=self._difference)
+        np.greater(self._difference, self._band, out=self._changed)
+        np.copyto(self._output, frame, casting="unsafe", where=self._changed)
+
+
+TEMPORAL_FILTERS = {
+    "ema": ExponentialMovingAverageFilter,
+    "moving_average": MovingAverageFilter,
+    "median": RunningMedianFilter,
+    "dead_band": DeadBandFilter,
+}
+
+
+def create_temporal_filter(kind, rows, columns, **settings):
+    if kind is None:
+        return None
+    if kind not in TEMPORAL_FILTERS:
+        raise ValueError("Unknown temporal filter: {}".format(kind))
+    return TEMPORAL_FILTERS[kind](rows, columns, **settings)
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+TEXTURE_SIZE = 256  # Most texels along the longest side of an unsmoothed heatmap texture
+COLOUR_LUT_SIZE = 256
+
+
+def create_colour_lut(colour_values, scale_max=255, size=COLOUR_LUT_SIZE):
+    # Samples the colour map the way a non-qualitative plot colormap spreads its colours over the scale,
+    # returning float32 RGBA in 0..1 indexed by value * (size - 1) / scale_max
+    colours = np.asarray(colour_values, dtype=np.float32) / 255
+    positions = np.linspace(0, len(colours) - 1, size)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(colours) - 1)
+    fraction = (positions - lower)[:, None]
+    return np.ascontiguousarray(colours[lower] * (1 - fraction) + colours[upper] * fraction, dtype=np.float32)
+
+
+class TextureHeatmap:
+    """Maps frames through a colour LUT into one preallocated float32 RGBA buffer for a raw dynamic texture.
+
+    Without an upsampler every cell becomes a block of identical texels, so the GPU's linear filtering only
+    blends the block edges and the cells stay sharp. With an upsampler the texture is the upsampled frame, and with
+    a downsampler, for matrices with more cells than the plot has pixels, each texel is a pooled block of cells.
+    The same buffer is returned for every frame, ready to be passed to dpg.set_value on the texture.
+    """
+    def __init__(self, rows, columns, colour_values, upsampler=None, scale_max=255, texture_size=TEXTURE_SIZE,
+                 downsampler=None):
+        self._lut = create_colour_lut(colour_values, scale_max)
+        self._lut_scale = (len(self._lut) - 1) / scale_max
+        self._upsampler = upsampler
+        self._downsampler = downsampler
+        if downsampler is not None:
+            rows, columns = downsampler.output_shape
+        if upsampler is not None:
+            self.height, self.width = upsampler.output_shape
+            self._block = None
+        else:
+            self._block = max(1, texture_size // max(rows, columns))
+            self.height, self.width = rows * self._block, columns * self._block
+            self._cell_colours = np.empty((rows, columns, 4), dtype=np.float32)
+        colour_shape = upsampler.output_shape if upsampler is not None else (rows, columns)
+        self._scaled = np.empty(colour_shape, dtype=np.float32)
+        self._indices = np.empty(colour_shape, dtype=np.intp)
+        self.buffer = np.zeros((self.height, self.width, 4), dtype=np.float32)
+        if self._block is not None:
+            # View of the texture as (row, texel row, column, texel column, RGBA) to fill whole blocks at once
+            self._blocks = self.buffer.reshape(rows, self._block, columns, self._block, 4)
+
+    def _colour_indices(self, values):
+        np.multiply(values, self._lut_scale, out=self._scaled, casting="unsafe")
+        np.clip(self._scaled, 0, len(self._lut) - 1, out=self._scaled)
+        np.copyto(self._indices, self._scaled, casting="unsafe")
+        return self._indices
+
+    def render(self, frame):
+        if self._upsampler is not None:
+            indices = self._colour_indices(self._upsampler.upsample(frame))
+            np.take(self._lut, indices, axis=0, out=self.buffer)
+        else:
+            if self._downsampler is not None:
+                frame = self._downsampler.pool(frame)
+            indices = self._colour_indices(frame)
+            np.take(self._lut, indices, axis=0, out=self._cell_colours)
+            self._blocks[...] = self._cell_colours[:, None, :, None, :]
+        return self.buffer
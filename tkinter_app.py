@@ -1,15 +1,20 @@
 import time
 import struct
 import asyncio
+import argparse
 import threading
 import numpy as np
+from collections import deque
 import tkinter as tk
 from tkinter import ttk
 from tkinter import font
-from bleak import BleakClient
-from bleak import BleakScanner
 
 from matrix import Matrix
+from ble_matrix import BLEFrameAssembler
+from deferred_imports import preload_modules
+from sampling_profiler import SamplingProfiler, profile_directory
+
+# bleak is imported where it is first used, so the window does not wait for it
 
 
 # noinspection SpellCheckingInspection
@@ -18,7 +23,15 @@ MATRIX_SERVICE_UUID = BASE_UUID.replace("XXXX", "1623").lower()
 MATRIX_DIMENSIONS_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1624").lower()
 MATRIX_DATA_CHARACTERISTIC_UUID = BASE_UUID.replace("XXXX", "1625").lower()
 SCAN_TIME = 10
+RSSI_HISTORY_LENGTH = 10  # Number of RSSI readings kept per scanned device
 GRID_SIZE = 500
+MATRIX_UPSAMPLING = None  # "bilinear" or "bicubic" draws a smoothed image instead of a grid of cells
+RECONNECT_INITIAL_DELAY = 0.5  # seconds before the first reconnect attempt, doubled after every failed attempt
+RECONNECT_MAXIMUM_DELAY = 8.0  # seconds, upper bound of the backoff
+RECONNECT_ATTEMPTS = 10  # Failed attempts in a row before giving up on the device
+RENDER_INTERVAL_MS = 16  # Delay from the end of one draw to the next render tick
+RENDER_REPORT_INTERVAL = 5  # seconds between rendering reports
+DEFERRED_MODULES = ("bleak",)  # Imported in the background once the window is up
 
 
 def remap_matrix(matrix, threshold):
@@ -29,25 +42,37 @@ def remap_matrix(matrix, threshold):
     return np.fliplr(remapped_matrix)
 
 
+_font_name = None
+
+
+def get_font_name():
+    # font.families() asks Tk for every installed font, so it is only done for the first widget
+    global _font_name
+    if _font_name is None:
+        if "JetBrains Mono" in font.families():
+            _font_name = "JetBrains Mono"
+        else:
+            _font_name = "Consolas"
+    return _font_name
+
+
 def create_widget(parent, widget_type, *args, **kwargs):
     widget = widget_type(parent, *args, **kwargs)
 
     widget.config(background="#2b2b2b", borderwidth=0, relief=tk.FLAT)
     # Apply the styling based on the current mode (light/dark)
-    if widget_type is tk.Canvas or widget_type is Matrix:
+    if issubclass(widget_type, tk.Canvas):  # Including Matrix
         widget.config(highlightthickness=0)
-    if widget_type is tk.Label or widget_type is tk.Listbox or widget_type is tk.Button:
-        available_fonts = font.families()
-        if "JetBrains Mono" in available_fonts:  # Should print True if installed
-            font_name="JetBrains Mono"
-        else:
-            font_name = "Consolas"
-        widget.config(foreground="#a8b5c4", font=(font_name, 12))
+    if widget_type is tk.Label or widget_type is tk.Listbox or widget_type is tk.Button or widget_type is tk.Checkbutton:
+        widget.config(foreground="#a8b5c4", font=(get_font_name(), 12))
     if widget_type is tk.Button:
         widget.config(highlightbackground="#2b2b2b", activebackground="#485254",
                       activeforeground="#a8b5c4", background="#3c3f41", width=15, padx=2, pady=2)
     if widget_type is tk.Listbox:
         widget.config(exportselection=False, background="#3c3f41", height=5, activestyle="none")
+    if widget_type is tk.Checkbutton:
+        widget.config(activebackground="#2b2b2b", activeforeground="#a8b5c4", selectcolor="#3c3f41",
+                      highlightthickness=0)
     return widget
 
 
@@ -63,83 +88,39 @@ def decode_matrix_dimensions(byte_array):
 
 
 def decode_matrix_data(byte_array, rows, columns):
-    # Unpack the byte array into a flat list of integers
-    unpacked_matrix_data = struct.unpack("<" + (rows * columns * "B"), byte_array)
-    # Reshape the flat list into a 2D matrix
-    matrix_data = [unpacked_matrix_data[i * columns:(i + 1) * columns] for i in range(rows)]
-
-    return matrix_data
-
-
-class BLEFrameAssembler:
-    def __init__(self, timeout=1.0):
-        self.frames = {}  # frame_id -> list of parts
-        self.expected_parts = {}  # frame_id -> total_parts
-        self.timestamps = {}  # frame_id -> timestamp
-        self.timeout = timeout  # seconds
-
-    def construct_data(self, data: bytes):
-        now = time.time()
-
-        # Clean up old frames
-        self._cleanup_old_frames(now)
-
-        if len(data) < 3:
-            print("Invalid packet: too short")
-            return None
-
-        frame_id = data[0]
-        total_parts = data[1]
-        part_number = data[2]
-        payload = data[3:]
-
-        # Ignore invalid part numbers
-        if part_number >= total_parts:
-            print(f"Invalid part number {part_number} for frame {frame_id}")
-            return None
-
-        # Initialize frame if new
-        if frame_id not in self.frames:
-            self.frames[frame_id] = [None] * total_parts
-            self.expected_parts[frame_id] = total_parts
-            self.timestamps[frame_id] = now
-
-        # Store the part
-        self.frames[frame_id][part_number] = payload
-
-        # Check if all parts are received
-        if all(part is not None for part in self.frames[frame_id]):
-            full_payload = b''.join(self.frames[frame_id])
-
-            # Cleanup
-            del self.frames[frame_id]
-            del self.expected_parts[frame_id]
-            del self.timestamps[frame_id]
-
-            # print(f"Frame {frame_id} reassembled successfully.")
-            return full_payload
+    # A read-only uint8 view of the payload, no per-cell work even for a 255x255 matrix
+    return np.frombuffer(byte_array, dtype=np.uint8, count=rows * columns).reshape(rows, columns)
 
-        return None  # Not yet complete
 
-    def _cleanup_old_frames(self, current_time):
-        expired = [fid for fid, t in self.timestamps.items()
-                   if current_time - t > self.timeout]
-        for fid in expired:
-            print(f"Frame {fid} expired. Cleaning up.")
-            self.frames.pop(fid, None)
-            self.expected_parts.pop(fid, None)
-            self.timestamps.pop(fid, None)
+class ScannedDevice:
+    def __init__(self, address, name, has_service, listbox_index):
+        self.address = address
+        self.name = name
+        self.has_service = has_service
+        self.listbox_index = listbox_index
+        self.rssi_history = deque(maxlen=RSSI_HISTORY_LENGTH)
 
 
 class App:
     def __init__(self, name):
         # Variables
         self._stay_connected = False
-        self._devices = [[], [], []]
+        self._devices = {}  # address -> ScannedDevice
+        self._device_addresses = []  # listbox index -> address
+        self._matrix_devices_only = tk.BooleanVar(value=False)
         self._data_assembler = BLEFrameAssembler()
         self._assembled_data_count = 0
         self._data_rate_start_time = 0
-        self._update_matrix = False
+        # Only the most recent frame waits for the render tick, a newer one replaces it
+        self._latest_matrix = None
+        self._latest_matrix_lock = threading.Lock()
+        self._superseded_frames = 0  # Frames replaced in the slot before they were drawn
+        self._render_job = None
+        self._render_times = []  # Seconds per draw since the last report
+        self._render_report_time = 0
+        self._reconnect_attempt = 0
+        self._disconnected_time = None  # When the link dropped, until the first frame after reconnecting
+        self._recovery_times = []  # Seconds from each disconnect to the first frame after it
 
         # Tkinter
         self.root = tk.Tk()
@@ -155,7 +136,6 @@ class App:
         self.heat_canvas = None
         self.grid = None
         self.grid_canvas_size = GRID_SIZE
-        self._start_time = None
         self._number_of_rows = None
         self._number_of_columns = None
         self._data_format = None
@@ -166,7 +146,11 @@ class App:
         self.ble_frame.columnconfigure((0, 1, 2), weight=1)
 
         self.ble_label = create_widget(self.ble_frame, tk.Label, text="BLE Devices:")
-        self.ble_label.grid(row=0, column=0, columnspan=3, sticky="w")
+        self.ble_label.grid(row=0, column=0, columnspan=2, sticky="w")
+
+        self.matrix_only_checkbutton = create_widget(self.ble_frame, tk.Checkbutton, text="Matrix devices only",
+                                                     variable=self._matrix_devices_only)
+        self.matrix_only_checkbutton.grid(row=0, column=2, sticky="e")
 
         self.devices_listbox = create_widget(self.ble_frame, tk.Listbox)
         self.devices_listbox.grid(row=1, column=0, columnspan=3, stick="nsew")
@@ -188,6 +172,7 @@ class App:
         self.connect_disconnect_buttons_state(False)
 
     def run(self):
+        self.root.after_idle(preload_modules, DEFERRED_MODULES)
         self.root.mainloop()
 
     def _exit(self):
@@ -206,15 +191,18 @@ class App:
     def search_button_callback(self):
         self.search_button.config(state=tk.DISABLED)
         self.connect_button.config(state=tk.DISABLED)
-        self._devices[0].clear()
-        self._devices[1].clear()
-        self._devices[2].clear()
+        self._devices.clear()
+        self._device_addresses.clear()
         self.devices_listbox.delete(0, tk.END)
-        threading.Thread(target=lambda: asyncio.run(self._ble_scan_devices()), daemon=True).start()
+        # Let the adapter drop everything but matrices before the advertisements reach Python
+        service_uuids = [MATRIX_SERVICE_UUID] if self._matrix_devices_only.get() else None
+        threading.Thread(target=lambda: asyncio.run(self._ble_scan_devices(service_uuids)), daemon=True).start()
 
     # Async function used within thread to start bleak scanner
-    async def _ble_scan_devices(self):
-        async with BleakScanner(detection_callback=self._device_detection_callback, return_adv=True):
+    async def _ble_scan_devices(self, service_uuids=None):
+        from bleak import BleakScanner
+        async with BleakScanner(detection_callback=self._device_detection_callback, service_uuids=service_uuids,
+                                return_adv=True):
             await asyncio.sleep(SCAN_TIME)
             # noinspection PyTypeChecker
             self.root.after(0, lambda: self.search_button.config(state=tk.NORMAL))
@@ -222,82 +210,113 @@ class App:
             self.root.after(0, lambda: self.connect_button.config(state=tk.NORMAL))
 
     def _device_detection_callback(self, device, advertising_data):
+        has_service = MATRIX_SERVICE_UUID in advertising_data.service_uuids
+        record = self._devices.get(device.address)
+        # add details of detected device to the registry
+        if record is None:
+            record = ScannedDevice(device.address, advertising_data.local_name, has_service,
+                                   len(self._device_addresses))
+            self._devices[device.address] = record
+            self._device_addresses.append(device.address)
+            device_string = " {:<25} : {}".format(str(device.name), device.address)
+            self.root.after(0, self.devices_listbox.insert, tk.END, device_string)
         # Updating items after scan response
-        if device.address in self._devices[0]:
-            index = self._devices[0].index(device.address)
-            if self._devices[1][index] is None:
+        else:
+            if record.name is None and advertising_data.local_name is not None:
                 # A repeated address may be a scan response, which can include extra data such as the device name
                 # Remove the previous item in the selection box, and place in a new selection with the device name
-                self._devices[1][index] = advertising_data.local_name
+                record.name = advertising_data.local_name
                 device_string = " {:<25} : {}".format(str(device.name), device.address)
-                self.root.after(0, self.devices_listbox.delete, index)
-                self.root.after(0, self.devices_listbox.insert, index, device_string)
-                # In the case where the service UUID is in the scan response rather than the initial advertising data
-                if not self._devices[2][index] and MATRIX_SERVICE_UUID in advertising_data.service_uuids:
-                    self._devices[2][index] = True
-        # add details of detected device to self.devices list of lists
-        elif device.address not in self._devices[0]:
-            if MATRIX_SERVICE_UUID in advertising_data.service_uuids:
-                allow_connection = True
-            else:
-                allow_connection = False
-            self._devices[0].append(device.address)
-            self._devices[1].append(advertising_data.local_name)
-            self._devices[2].append(allow_connection)
-            device_string = " {:<25} : {}".format(str(device.name), device.address)
-            self.root.after(0, self.devices_listbox.insert, tk.END, device_string)
+                self.root.after(0, self.devices_listbox.delete, record.listbox_index)
+                self.root.after(0, self.devices_listbox.insert, record.listbox_index, device_string)
+            # In the case where the service UUID is in the scan response rather than the initial advertising data
+            if has_service:
+                record.has_service = True
+        record.rssi_history.append(advertising_data.rssi)
 
     # Function to connect to device
     def connect_button_callback(self):
         if self.devices_listbox.size() > 0:
-            if self._devices[2][self.devices_listbox.curselection()[0]]:
+            selected_address = self._device_addresses[self.devices_listbox.curselection()[0]]
+            if self._devices[selected_address].has_service:
                 self.connect_disconnect_buttons_state(True)
-                selected_address = self._devices[0][self.devices_listbox.curselection()[0]]
                 threading.Thread(target=lambda: asyncio.run(self._ble_connect_stream(selected_address)),
                                  daemon=True).start()
             else:
                 print("Selected device does not contain the Matrix Service")
 
     async def _ble_connect_stream(self, device_address):
-        try:
-            async with (BleakClient(device_address) as client):
-                self._stay_connected = client.is_connected
+        # Reconnects with exponential backoff if the link drops, keeping the matrix and the dimensions already read
+        self._stay_connected = True
+        self._number_of_rows = None
+        self._reconnect_attempt = 0
+        self._disconnected_time = None
+        while self._stay_connected:
+            try:
+                await self._stream(device_address)
+            except Exception as e:
+                print("Connection Failed. Error: {}".format(e))
+            if not self._stay_connected or self._number_of_rows is None:
+                break
+            if self._disconnected_time is None:
+                self._disconnected_time = time.perf_counter()
+            self._reconnect_attempt += 1
+            if self._reconnect_attempt > RECONNECT_ATTEMPTS:
+                print("Giving up on {} after {} reconnect attempts".format(device_address, RECONNECT_ATTEMPTS))
+                break
+            delay = min(RECONNECT_INITIAL_DELAY * 2 ** (self._reconnect_attempt - 1), RECONNECT_MAXIMUM_DELAY)
+            print("Connection lost, reconnecting in {:.1f} s (attempt {} of {})".format(
+                delay, self._reconnect_attempt, RECONNECT_ATTEMPTS))
+            deadline = time.perf_counter() + delay
+            while self._stay_connected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+
+        self._stay_connected = False
+        self.root.after(0, self.connect_disconnect_buttons_state, False)
+        if self._number_of_rows is not None:
+            # noinspection PyTypeChecker
+            self.root.after(0, self.destroy_matrix)
 
+    async def _stream(self, device_address):
+        from bleak import BleakClient
+        async with (BleakClient(device_address, disconnected_callback=self._disconnected_callback) as client):
+            if self._number_of_rows is None:
                 matrix_dimensions = await client.read_gatt_char(MATRIX_DIMENSIONS_CHARACTERISTIC_UUID)
                 self._number_of_rows, self._number_of_columns = decode_matrix_dimensions(matrix_dimensions)
                 self.root.after(0, self.create_matrix, self._number_of_rows, self._number_of_columns)
-                self._start_time = time.time()
-                await client.start_notify(MATRIX_DATA_CHARACTERISTIC_UUID, self._notification_handler_callback)
-
-                while self._stay_connected:
-                    await asyncio.sleep(0.01)
-                    if time.time() - self._start_time >= 0.1:
-                        self._update_matrix = True
-
-                if client.is_connected:
-                    await client.stop_notify(MATRIX_DATA_CHARACTERISTIC_UUID)
-                    await client.disconnect()
-                    self.root.after(0, self.connect_disconnect_buttons_state, self._stay_connected)
-                    # noinspection PyTypeChecker
-                    self.root.after(0, self.destroy_matrix)
-        except Exception as e:
-            print("Connection Failed. Error: {}".format(e))
-            self.root.after(0, self.connect_disconnect_buttons_state, False)
-            # noinspection PyTypeChecker
-            self.root.after(0, self.destroy_matrix)
+            else:
+                # Parts of the frame in flight when the link dropped will never be completed
+                self._data_assembler.reset()
+            await client.start_notify(MATRIX_DATA_CHARACTERISTIC_UUID, self._notification_handler_callback)
+
+            while self._stay_connected and client.is_connected:
+                await asyncio.sleep(0.1)
+
+            if client.is_connected:
+                await client.stop_notify(MATRIX_DATA_CHARACTERISTIC_UUID)
+                await client.disconnect()
+
+    # noinspection PyUnusedLocal
+    def _disconnected_callback(self, client):
+        if self._stay_connected and self._disconnected_time is None:
+            self._disconnected_time = time.perf_counter()
 
     # noinspection PyUnusedLocal
     def _notification_handler_callback(self, sender, data):
         assembled_data = self._data_assembler.construct_data(data)
         if assembled_data is not None:
             matrix = decode_matrix_data(assembled_data, self._number_of_rows, self._number_of_columns)
-            if self._update_matrix:
-                self._update_matrix = False
-                self._start_time = time.time()
-                # matrix_data = remap_matrix(matrix_data, 2048)
-                matrix_colours = self.matrix_canvas.match_colours(matrix)
-                self.root.after(0, self.matrix_canvas.update_matrix, matrix_colours)
-                # self.grid.plot_centre_of_pressure(matrix_data)
+            if self._disconnected_time is not None:
+                recovery_time = time.perf_counter() - self._disconnected_time
+                self._disconnected_time = None
+                self._reconnect_attempt = 0
+                self._recovery_times.append(recovery_time)
+                print("Reconnected, first frame after {:.2f} s".format(recovery_time))
+            # Colours are matched by the render tick, only for the frames that get drawn
+            with self._latest_matrix_lock:
+                if self._latest_matrix is not None:
+                    self._superseded_frames += 1
+                self._latest_matrix = matrix
 
             self._assembled_data_count += 1
             data_rate_time_difference = time.time() - self._data_rate_start_time
@@ -317,10 +336,44 @@ class App:
         self.search_button.config(state=tk.DISABLED if state else tk.NORMAL)
         self.disconnect_button.config(state=tk.NORMAL if state else tk.DISABLED)
 
+    def _render_tick(self):
+        # Runs on the Tk thread and reschedules itself once the draw is done, so draws never queue up behind each
+        # other however slow they are, and frames that arrive meanwhile only replace the one waiting
+        with self._latest_matrix_lock:
+            matrix = self._latest_matrix
+            self._latest_matrix = None
+        if matrix is not None:
+            start = time.perf_counter()
+            # matrix_data = remap_matrix(matrix_data, 2048)
+            matrix_colours = self.matrix_canvas.match_colours(matrix)
+            self.matrix_canvas.update_matrix(matrix_colours)
+            # self.grid.plot_centre_of_pressure(matrix_data)
+            self.matrix_canvas.update_idletasks()
+            self._render_times.append(time.perf_counter() - start)
+        self._report_rendering()
+        self._render_job = self.root.after(RENDER_INTERVAL_MS, self._render_tick)
+
+    def _report_rendering(self):
+        now = time.perf_counter()
+        period = now - self._render_report_time
+        if period < RENDER_REPORT_INTERVAL:
+            return
+        render_times = sorted(self._render_times)
+        with self._latest_matrix_lock:
+            superseded_frames = self._superseded_frames
+            pending = int(self._latest_matrix is not None)
+            self._superseded_frames = 0
+        if render_times:
+            print("Rendered {:.1f}/s | render p50 {:.1f} ms max {:.1f} ms | superseded {} | pending {}".format(
+                len(render_times) / period, 1000 * render_times[len(render_times) // 2], 1000 * render_times[-1],
+                superseded_frames, pending))
+        self._render_times = []
+        self._render_report_time = now
+
     def create_matrix(self, rows, columns):
         # Canvas matrix grid
         self.matrix_canvas = create_widget(self.root, Matrix, rows=rows, columns=columns, size=self.grid_canvas_size,
-                                           borderwidth=0)
+                                           upsampling=MATRIX_UPSAMPLING, borderwidth=0)
         self.matrix_canvas.draw()
 
         self.heat_canvas = create_widget(self.root, tk.Canvas,
@@ -328,8 +381,15 @@ class App:
         self.create_heatmap_scale(self.grid_canvas_size, 25, self.matrix_canvas.get_colour_map())
         self.heat_canvas.grid(row=1, column=0)
         self.matrix_canvas.grid(row=2, column=0)
+        self._render_report_time = time.perf_counter()
+        self._render_job = self.root.after(RENDER_INTERVAL_MS, self._render_tick)
 
     def destroy_matrix(self):
+        if self._render_job is not None:
+            self.root.after_cancel(self._render_job)
+            self._render_job = None
+        with self._latest_matrix_lock:
+            self._latest_matrix = None
         if self.matrix_canvas.winfo_exists():
             self.matrix_canvas.destroy()
         if self.heat_canvas.winfo_exists():
@@ -337,5 +397,15 @@ class App:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a BLE pressure matrix to a Tkinter window")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="sample every thread from start up for this long and save the profile to ./profiles")
+    arguments = parser.parse_args()
+    profiler = None
+    if arguments.profile:
+        profiler = SamplingProfiler(profile_directory(), arguments.profile)
+        profiler.start()
     program = App("BLE Matrix Streamer")
     program.run()
+    if profiler is not None:
+        profiler.stop()
@@ -0,0 +1,137 @@
+import functools
+import numpy as np
+
+
+UPSAMPLING_METHODS = ("bilinear", "bicubic")
+BICUBIC_COEFFICIENT = -0.5  # Keys' cubic convolution, matches the usual image library bicubic
+
+
+def _cubic_kernel(distance):
+    a = BICUBIC_COEFFICIENT
+    distance = np.abs(distance)
+    near = ((a + 2) * distance - (a + 3)) * distance * distance + 1
+    far = ((a * distance - 5 * a) * distance + 8 * a) * distance - 4 * a
+    return np.where(distance <= 1, near, np.where(distance < 2, far, 0))
+
+
+def interpolation_weights(input_size, output_size, method):
+    # Each row holds the weights of the input cells that make up one output cell. Cell centres are aligned,
+    # so the border cells of the output line up with the border cells of the input.
+    positions = (np.arange(output_size) + 0.5) * input_size / output_size - 0.5
+    output_indices = np.arange(output_size)
+    weights = np.zeros((output_size, input_size), dtype=np.float32)
+    if method == "bilinear":
+        positions = np.clip(positions, 0, input_size - 1)
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, input_size - 1)
+        fraction = positions - lower
+        np.add.at(weights, (output_indices, lower), 1 - fraction)
+        np.add.at(weights, (output_indices, upper), fraction)
+    elif method == "bicubic":
+        lower = np.floor(positions).astype(int)
+        fraction = positions - lower
+        for offset in range(-1, 3):
+            # Taps falling outside the matrix reuse the border cell
+            taps = np.clip(lower + offset, 0, input_size - 1)
+            np.add.at(weights, (output_indices, taps), _cubic_kernel(fraction - offset))
+    else:
+        raise ValueError("Unknown upsampling method: {}".format(method))
+    return weights
+
+
+@functools.lru_cache(maxsize=32)
+def get_interpolation_weights(input_size, output_size, method, transposed=False):
+    # Shared by every Upsampler of the same size, read only so none can change them for the others
+    weights = interpolation_weights(input_size, output_size, method)
+    if transposed:
+        weights = np.ascontiguousarray(weights.T)
+    weights.flags.writeable = False
+    return weights
+
+
+class Upsampler:
+    """Upsamples frames of a fixed size with separable interpolation, costing two small matrix products per frame.
+
+    The returned array is reused by the next call to upsample(), copy it if it needs to be kept.
+    """
+    def __init__(self, rows, columns, output_rows, output_columns, method="bilinear", value_range=(0, 255)):
+        self.method = method
+        self.output_shape = (output_rows, output_columns)
+        self._row_weights = get_interpolation_weights(rows, output_rows, method)
+        self._column_weights = get_interpolation_weights(columns, output_columns, method, transposed=True)
+        # Bicubic weights go negative, so sharp edges overshoot the range of the sensor
+        self._value_range = value_range if method == "bicubic" else None
+
+        self._frame = np.empty((rows, columns), dtype=np.float32)
+        self._intermediate = np.empty((output_rows, columns), dtype=np.float32)
+        self._output = np.empty((output_rows, output_columns), dtype=np.float32)
+
+    def upsample(self, frame):
+        np.copyto(self._frame, frame, casting="unsafe")
+        np.matmul(self._row_weights, self._frame, out=self._intermediate)
+        np.matmul(self._intermediate, self._column_weights, out=self._output)
+        if self._value_range is not None:
+            np.clip(self._output, self._value_range[0], self._value_range[1], out=self._output)
+        return self._output
+
+
+def get_upsampler(rows, columns, output_rows, output_columns, method="bilinear"):
+    # A new instance every time, its buffers belong to the one consumer, only the weights are shared
+    return Upsampler(rows, columns, output_rows, output_columns, method)
+
+
+def fit_output_size(rows, columns, resolution):
+    # Scale the matrix so its longest side is resolution cells long, keeping the aspect ratio
+    if columns > rows:
+        return max(1, round(resolution * rows / columns)), resolution
+    return resolution, max(1, round(resolution * columns / rows))
+
+
+POOLING_METHODS = ("max", "mean")
+
+
+class BlockPooler:
+    """Shrinks frames whose cells would be smaller than a pixel by pooling square blocks of cells into one.
+
+    The frame is padded with zeros to a whole number of blocks, then reduced first over the rows and then over the
+    columns of each block, one strided slice at a time. That is 2 * factor elementwise passes over preallocated
+    buffers, many times faster than a numpy reduction over the block axes of a reshaped view. Max pooling is the
+    default as it keeps peak pressures visible, where averaging would wash a small, high contact out. The
+    returned array is reused by the next call to pool().
+    """
+    def __init__(self, rows, columns, factor, method="max"):
+        if method not in POOLING_METHODS:
+            raise ValueError("Unknown pooling method: {}".format(method))
+        self.factor = factor
+        self.output_shape = (-(-rows // factor), -(-columns // factor))
+        output_rows, output_columns = self.output_shape
+        self._combine = np.maximum if method == "max" else np.add
+        self._scale = None if method == "max" else 1 / factor ** 2
+        self._padded = np.zeros((output_rows * factor, output_columns * factor), dtype=np.float32)
+        self._frame = self._padded[:rows, :columns]
+        self._row_pooled = np.empty((output_rows, output_columns * factor), dtype=np.float32)
+        self._output = np.empty(self.output_shape, dtype=np.float32)
+
+    def pool(self, frame):
+        factor = self.factor
+        np.copyto(self._frame, frame, casting="unsafe")
+        np.copyto(self._row_pooled, self._padded[0::factor])
+        for offset in range(1, factor):
+            self._combine(self._row_pooled, self._padded[offset::factor], out=self._row_pooled)
+        np.copyto(self._output, self._row_pooled[:, 0::factor])
+        for offset in range(1, factor):
+            self._combine(self._output, self._row_pooled[:, offset::factor], out=self._output)
+        if self._scale is not None:
+            self._output *= self._scale
+        return self._output
+
+
+def pooling_factor(rows, columns, resolution):
+    # Smallest block size that fits the longest side of the matrix into resolution cells
+    return -(-max(rows, columns) // resolution)
+
+
+def get_block_pooler(rows, columns, resolution, method="max"):
+    # A new instance every time, so its buffers belong to the one consumer. None when the matrix already fits
+    factor = pooling_factor(rows, columns, resolution)
+    return BlockPooler(rows, columns, factor, method) if factor > 1 else None
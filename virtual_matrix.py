@@ -0,0 +1,279 @@
+import json
+import time
+import threading
+import numpy as np
+from queue import Queue, Empty
+
+from ble_matrix import BLEConnection, MatrixFrame, CONNECTING, STREAMING, RECONNECTING, DISCONNECTED
+from frame_timing import FrameTimingAnalyzer
+from session_recorder import SessionRecorder
+from simulated_matrix import SimulatedMatrixClient, SIMULATED_ADDRESS
+from session_statistics import SessionStatistics
+
+
+FRAME_HISTORY = 8  # Most recent frames kept per mat to match by timestamp
+ROTATIONS = (0, 90, 180, 270)  # degrees anticlockwise
+# Least healthy first, the walkway reports the state of its least healthy mat
+STATE_SEVERITY = (DISCONNECTED, RECONNECTING, CONNECTING, STREAMING)
+
+
+class MatPlacement:
+    def __init__(self, address, row=0, column=0, rotation=0):
+        if rotation not in ROTATIONS:
+            raise ValueError("Rotation must be one of {}, not {}".format(ROTATIONS, rotation))
+        self.address = address
+        self.row = row  # Top left cell of the rotated mat in the walkway
+        self.column = column
+        self.rotation = rotation
+
+
+def load_walkway_layout(path):
+    # {"mats": [{"address": ..., "row": 0, "column": 0, "rotation": 0}, ...]}, positions in cells
+    with open(path) as layout_file:
+        layout = json.load(layout_file)
+    return [MatPlacement(mat["address"], mat.get("row", 0), mat.get("column", 0), mat.get("rotation", 0))
+            for mat in layout["mats"]]
+
+
+def walkway_client_class(placements):
+    # A layout of simulated mats only, to try a walkway out, streams from SimulatedMatrixClient instead of bleak
+    if all(placement.address == SIMULATED_ADDRESS for placement in placements):
+        return SimulatedMatrixClient
+    return None
+
+
+class VirtualMatrix:
+    """Places the frames of several mats into one walkway sized array.
+
+    Every mat keeps its last FRAME_HISTORY frames in a preallocated ring, and compose() copies the frame of each mat
+    nearest to the given timestamp through a precomputed rotated view into a precomputed window of the output, so
+    composing costs O(total cells) and allocates nothing. Mats that have not sent a frame yet, and cells no mat
+    covers, stay at zero. Where mats overlap the later placement wins.
+    """
+    def __init__(self, placements, shapes, history=FRAME_HISTORY, buffers=1, dtype=np.int64):
+        # shapes are the (rows, columns) of each mat as it streams them, before rotation
+        rotated_shapes = [(rows, columns) if placement.rotation % 180 == 0 else (columns, rows)
+                          for placement, (rows, columns) in zip(placements, shapes)]
+        self.rows = max(placement.row + rows for placement, (rows, _) in zip(placements, rotated_shapes))
+        self.columns = max(placement.column + columns for placement, (_, columns) in zip(placements, rotated_shapes))
+        self._buffers = list(np.zeros((buffers, self.rows, self.columns), dtype=dtype))
+        self._buffer_index = 0
+        # Per buffer, the window of each mat
+        self._windows = [[buffer[placement.row:placement.row + rows, placement.column:placement.column + columns]
+                          for placement, (rows, columns) in zip(placements, rotated_shapes)]
+                         for buffer in self._buffers]
+
+        self._frames = [np.zeros((history, rows, columns), dtype=dtype) for rows, columns in shapes]
+        # Per mat and history slot, the frame turned the way it lies in the walkway
+        self._rotated_frames = [[np.rot90(frame, placement.rotation // 90) for frame in frames]
+                                for placement, frames in zip(placements, self._frames)]
+        self._timestamps = [[None] * history for _ in placements]
+        self._next_slot = [0] * len(placements)
+        self._history = history
+        # Timestamps of the frames used for each mat by the last compose(), None for mats without frames
+        self.matched_timestamps = [None] * len(placements)
+        self.last_skew_ns = 0  # Spread of the matched timestamps
+        self._lock = threading.Lock()
+
+    def add_frame(self, index, frame, timestamp_ns):
+        with self._lock:
+            slot = self._next_slot[index]
+            np.copyto(self._frames[index][slot], frame, casting="unsafe")
+            self._timestamps[index][slot] = timestamp_ns
+            self._next_slot[index] = (slot + 1) % self._history
+
+    def compose(self, timestamp_ns):
+        # Returns the next output buffer, overwritten again after the other buffers have been used
+        with self._lock:
+            buffer = self._buffers[self._buffer_index]
+            windows = self._windows[self._buffer_index]
+            self._buffer_index = (self._buffer_index + 1) % len(self._buffers)
+            earliest = latest = None
+            for index, timestamps in enumerate(self._timestamps):
+                nearest_slot = None
+                nearest_distance = 0
+                for slot, frame_timestamp_ns in enumerate(timestamps):
+                    if frame_timestamp_ns is None:
+                        continue
+                    distance = abs(frame_timestamp_ns - timestamp_ns)
+                    if nearest_slot is None or distance < nearest_distance:
+                        nearest_slot = slot
+                        nearest_distance = distance
+                if nearest_slot is None:
+                    self.matched_timestamps[index] = None
+                    continue
+                np.copyto(windows[index], self._rotated_frames[index][nearest_slot])
+                matched_timestamp_ns = timestamps[nearest_slot]
+                self.matched_timestamps[index] = matched_timestamp_ns
+                earliest = matched_timestamp_ns if earliest is None else min(earliest, matched_timestamp_ns)
+                latest = matched_timestamp_ns if latest is None else max(latest, matched_timestamp_ns)
+            self.last_skew_ns = 0 if earliest is None else latest - earliest
+        return buffer
+
+
+class VirtualMatrixConnection:
+    """Streams several mats laid out as a walkway and hands out their frames as those of a single matrix.
+
+    Has the same queues and getters as BLEConnection, so the GUI, the headless streamer, CoP and the statistics
+    take the walkway for one large matrix. Every mat streams on a BLEConnection of its own, and a walkway frame is
+    composed whenever the first mat in the layout completes a frame, with each of the other mats contributing its
+    frame nearest in time to it.
+
+    Walkway frames are composed into one preallocated buffer and every consumer is handed a copy of it, so frames
+    can be kept for as long as needed, e.g. by the CoP trail or the latency tracker, as those of a BLEConnection can.
+    """
+    def __init__(self, placements, temporal_filter=None, client_class=None, partial_frames=False):
+        if not placements:
+            raise ValueError("A walkway needs at least one mat")
+        self._placements = placements
+        self._connections = [BLEConnection(placement.address, temporal_filter, client_class, partial_frames)
+                             for placement in placements]
+        self.matrix_dimensions_queue = Queue()
+        self.matrix_data_queue = Queue()
+        self.mutex = threading.Lock()
+
+        self._virtual_matrix = None
+        self._recorder = None
+        self._recorder_lock = threading.Lock()
+        self.session_statistics = None
+        self.frame_timing = FrameTimingAnalyzer()
+
+        self._data_rate_start_time = 0
+        self._composed_frame_count = 0
+        self._data_rate = 0
+
+        self._stop_event = threading.Event()
+        self._forwarding_threads = [threading.Thread(target=self._forward_frames, args=(index,), daemon=True)
+                                    for index in range(len(placements))]
+        self._setup_thread = threading.Thread(target=self._set_up, daemon=True)
+
+    def _set_up(self):
+        shapes = [self._wait_for_dimensions(connection) for connection in self._connections]
+        if self._stop_event.is_set():
+            return
+        if any(rows is None for rows, _ in shapes):
+            print("Not every mat of the walkway could be connected")
+            self.matrix_dimensions_queue.put((None, None))
+            return
+        self._virtual_matrix = VirtualMatrix(self._placements, shapes)
+        rows, columns = self._virtual_matrix.rows, self._virtual_matrix.columns
+        self.session_statistics = SessionStatistics(rows, columns)
+        self._data_rate_start_time = time.perf_counter()
+        for thread in self._forwarding_threads:
+            thread.start()
+        self.matrix_dimensions_queue.put((rows, columns))
+
+    def _wait_for_dimensions(self, connection):
+        # A connection stopped before it read its dimensions never puts any
+        while not self._stop_event.is_set():
+            try:
+                return connection.matrix_dimensions_queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return None, None
+
+    def _forward_frames(self, index):
+        connection = self._connections[index]
+        while not self._stop_event.is_set():
+            try:
+                frame = connection.matrix_data_queue.get(timeout=0.1)
+            except Empty:
+                continue
+            self._virtual_matrix.add_frame(index, frame.data, frame.completed_ns)
+            if index == 0:
+                self._publish(frame)
+
+    def _publish(self, reference_frame):
+        # The composed buffer is overwritten by the next frame
+        composite = self._virtual_matrix.compose(reference_frame.completed_ns).copy()
+        with self._recorder_lock:
+            if self._recorder is not None:
+                self._recorder.add_frame(composite, reference_frame.completed_ns)
+        self.session_statistics.update(composite, reference_frame.completed_ns)
+        frame = MatrixFrame(composite, reference_frame.first_part_ns, reference_frame.completed_ns,
+                            reference_frame.sent_ns)
+        with self.mutex:
+            frame.queued_ns = time.perf_counter_ns()
+            self.matrix_data_queue.put(frame)
+        self.frame_timing.add_frame(frame.first_part_ns, frame.completed_ns)
+        self._calculate_data_rate()
+
+    def _calculate_data_rate(self):
+        self._composed_frame_count += 1
+        data_rate_time_difference = time.perf_counter() - self._data_rate_start_time
+        if data_rate_time_difference > 1:
+            with self.mutex:
+                self._data_rate = self._composed_frame_count / data_rate_time_difference
+            self._data_rate_start_time = time.perf_counter()
+            self._composed_frame_count = 0
+
+    def send_tare_command(self):
+        for connection in self._connections:
+            connection.send_tare_command()
+
+    def set_temporal_filter(self, kind):
+        for connection in self._connections:
+            connection.set_temporal_filter(kind)
+
+    def set_partial_frames(self, enabled):
+        for connection in self._connections:
+            connection.set_partial_frames(enabled)
+
+    def start_recording(self, directory):
+        # Records the walkway frames, so a recording plays back as one matrix
+        with self._recorder_lock:
+            if self._virtual_matrix is None or self._recorder is not None:
+                return False
+            self._recorder = SessionRecorder(directory, self._virtual_matrix.rows, self._virtual_matrix.columns)
+        return True
+
+    def stop_recording(self):
+        # Once detached under the lock no frame is being added, closing waits for the last chunk off this thread
+        with self._recorder_lock:
+            recorder = self._recorder
+            self._recorder = None
+        if recorder is not None:
+            threading.Thread(target=recorder.close, daemon=False).start()
+            print("Recording saved to {}".format(recorder.directory))
+
+    def get_frame_counts(self):
+        counts = {}
+        for connection in self._connections:
+            for name, count in connection.get_frame_counts().items():
+                counts[name] = counts.get(name, 0) + count
+        return counts
+
+    def get_skew(self):
+        # ms between the earliest and latest mat frame in the last walkway frame
+        virtual_matrix = self._virtual_matrix
+        return 0.0 if virtual_matrix is None else virtual_matrix.last_skew_ns / 1e6
+
+    def get_data_rate(self):
+        with self.mutex:
+            return self._data_rate
+
+    def get_connection_status(self):
+        # The walkway is only whole while every mat is
+        return all(connection.get_connection_status() for connection in self._connections)
+
+    def get_state(self):
+        return min((connection.get_state() for connection in self._connections),
+                   key=lambda state: STATE_SEVERITY.index(state[0]))
+
+    def get_recovery_times(self):
+        return [recovery_time for connection in self._connections for recovery_time in connection.get_recovery_times()]
+
+    def start(self):
+        for connection in self._connections:
+            connection.start()
+        self._setup_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        for connection in self._connections:
+            connection.stop()
+        self._setup_thread.join()
+        for thread in self._forwarding_threads:
+            if thread.is_alive():
+                thread.join()
+        self.stop_recording()